@@ -21,33 +21,36 @@ Handles:
 - PersonaPlex WebSocket (binary frames): 0x00 handshake, 0x01 Opus audio, 0x02 text
 - Audio transcoding: Exotel 8kHz PCM <-> PersonaPlex 24kHz Opus
 """
-# PHASE 1: Force unbuffered output for live debugging
-import sys
-sys.stdout.reconfigure(line_buffering=True)
-sys.stderr.reconfigure(line_buffering=True)
-
 import asyncio
-import base64
+import bisect
+import heapq
 import json
 import logging
+import multiprocessing
 import os
+import queue
+import signal as os_signal
 import ssl
 import subprocess
 import sys
 import time
+import urllib.error
+import urllib.request
 import uuid
 from collections import deque
 from pathlib import Path
-from urllib.parse import quote
+from urllib.parse import quote, urlsplit, urlunsplit
 
 import numpy as np
 try:
     import sphn
 except ImportError:
-    sphn = None  # Optional, not used in current implementation
+    sphn = None  # Optional, needed by the in-process Opus codec
 import websockets
 from scipy import signal
 
+from exotel_media import decode_payload, encode_media, parse_message, silence_media
+
 # ========== LOGGING SETUP ==========
 LOG_LEVEL = os.getenv("BRIDGE_LOG_LEVEL", "INFO").upper()
 logging.basicConfig(
@@ -57,6 +60,7 @@ logging.basicConfig(
     stream=sys.stdout
 )
 logger = logging.getLogger('exotel_bridge')
+LOG_DEBUG = logger.isEnabledFor(logging.DEBUG)  # Guards f-string debug logs on the hot path
 
 # ========== CONFIGURATION ==========
 BRIDGE_HOST = os.getenv("BRIDGE_HOST", "0.0.0.0")
@@ -65,21 +69,61 @@ ENGINE_URL = os.getenv("ENGINE_URL", "wss://127.0.0.1:8998/api/chat")
 VOICE_PROMPT = os.getenv("VOICE_PROMPT", "NATF0.pt")
 TEXT_PROMPT = os.getenv("TEXT_PROMPT", "You enjoy having a good conversation.")
 
+# Engine backends (default: ENGINE_URL alone): comma-separated engine URLs, each call goes to the least loaded one
+ENGINE_URLS = [url.strip() for url in os.getenv("ENGINE_URLS", ENGINE_URL).split(",") if url.strip()]
+BRIDGE_ENGINE_STATUS_SECS = float(os.getenv("BRIDGE_ENGINE_STATUS_SECS", "2.0"))  # /api/status poll period
+BRIDGE_ENGINE_CAPACITY = int(os.getenv("BRIDGE_ENGINE_CAPACITY", "0"))  # Sessions per engine without /api/status, 0 = unknown
+BRIDGE_ENGINE_QUEUE_SECS = float(os.getenv("BRIDGE_ENGINE_QUEUE_SECS", "0"))  # Wait for a free engine, 0 = fail fast
+
 # Audio settings
 MODEL_SR = int(os.getenv("MODEL_SR", "24000"))  # PersonaPlex model sample rate
 EXOTEL_SR = int(os.getenv("EXOTEL_SR", "8000"))  # Exotel PCM sample rate
 AUDIO_CHUNK_MS = int(os.getenv("AUDIO_CHUNK_MS", "20"))  # 20ms chunks for Opus
+# Opus codec: in-process sphn by default, BRIDGE_FFMPEG_CODEC=1 falls back to ffmpeg subprocesses
+BRIDGE_FFMPEG_CODEC = os.getenv("BRIDGE_FFMPEG_CODEC", "0") == "1"
 
 # Exotel lifecycle control (default OFF - safe changes only)
 EXOTEL_DRAIN_AFTER_STOP = os.getenv("EXOTEL_DRAIN_AFTER_STOP", "0") == "1"
 EXOTEL_DRAIN_SECS = float(os.getenv("EXOTEL_DRAIN_SECS", "8.0"))
 EXOTEL_SEND_SILENCE_WHEN_IDLE = os.getenv("EXOTEL_SEND_SILENCE_WHEN_IDLE", "0") == "1"
 
+# Outbound playout: 20ms frames sent to Exotel on a monotonic clock, from an adaptive jitter buffer
+BRIDGE_PLAYOUT_TARGET_MS = int(os.getenv("BRIDGE_PLAYOUT_TARGET_MS", "120"))  # Initial buffer depth before playing
+BRIDGE_PLAYOUT_MIN_MS = int(os.getenv("BRIDGE_PLAYOUT_MIN_MS", "80"))  # Lowest target after quiet periods
+BRIDGE_PLAYOUT_MAX_MS = int(os.getenv("BRIDGE_PLAYOUT_MAX_MS", "400"))  # Depth trimmed back to target above this
+
+# Inbound jitter buffer: Exotel frames reordered on their timestamp/sequence and fed to the engine on a 20ms clock
+BRIDGE_INBOUND_JITTER_MS = int(os.getenv("BRIDGE_INBOUND_JITTER_MS", "60"))  # Wait for late/reordered frames
+BRIDGE_INBOUND_MAX_MS = int(os.getenv("BRIDGE_INBOUND_MAX_MS", "500"))  # Depth above which old audio is dropped
+
+# Hot-path tracing (default OFF): per-frame [LIVE] events, kept in a per-session ring buffer
+BRIDGE_TRACE = os.getenv("BRIDGE_TRACE", "0") == "1"
+BRIDGE_TRACE_BUFFER = int(os.getenv("BRIDGE_TRACE_BUFFER", "8192"))  # Events kept between flushes
+BRIDGE_TRACE_SAMPLE = os.getenv("BRIDGE_TRACE_SAMPLE", "")  # e.g. "EXOTEL_IN=10,ENGINE_RECV=1": keep 1 in N
+
+# Multi-process mode (default 1 = single process): a supervisor forks N workers sharing BRIDGE_PORT (SO_REUSEPORT)
+BRIDGE_WORKERS = int(os.getenv("BRIDGE_WORKERS", "1"))
+BRIDGE_WORKER_REPORT_SECS = float(os.getenv("BRIDGE_WORKER_REPORT_SECS", "2.0"))  # Worker stats report period
+BRIDGE_WORKER_HEALTH_TIMEOUT = float(os.getenv("BRIDGE_WORKER_HEALTH_TIMEOUT", "30.0"))  # Restart a silent worker
+BRIDGE_WORKER_DRAIN_SECS = float(os.getenv("BRIDGE_WORKER_DRAIN_SECS", "600.0"))  # Calls allowed to finish on restart
+BRIDGE_WORKER_START_TIMEOUT = float(os.getenv("BRIDGE_WORKER_START_TIMEOUT", "10.0"))  # New worker listening, on restart
+BRIDGE_METRICS_SECS = float(os.getenv("BRIDGE_METRICS_SECS", "10.0"))  # Aggregated metrics log period
+BRIDGE_METRICS_FILE = os.getenv("BRIDGE_METRICS_FILE", "")  # Optional JSON snapshot of the aggregated metrics
+
+# Warm engine pool (default 0 = off): engine sessions connected and prefilled ahead of the calls, per process.
+# Each pooled session holds an engine slot.
+BRIDGE_ENGINE_POOL_SIZE = int(os.getenv("BRIDGE_ENGINE_POOL_SIZE", "0"))
+BRIDGE_ENGINE_POOL_TTL = float(os.getenv("BRIDGE_ENGINE_POOL_TTL", "120.0"))  # Pooled sessions older than this are replaced
+
+
+def engine_ws_url(engine_url: str) -> str:
+    """PersonaPlex WebSocket URL of an engine, with the configured prompts."""
+    separator = "&" if "?" in engine_url else "?"
+    return f"{engine_url}{separator}voice_prompt={quote(VOICE_PROMPT)}&text_prompt={quote(TEXT_PROMPT)}"
+
+
 # Build PersonaPlex WebSocket URL
-if "?" in ENGINE_URL:
-    PERSONAPLEX_WS = f"{ENGINE_URL}&voice_prompt={quote(VOICE_PROMPT)}&text_prompt={quote(TEXT_PROMPT)}"
-else:
-    PERSONAPLEX_WS = f"{ENGINE_URL}?voice_prompt={quote(VOICE_PROMPT)}&text_prompt={quote(TEXT_PROMPT)}"
+PERSONAPLEX_WS = engine_ws_url(ENGINE_URLS[0])
 
 # ========== FFMPEG RESAMPLER CLASS ==========
 class FfmpegOggDecoder:
@@ -258,8 +302,458 @@ class FfmpegOggDecoder:
             logger.info(f"{self.tag} stopped: write_total={self.write_total}B read_total={self.read_total}B")
 
 
+class FfmpegOpusEncoder:
+    """Manages a persistent ffmpeg subprocess for PCM24k to raw Opus encoding (not Ogg).
+    
+    PHASE 2: Engine expects raw Opus packets (sphn.OpusStreamReader.append_bytes accepts ogg/opus bytes).
+    We use raw Opus format (-f opus) instead of Ogg container for better streaming performance.
+    """
+    def __init__(self, sample_rate=24000, observability=None):
+        self.sample_rate = sample_rate
+        self.proc = None
+        self._closed = False
+        self.tag = "opus_encoder"
+        self.stderr_buffer = bytearray()
+        self.stderr_task = None
+        self.encode_in_bytes_total = 0
+        self.encode_out_bytes_total = 0
+        self.encode_out_chunks_total = 0
+        self.last_log_time = time.monotonic()
+        self.observability = observability
+    
+    def start(self):
+        """Start ffmpeg encoder subprocess for raw Opus packets."""
+        try:
+            import shlex
+            # Use Ogg Opus format (engine expects Ogg based on logs showing OggS=True)
+            # Add -flush_packets 1 to force immediate output
+            command = [
+                "ffmpeg",
+                "-hide_banner",
+                "-loglevel", "error",
+                "-f", "s16le",
+                "-ar", str(self.sample_rate),
+                "-ac", "1",
+                "-i", "pipe:0",
+                "-c:a", "libopus",
+                "-application", "voip",
+                "-frame_duration", "20",
+                "-vbr", "off",
+                "-b:a", "24k",
+                "-flush_packets", "1",  # Force immediate packet output
+                "-f", "ogg",  # Ogg Opus format (matches engine output)
+                "pipe:1"
+            ]
+            logger.info(f"Opus encoder cmd: {' '.join(shlex.quote(x) for x in command)}")
+            
+            self.proc = subprocess.Popen(
+                command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                bufsize=0,
+            )
+            if self.proc.poll() is not None:
+                stderr = self.proc.stderr.read().decode(errors="ignore")
+                raise RuntimeError(f"{self.tag} exited immediately: {stderr}")
+            
+            logger.info(
+                f"{self.tag} started: PCM{self.sample_rate // 1000}k → Ogg Opus, "
+                f"PID={self.proc.pid}, stdin_open={self.proc.stdin is not None}, "
+                f"stdout_open={self.proc.stdout is not None}, stderr_open={self.proc.stderr is not None}"
+            )
+            
+            # STEP 3: Start async stderr reader task
+            self.stderr_task = asyncio.create_task(self._stderr_reader())
+            
+        except FileNotFoundError:
+            raise RuntimeError(f"ffmpeg not found. Install with: apt-get install -y ffmpeg")
+        except Exception as e:
+            raise RuntimeError(f"{self.tag} failed to start: {e}")
+    
+    async def _stderr_reader(self):
+        """Continuously read and log stderr with prefix [ffmpeg-enc]. Uses non-blocking read1."""
+        try:
+            loop = asyncio.get_event_loop()
+            line_buf = bytearray()
+            while not self._closed and self.proc and self.proc.poll() is None:
+                try:
+                    # Use read1 (non-blocking) with small chunks
+                    chunk = await asyncio.wait_for(
+                        loop.run_in_executor(None, lambda: self.proc.stderr.read1(256)),
+                        timeout=0.1
+                    )
+                    if chunk:
+                        self.stderr_buffer.extend(chunk)
+                        if len(self.stderr_buffer) > 1024:
+                            self.stderr_buffer = self.stderr_buffer[-512:]
+                        
+                        # Process complete lines
+                        line_buf.extend(chunk)
+                        while b'\n' in line_buf:
+                            line, line_buf = line_buf.split(b'\n', 1)
+                            if line:
+                                line_str = line.decode(errors="ignore").strip()
+                                if line_str:
+                                    logger.warning(f"[ffmpeg-enc] {line_str}")
+                    elif self.proc.poll() is not None:
+                        break
+                except asyncio.TimeoutError:
+                    continue
+                except Exception as e:
+                    logger.error(f"[ffmpeg-enc] stderr reader error: {e}", exc_info=True)
+                    break
+        except Exception as e:
+            logger.error(f"[ffmpeg-enc] stderr reader fatal: {e}", exc_info=True)
+    
+    def write(self, pcm_bytes: bytes):
+        """Write PCM bytes to encoder input with logging."""
+        if self._closed or self.proc is None:
+            return False
+        try:
+            self.proc.stdin.write(pcm_bytes)
+            self.proc.stdin.flush()
+            self.encode_in_bytes_total += len(pcm_bytes)
+            if self.observability:
+                self.observability.update_counter('opus_encode_in_pcm_bytes', bytes_delta=len(pcm_bytes))
+                self.observability.update_activity('encode_in')
+            
+            # Rate-limited logging (every 1 second)
+            now = time.monotonic()
+            if now - self.last_log_time >= 1.0:
+                logger.debug(
+                    f"{self.tag} write: total_in={self.encode_in_bytes_total}b, "
+                    f"total_out={self.encode_out_bytes_total}b, chunks={self.encode_out_chunks_total}"
+                )
+                self.last_log_time = now
+            
+            return True
+        except BrokenPipeError:
+            logger.error(f"{self.tag} write: BrokenPipeError - process may have died")
+            self._closed = True
+            return False
+        except OSError as e:
+            logger.error(f"{self.tag} write: OSError: {e}")
+            self._closed = True
+            return False
+    
+    async def read(self, nbytes: int, timeout: float = 0.1):
+        """Read encoded Ogg Opus bytes (async) with metrics.
+        
+        Uses read1 (non-blocking) if available, else read with timeout.
+        Returns empty bytes on timeout, None on error.
+        """
+        if self._closed or self.proc is None:
+            return None
+        try:
+            loop = asyncio.get_event_loop()
+            # Try read1 first (non-blocking), fallback to read
+            if hasattr(self.proc.stdout, 'read1'):
+                data = await asyncio.wait_for(
+                    loop.run_in_executor(None, self.proc.stdout.read1, min(nbytes, 4096)),
+                    timeout=timeout
+                )
+            else:
+                data = await asyncio.wait_for(
+                    loop.run_in_executor(None, self.proc.stdout.read, nbytes),
+                    timeout=timeout
+                )
+            if data:
+                self.encode_out_bytes_total += len(data)
+                self.encode_out_chunks_total += 1
+                if self.observability:
+                    self.observability.update_counter('opus_encode_out_bytes', bytes_delta=len(data))
+                    self.observability.update_activity('encode_out')
+                
+                # Rate-limited logging (every 1 second)
+                now = time.monotonic()
+                if now - self.last_log_time >= 1.0:
+                    logger.debug(
+                        f"[ffmpeg-{self.tag}] read: got {len(data)} bytes, "
+                        f"total_out={self.encode_out_bytes_total}b, chunks={self.encode_out_chunks_total}"
+                    )
+                    self.last_log_time = now
+            elif self.proc.poll() is not None:
+                logger.warning(f"[ffmpeg-{self.tag}] read: EOF and process exited (code={self.proc.returncode})")
+                self._closed = True
+            return data if data else b""
+        except asyncio.TimeoutError:
+            return b""  # Timeout is normal, return empty bytes
+        except Exception as e:
+            logger.error(f"[ffmpeg-{self.tag}] read error: {e}", exc_info=True)
+            self._closed = True
+            return None
+    
+    def check_stderr(self):
+        """Check and return any stderr output from ffmpeg."""
+        if self.proc and self.proc.stderr:
+            try:
+                err = self.proc.stderr.read()
+                if err:
+                    self.stderr_buffer.extend(err)
+                    if len(self.stderr_buffer) > 1024:
+                        self.stderr_buffer = self.stderr_buffer[-512:]
+                    return self.stderr_buffer.decode(errors="ignore")
+            except Exception:
+                pass
+        return None
+    
+    def stop(self):
+        """Stop and cleanup encoder."""
+        self._closed = True
+        
+        # Cancel stderr reader task
+        if self.stderr_task and not self.stderr_task.done():
+            self.stderr_task.cancel()
+        
+        if self.proc:
+            try:
+                self.proc.stdin.close()
+            except Exception:
+                pass
+            try:
+                self.proc.stdout.close()
+            except Exception:
+                pass
+            try:
+                self.proc.terminate()
+                self.proc.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+            except Exception:
+                pass
+            self.proc = None
+            logger.info(
+                f"{self.tag} stopped: total_in={self.encode_in_bytes_total}b, "
+                f"total_out={self.encode_out_bytes_total}b, chunks={self.encode_out_chunks_total}"
+            )
+
+
+# ========== IN-PROCESS OPUS CODEC ==========
+class SphnOpusEncoder:
+    """In-process PCM24k → Ogg Opus encoder, with the sphn.OpusStreamWriter used by the engine.
+
+    Drop-in replacement for FfmpegOpusEncoder: the PCM is cut into exact 20ms Opus frames
+    and encoded on write, so the Ogg pages can be read back right away, without a subprocess,
+    pipes or executor threads.
+    """
+    def __init__(self, sample_rate=24000, observability=None):
+        self.sample_rate = sample_rate
+        self.frame_bytes = int(sample_rate * AUDIO_CHUNK_MS / 1000) * 2
+        self.proc = None  # No subprocess, kept for the FfmpegOpusEncoder interface
+        self.writer = None
+        self._closed = False
+        self.tag = "opus_encoder"
+        self.pcm_buf = bytearray()
+        self.out_buf = bytearray()
+        self.encode_in_bytes_total = 0
+        self.encode_out_bytes_total = 0
+        self.encode_out_chunks_total = 0
+        self.observability = observability
+
+    def start(self):
+        """Create the sphn Opus writer."""
+        if sphn is None:
+            raise RuntimeError("sphn not found. Install with: pip install 'sphn>=0.1.4,<0.2'")
+        self.writer = sphn.OpusStreamWriter(self.sample_rate)
+        logger.info(f"{self.tag} started: PCM{self.sample_rate // 1000}k → Ogg Opus in-process, {AUDIO_CHUNK_MS}ms frames")
+
+    def write(self, pcm_bytes: bytes):
+        """Encode the complete 20ms frames of the PCM bytes, the remainder waits for the next write."""
+        if self._closed or self.writer is None:
+            return False
+        self.pcm_buf.extend(pcm_bytes)
+        self.encode_in_bytes_total += len(pcm_bytes)
+        if self.observability:
+            self.observability.update_counter('opus_encode_in_pcm_bytes', bytes_delta=len(pcm_bytes))
+            self.observability.update_activity('encode_in')
+        n = len(self.pcm_buf) - len(self.pcm_buf) % self.frame_bytes
+        if n:
+            frames = int16_to_float32(bytes(self.pcm_buf[:n]))
+            del self.pcm_buf[:n]
+            for frame in frames.reshape(-1, self.frame_bytes // 2):
+                self.writer.append_pcm(frame)
+            self.out_buf.extend(self.writer.read_bytes())
+        return True
+
+    async def read(self, nbytes: int, timeout: float = 0.1):
+        """Return up to nbytes of the encoded Ogg Opus bytes, empty bytes if there are none."""
+        if self._closed or self.writer is None:
+            return None
+        data = bytes(self.out_buf[:nbytes])
+        del self.out_buf[:nbytes]
+        if data:
+            self.encode_out_bytes_total += len(data)
+            self.encode_out_chunks_total += 1
+            if self.observability:
+                self.observability.update_counter('opus_encode_out_bytes', bytes_delta=len(data))
+                self.observability.update_activity('encode_out')
+        return data
+
+    def check_stderr(self):
+        return None
+
+    def stop(self):
+        """Drop the writer."""
+        self._closed = True
+        self.writer = None
+        logger.info(
+            f"{self.tag} stopped: total_in={self.encode_in_bytes_total}b, "
+            f"total_out={self.encode_out_bytes_total}b, chunks={self.encode_out_chunks_total}"
+        )
+
+
+class SphnOpusDecoder:
+    """In-process Ogg Opus → PCM24k decoder, with the sphn.OpusStreamReader used by the engine.
+
+    Drop-in replacement for FfmpegOggDecoder: pages are decoded as soon as they are written,
+    and read() wakes up on the next decoded packet instead of polling a pipe.
+    """
+    def __init__(self, sample_rate=24000, observability=None):
+        self.sample_rate = sample_rate
+        self.proc = None  # No subprocess, kept for the FfmpegOggDecoder interface
+        self.reader = None
+        self._closed = False
+        self.tag = "ogg_decoder"
+        self.observability = observability
+        self.pcm_buf = bytearray()
+        self.pcm_ready = asyncio.Event()
+        self.write_total = 0
+        self.read_total = 0
+
+    def start(self):
+        """Create the sphn Opus reader."""
+        if sphn is None:
+            raise RuntimeError("sphn not found. Install with: pip install 'sphn>=0.1.4,<0.2'")
+        self.reader = sphn.OpusStreamReader(self.sample_rate)
+        logger.info(f"{self.tag} started: Ogg Opus → PCM{self.sample_rate // 1000}k in-process")
+
+    def write(self, ogg_bytes: bytes):
+        """Decode Ogg bytes into the PCM buffer."""
+        if self._closed or self.reader is None:
+            return False
+        self.reader.append_bytes(ogg_bytes)
+        self.write_total += len(ogg_bytes)
+        if self.observability:
+            self.observability.update_counter('decoder_in_bytes', bytes_delta=len(ogg_bytes))
+            self.observability.update_activity('decoder_in')
+        pcm = self.reader.read_pcm()
+        if pcm.size:
+            self.pcm_buf.extend(float32_to_int16_bytes(pcm))
+            self.pcm_ready.set()
+        return True
+
+    async def read(self, nbytes: int, timeout: float = 0.1):
+        """Read decoded PCM24k bytes, waiting up to timeout for the next packet."""
+        if self._closed or self.reader is None:
+            return None
+        if not self.pcm_buf:
+            try:
+                await asyncio.wait_for(self.pcm_ready.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return b""
+        data = bytes(self.pcm_buf[:nbytes])
+        del self.pcm_buf[:nbytes]
+        if not self.pcm_buf:
+            self.pcm_ready.clear()
+        self.read_total += len(data)
+        if self.observability:
+            self.observability.update_counter('decoder_out_pcm24k_bytes', bytes_delta=len(data))
+            self.observability.update_activity('decoder_out')
+        return data
+
+    def stop(self):
+        """Close the reader."""
+        self._closed = True
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+        logger.info(f"{self.tag} stopped: write_total={self.write_total}B read_total={self.read_total}B")
+
+
+class StreamingResampler:
+    """Stateful polyphase PCM resampler, for a stream sent in small chunks.
+
+    The anti-aliasing filter is the one of scipy.signal.resample_poly, designed once and split
+    into its polyphase components. The input history is kept across calls, so that the filter
+    runs over the stream as a whole, without restarting at each chunk boundary.
+    The filter being causal, the output is delayed by half its length, e.g. 0.4 ms for
+    8k->24k and 1.3 ms for 24k->8k. After N input samples, exactly ceil(N * out_sr / in_sr)
+    output samples have been emitted.
+    """
+
+    def __init__(self, in_sr: int, out_sr: int, tag: str = "resampler"):
+        self.in_sr = in_sr
+        self.out_sr = out_sr
+        self.tag = tag
+        self._closed = False
+        from fractions import Fraction
+        ratio = Fraction(out_sr, in_sr)
+        self.up = ratio.numerator
+        self.down = ratio.denominator
+        # Same filter as scipy.signal.resample_poly.
+        max_rate = max(self.up, self.down)
+        half_len = 10 * max_rate
+        h = signal.firwin(2 * half_len + 1, 1.0 / max_rate, window=('kaiser', 5.0)) * self.up
+        self.taps = -(-len(h) // self.up)
+        h = np.concatenate([h, np.zeros(self.taps * self.up - len(h))])
+        # phases[r, t] = h[r + t * up], reversed along t to apply it to the input in time order.
+        self.phases = h.reshape(self.taps, self.up).T[:, ::-1].astype(np.float32)
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._in_total = 0  # input samples received so far
+        self._out_total = 0  # output samples emitted so far
+        self._pending_byte = b""
+        logger.info(
+            f"{self.tag}: streaming resampler initialized {in_sr}Hz -> {out_sr}Hz "
+            f"(ratio {self.up}/{self.down}, {self.taps} taps per phase)"
+        )
+
+    def start(self):
+        """No-op, kept for the same interface as the other resamplers."""
+        pass
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """Resample a chunk of int16 or float32 samples, returning the same dtype."""
+        if self._closed or len(samples) == 0:
+            return samples[:0]
+        x = np.concatenate([self._history, samples.astype(np.float32, copy=False)])
+        self._in_total += len(samples)
+        # Output m reads the input up to sample (m * down) // up, with the phase (m * down) % up.
+        out_end = -(-self._in_total * self.up // self.down)
+        positions = np.arange(self._out_total, out_end, dtype=np.int64) * self.down
+        last = positions // self.up - (self._in_total - len(samples))
+        windows = np.lib.stride_tricks.sliding_window_view(x, self.taps)[last]
+        y = np.einsum('mt,mt->m', windows, self.phases[positions % self.up])
+        self._out_total = out_end
+        self._history = x[len(x) - (self.taps - 1):].copy()
+        if samples.dtype == np.int16:
+            return np.clip(np.rint(y), -32768, 32767).astype(np.int16)
+        return y.astype(samples.dtype, copy=False)
+
+    def resample(self, pcm_bytes: bytes) -> bytes:
+        """Resample PCM16LE bytes from in_sr to out_sr."""
+        if self._closed:
+            return b""
+        try:
+            pcm_bytes = self._pending_byte + pcm_bytes
+            # An odd trailing byte is kept for the next call.
+            even = len(pcm_bytes) & ~1
+            self._pending_byte = pcm_bytes[even:]
+            return self.process(np.frombuffer(pcm_bytes[:even], dtype='<i2')).tobytes()
+        except Exception as e:
+            logger.error(f"{self.tag} resample error: {e}", exc_info=True)
+            return b""
+
+    def stop(self):
+        """No-op, the resampler holds no resources."""
+        self._closed = True
+
+
 class PythonResampler:
-    """Python-based PCM resampler using scipy.signal.resample_poly (no FFmpeg subprocess)."""
+    """Python-based PCM resampler using scipy.signal.resample_poly (no FFmpeg subprocess).
+
+    DEPRECATED: use StreamingResampler, this one resamples each chunk on its own.
+    """
     
     def __init__(self, in_sr: int, out_sr: int, tag: str = "resampler"):
         self.in_sr = in_sr
@@ -301,7 +795,7 @@ class PythonResampler:
         self._closed = True
 
 class FfmpegResampler:
-    """Manages ffmpeg subprocess for PCM resampling (DEPRECATED: use PythonResampler)."""
+    """Manages ffmpeg subprocess for PCM resampling (DEPRECATED: use StreamingResampler)."""
     
     def __init__(self, in_sr: int, out_sr: int, tag: str = "resampler"):
         self.in_sr = in_sr
@@ -401,7 +895,486 @@ class FfmpegResampler:
             self.proc = None
             logger.debug(f"{self.tag} stopped")
 
+# ========== OUTBOUND PLAYOUT ==========
+PLAYOUT_COUNTERS = ('playout_underrun_frames', 'playout_underruns', 'playout_trimmed_frames',
+                    'playout_compressed_frames')
+
+
+class PlayoutBuffer:
+    """Adaptive jitter buffer between the decoded engine audio and the 20ms Exotel clock.
+
+    The engine audio arrives in bursts (one 80ms step at a time, through the decoder and
+    the resampler), write() appends it whatever its size. pop_frame() is called once per
+    clock tick and returns exactly one frame: nothing is played until target_ms is
+    buffered, an empty buffer plays silence (an underrun) until target_ms is buffered again,
+    and each underrun raises the target by a frame. After quiet_secs without an underrun,
+    the target goes back down by a frame, down to min_ms. Above twice the target, quiet
+    frames are skipped to catch up without an audible cut; above max_ms, the oldest audio
+    is trimmed back to the target.
+
+    write() takes the monotonic time the audio was received from the engine; after
+    pop_frame(), frame_arrival is that time for the audio of the frame, None for silence.
+
+    Args:
+        frame_bytes (int): Bytes of one frame (320 for 20ms of PCM16 @ 8kHz).
+        frame_ms (int): Duration of one frame, the clock period.
+        target_ms (int): Initial buffer depth before playing.
+        min_ms (int): Lowest target.
+        max_ms (int): Depth above which the buffer is trimmed back to the target.
+        quiet_secs (float): Time without underrun after which the target is lowered.
+        silence_level (int): Peak sample value below which a frame may be skipped.
+        counters (dict): Where the PLAYOUT_COUNTERS are kept, e.g. the PipelineObservability counters.
+    """
+
+    def __init__(self, frame_bytes: int = 320, frame_ms: int = 20, target_ms: int = 120, min_ms: int = 80,
+                 max_ms: int = 400, quiet_secs: float = 10.0, silence_level: int = 300, counters: dict = None):
+        self.frame_bytes = frame_bytes
+        self.frame_ms = frame_ms
+        self.min_target = max(1, min_ms // frame_ms)
+        self.max_frames = max(2, max_ms // frame_ms)
+        self.max_target = max(self.min_target, self.max_frames // 2)
+        self.target = min(max(self.min_target, target_ms // frame_ms), self.max_target)
+        self.quiet_frames = int(quiet_secs * 1000 / frame_ms)
+        self.silence_level = silence_level
+        self.silence = bytes(frame_bytes)
+        self.buf = bytearray()
+        self.arrivals = deque()  # (end offset in the stream, arrival) of the writes
+        self.read_offset = 0  # Stream offset of the start of buf
+        self.frame_arrival = None
+        self.started = False  # First target_ms buffered
+        self.playing = False  # False while (re)buffering
+        self.frames_since_underrun = 0
+        self.counters = counters if counters is not None else {}
+        for key in PLAYOUT_COUNTERS:
+            self.counters.setdefault(key, 0)
+
+    def depth_frames(self) -> int:
+        return len(self.buf) // self.frame_bytes
+
+    def depth_ms(self) -> int:
+        return self.depth_frames() * self.frame_ms
+
+    def target_ms(self) -> int:
+        return self.target * self.frame_ms
+
+    def write(self, pcm: bytes, arrival: float = None):
+        self.buf += pcm
+        if arrival is not None:
+            self.arrivals.append((self.read_offset + len(self.buf), arrival))
+        excess = self.depth_frames() - self.max_frames
+        if excess > 0:
+            trimmed = excess + self.max_frames - self.target
+            del self.buf[:trimmed * self.frame_bytes]
+            self.read_offset += trimmed * self.frame_bytes
+            self.counters['playout_trimmed_frames'] += trimmed
+
+    def pop_frame(self):
+        """Frame to send on this clock tick, or None before any audio was buffered."""
+        self.frame_arrival = None
+        depth = self.depth_frames()
+        if not self.playing:
+            if depth < self.target:
+                if not self.started:
+                    return None
+                self.counters['playout_underrun_frames'] += 1
+                return self.silence
+            self.started = self.playing = True
+        if depth == 0:
+            # Underrun: play silence until the (raised) target is buffered again
+            self.playing = False
+            self.frames_since_underrun = 0
+            self.target = min(self.target + 1, self.max_target)
+            self.counters['playout_underruns'] += 1
+            self.counters['playout_underrun_frames'] += 1
+            return self.silence
+        self.frames_since_underrun += 1
+        if self.frames_since_underrun >= self.quiet_frames and self.target > self.min_target:
+            self.target -= 1
+            self.frames_since_underrun = 0
+        frame = self._take()
+        # Catching up: skip quiet frames while the buffer is well above the target
+        while self.depth_frames() >= 2 * self.target and self._is_quiet(frame):
+            frame = self._take()
+            self.counters['playout_compressed_frames'] += 1
+        return frame
+
+    def _take(self) -> bytes:
+        frame = bytes(self.buf[:self.frame_bytes])
+        del self.buf[:self.frame_bytes]
+        while self.arrivals and self.arrivals[0][0] <= self.read_offset:
+            self.arrivals.popleft()
+        self.frame_arrival = self.arrivals[0][1] if self.arrivals else None
+        self.read_offset += self.frame_bytes
+        return frame
+
+    def _is_quiet(self, frame: bytes) -> bool:
+        samples = np.frombuffer(frame, dtype=np.int16)
+        return -self.silence_level < int(samples.min()) and int(samples.max()) < self.silence_level
+
+
+# ========== INBOUND JITTER BUFFER ==========
+INBOUND_COUNTERS = ('inbound_lost_frames', 'inbound_late_frames', 'inbound_reordered_frames',
+                    'inbound_underrun_frames', 'inbound_dropped_frames')
+
+
+def media_position(data: dict):
+    """(kind, value) locating an Exotel media event in the stream, or None.
+
+    Exotel media events carry media.timestamp (ms since the start of the stream),
+    media.chunk and sequence_number; the first one present is used.
+    """
+    media = data.get("media") or {}
+    for kind, value in (("timestamp", media.get("timestamp")), ("chunk", media.get("chunk")),
+                        ("sequence", data.get("sequence_number"))):
+        if value is not None:
+            try:
+                return kind, int(float(value))
+            except (TypeError, ValueError):
+                continue
+    return None
+
+
+class InboundJitterBuffer:
+    """Jitter buffer between the Exotel media events and the 20ms engine input clock.
+
+    Each frame is placed on the stream timeline from its media timestamp, or its chunk or
+    sequence number times the frame size, or after the previous frame when the event
+    has none of them. pop_frame() is called once per clock tick and returns exactly one
+    frame: nothing until latency_ms is buffered, then the audio in timeline order. A
+    hole that later audio has already passed by latency_ms is a lost frame, played as
+    silence. When nothing is buffered (Exotel is late), silence is played without moving
+    on the timeline, and the buffer waits for latency_ms again; frames arriving after
+    their place was played are dropped as late. Above max_ms, the oldest audio is dropped.
+
+    The drift is the delay of the arrival of a frame behind its place on the timeline,
+    relative to the first frame; its spread over the call is the network jitter. After
+    pop_frame(), frame_arrival is the arrival time of the audio of the frame, None for silence.
+
+    Args:
+        sample_rate (int): Sample rate of the PCM16 frames.
+        frame_ms (int): Duration of one frame, the clock period.
+        latency_ms (int): Audio buffered before playing, and wait for a missing frame.
+        max_ms (int): Depth above which the oldest audio is dropped.
+        counters (dict): Where the INBOUND_COUNTERS are kept, e.g. the PipelineObservability counters.
+    """
+
+    def __init__(self, sample_rate: int = 8000, frame_ms: int = 20, latency_ms: int = 60, max_ms: int = 500,
+                 counters: dict = None):
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.frame_samples = sample_rate * frame_ms // 1000
+        self.latency = max(self.frame_samples, sample_rate * latency_ms // 1000)
+        self.max_depth = max(self.latency + self.frame_samples, sample_rate * max_ms // 1000)
+        self.frames = []  # Heap of (position, seq, samples, arrival)
+        self.count = 0  # Tie-breaker of the heap, in arrival order
+        self.play_pos = 0  # Timeline position of the next sample to play
+        self.end_pos = 0  # End of the furthest frame received
+        self.playing = False
+        self.closed = False
+        self.origin = None  # (kind, value) of the first frame, the timeline origin
+        self.unit_samples = None  # Samples per chunk/sequence step: the size of the first frame
+        self.first_arrival = None
+        self.frame_arrival = None
+        self.drift_ms = self.min_drift_ms = self.max_drift_ms = 0.0
+        self.counters = counters if counters is not None else {}
+        for key in INBOUND_COUNTERS:
+            self.counters.setdefault(key, 0)
+
+    def depth_ms(self) -> int:
+        return max(0, self.end_pos - self.play_pos) * 1000 // self.sample_rate
+
+    def jitter_ms(self) -> float:
+        return self.max_drift_ms - self.min_drift_ms
+
+    def push(self, pcm: bytes, position=None, now: float = None):
+        """Add a frame, located by media_position() if known, received at monotonic time now."""
+        samples = np.frombuffer(pcm[:len(pcm) - len(pcm) % 2], dtype=np.int16)
+        if len(samples) == 0 or self.closed:
+            return
+        now = time.monotonic() if now is None else now
+        if self.origin is None:
+            self.origin = position
+            self.unit_samples = len(samples)
+            self.first_arrival = now
+        pos = None
+        if position is not None and self.origin is not None and position[0] == self.origin[0]:
+            steps = position[1] - self.origin[1]
+            if position[0] == "timestamp":
+                pos = steps * self.sample_rate // 1000
+            else:
+                pos = steps * self.unit_samples
+            self.drift_ms = (now - self.first_arrival) * 1000 - pos * 1000 / self.sample_rate
+            self.min_drift_ms = min(self.min_drift_ms, self.drift_ms)
+            self.max_drift_ms = max(self.max_drift_ms, self.drift_ms)
+        if pos is None:
+            pos = max(self.end_pos, self.play_pos)  # No position: right after the previous frame
+        if pos + len(samples) <= self.play_pos:
+            self.counters['inbound_late_frames'] += 1
+            return
+        if pos < self.end_pos:
+            self.counters['inbound_reordered_frames'] += 1
+        self._insert(pos, samples, now)
+        excess = self.end_pos - self.play_pos - self.max_depth
+        if excess > 0:
+            # Exotel ahead of the clock: drop the oldest audio down to the latency
+            dropped = excess + self.max_depth - self.latency
+            self.play_pos += dropped
+            self.counters['inbound_dropped_frames'] += dropped // self.frame_samples
+
+    def close(self, tail: bytes = b""):
+        """No more frames: play the tail after the buffered audio, then finished() is True."""
+        if tail and not self.closed:
+            self._insert(max(self.end_pos, self.play_pos), np.frombuffer(tail, dtype=np.int16))
+        self.closed = True
+
+    def _insert(self, pos: int, samples: np.ndarray, arrival: float = None):
+        heapq.heappush(self.frames, (pos, self.count, samples, arrival))
+        self.count += 1
+        self.end_pos = max(self.end_pos, pos + len(samples))
+
+    def finished(self) -> bool:
+        return self.closed and self.play_pos >= self.end_pos
+
+    def pop_frame(self):
+        """PCM16 frame to send on this clock tick, or None before any audio was buffered."""
+        n = self.frame_samples
+        ahead = self.end_pos - self.play_pos
+        self.frame_arrival = None
+        if not self.playing:
+            if ahead < self.latency and not (self.closed and ahead > 0):
+                if self.first_arrival is None:
+                    return None
+                self.counters['inbound_underrun_frames'] += 1
+                return bytes(2 * n)
+            self.playing = True
+        if ahead < n and not self.closed:
+            # Exotel late: silence without moving on the timeline, wait for latency_ms again
+            self.playing = False
+            self.counters['inbound_underrun_frames'] += 1
+            return bytes(2 * n)
+        out = np.zeros(n, dtype=np.int16)
+        have = 0
+        frame_end = self.play_pos + n
+        while self.frames and self.frames[0][0] < frame_end:
+            pos, count, samples, arrival = self.frames[0]
+            end = pos + len(samples)
+            if end <= self.play_pos:
+                heapq.heappop(self.frames)  # Overlapped by audio already played
+                continue
+            start = max(pos, self.play_pos)
+            stop = min(end, frame_end)
+            out[start - self.play_pos:stop - self.play_pos] = samples[start - pos:stop - pos]
+            if self.frame_arrival is None:
+                self.frame_arrival = arrival
+            have += stop - start
+            if end > frame_end:
+                break
+            heapq.heappop(self.frames)
+        if have < n:
+            self.counters['inbound_lost_frames'] += 1
+        self.play_pos = frame_end
+        return out.tobytes()
+
+
+# ========== HOT-PATH TRACING ==========
+# Trace events: (name, output tag, names of the two queue sizes recorded with the event)
+TRACE_EVENTS = (
+    ("EXOTEL_IN", "EXOTEL_IN", "inbound_ms", None),
+    ("PCM8K_PUT", "PCM8K_PUT", "inbound_ms", None),
+    ("RESAMPLE_IN", "RESAMPLE][IN", "inbound_ms", "q_pcm24k"),
+    ("RESAMPLE_OUT", "RESAMPLE][OUT", "inbound_ms", "q_pcm24k"),
+    ("PCM24K_PUT", "PCM24K_PUT", "q_pcm24k", None),
+    ("ENCODE_IN", "ENCODE][IN", "q_pcm24k", None),
+    ("ENCODE_OUT", "ENCODE][OUT", None, None),
+    ("ENGINE_SEND", "ENGINE_SEND", None, None),
+    ("ENGINE_RECV", "ENGINE_RECV", None, None),
+    ("DECODE_OUT", "DECODE][OUT", None, None),
+    ("EXOTEL_OUT", "EXOTEL_OUT", "q_pcm_out", None),
+)
+(TRACE_EXOTEL_IN, TRACE_PCM8K_PUT, TRACE_RESAMPLE_IN, TRACE_RESAMPLE_OUT, TRACE_PCM24K_PUT, TRACE_ENCODE_IN,
+ TRACE_ENCODE_OUT, TRACE_ENGINE_SEND, TRACE_ENGINE_RECV, TRACE_DECODE_OUT, TRACE_EXOTEL_OUT) = range(len(TRACE_EVENTS))
+
+
+def parse_trace_sample(spec: str) -> list:
+    """Parse "EVENT=N,..." into the 1-in-N sampling period of each trace event."""
+    every = [1] * len(TRACE_EVENTS)
+    names = [event[0] for event in TRACE_EVENTS]
+    for item in filter(None, (x.strip() for x in spec.split(","))):
+        name, _, period = item.partition("=")
+        if name not in names:
+            logger.warning(f"BRIDGE_TRACE_SAMPLE: unknown event {name}, expected one of {names}")
+            continue
+        every[names.index(name)] = max(1, int(period or 1))
+    return every
+
+
+class FrameTracer:
+    """Per-session ring buffer of the hot-path trace events.
+
+    record() only stores a tuple in a preallocated slot, the events are formatted and
+    written out by flush(), from the heartbeat task and at the end of the session. If
+    the ring wraps between two flushes, the oldest events are dropped and counted.
+    Callers guard the calls with BRIDGE_TRACE, so nothing is evaluated when tracing is off.
+    """
+
+    def __init__(self, session_id: str, capacity: int = BRIDGE_TRACE_BUFFER, sample: str = BRIDGE_TRACE_SAMPLE):
+        self.session_id = session_id
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.every = parse_trace_sample(sample)
+        self.seen = [0] * len(TRACE_EVENTS)
+        self.recorded = 0
+        self.flushed = 0
+        self.dropped = 0
+
+    def record(self, event: int, nbytes: int, q1: int = -1, q2: int = -1):
+        """Store one event, if it is kept by the sampling of its type."""
+        seen = self.seen[event]
+        self.seen[event] = seen + 1
+        if seen % self.every[event]:
+            return
+        self.slots[self.recorded % self.capacity] = (time.time(), event, nbytes, q1, q2)
+        self.recorded += 1
+
+    def flush(self, stream=None):
+        """Write out the events recorded since the last flush, in the [LIVE] line format."""
+        stream = stream or sys.stdout
+        start = max(self.flushed, self.recorded - self.capacity)
+        self.dropped += start - self.flushed
+        lines = []
+        for i in range(start, self.recorded):
+            t, event, nbytes, q1, q2 = self.slots[i % self.capacity]
+            _, tag, q1_name, q2_name = TRACE_EVENTS[event]
+            line = f"[LIVE][{tag}] bytes={nbytes}"
+            if q1_name:
+                line += f" {q1_name}={q1}"
+            if q2_name:
+                line += f" {q2_name}={q2}"
+            lines.append(f"{line} t={t}")
+        if start > self.flushed:
+            lines.append(f"[LIVE][TRACE] session={self.session_id} dropped={start - self.flushed} events (ring full)")
+        self.flushed = self.recorded
+        if lines:
+            stream.write("\n".join(lines) + "\n")
+            stream.flush()
+
+
 # ========== OBSERVABILITY MODULE ==========
+# Upper bounds of the latency histogram buckets, the same for every stage and call so that
+# histograms add up across calls and workers
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 30, 40, 60, 80, 100, 120, 160, 200, 250, 300, 400, 500,
+                      600, 800, 1000, 1500, 2000, 3000, 5000, 10000)
+# Per-chunk latencies from the arrival of the Exotel audio (inbound) or of the engine frame
+# (outbound), and the response latency: from the end of the caller speech to the first agent audio
+LATENCY_STAGES = ('exotel_in_to_resampled', 'exotel_in_to_encoded', 'exotel_in_to_engine_sent',
+                  'engine_in_to_decoded', 'engine_in_to_exotel_out', 'response')
+
+
+class LatencyHistogram:
+    """Latencies counted in the LATENCY_BUCKETS_MS buckets, percentiles interpolated within a bucket."""
+
+    def __init__(self, counts: list = None, total_ms: float = 0.0, max_ms: float = 0.0):
+        self.counts = list(counts) if counts else [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total_ms = total_ms
+        self.max_ms = max_ms
+
+    @classmethod
+    def from_dict(cls, d: dict) -> 'LatencyHistogram':
+        return cls(d['counts'], d['total_ms'], d['max_ms'])
+
+    def to_dict(self) -> dict:
+        return {'counts': list(self.counts), 'total_ms': self.total_ms, 'max_ms': self.max_ms}
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def add(self, ms: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def merge(self, other: 'LatencyHistogram'):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+
+    def percentile(self, p: float) -> float:
+        n = self.count
+        if n == 0:
+            return 0.0
+        rank = p / 100 * n
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= rank:
+                lo = LATENCY_BUCKETS_MS[i - 1] if i > 0 else 0.0
+                hi = LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else self.max_ms
+                return min(lo + (hi - lo) * (rank - seen) / c, self.max_ms)
+            seen += c
+        return self.max_ms
+
+    def summary(self) -> dict:
+        n = self.count
+        return {
+            'count': n,
+            'mean_ms': round(self.total_ms / n, 1) if n else 0.0,
+            'p50_ms': round(self.percentile(50), 1),
+            'p90_ms': round(self.percentile(90), 1),
+            'p99_ms': round(self.percentile(99), 1),
+            'max_ms': round(self.max_ms, 1),
+        }
+
+
+def latency_metrics(histograms: dict) -> dict:
+    """Percentiles and bucket counts of stage -> LatencyHistogram, for the metrics file."""
+    return {stage: dict(h.summary(), counts=list(h.counts)) for stage, h in histograms.items()}
+
+
+class ResponseLatencyTracker:
+    """Time from the end of the caller speech to the first agent audio, as seen by the bridge.
+
+    caller_frame() takes the inbound frames in stream order with their arrival time from
+    Exotel, agent_frame() the frames sent to Exotel. A frame is speech above an RMS of
+    level. The first agent speech after caller speech is a response if the caller has
+    been quiet for min_pause_ms, its latency runs from the arrival of the last caller
+    speech frame; agent speech while the caller is still talking (a backchannel, a
+    barge-in) is not counted. The network legs to and from the caller are not included.
+
+    Args:
+        frame_ms (int): Duration of the caller frames.
+        level (float): RMS of a PCM16 frame above which it is speech.
+        min_pause_ms (int): Caller silence before agent speech counts as a response.
+    """
+
+    def __init__(self, frame_ms: int = 20, level: float = 500.0, min_pause_ms: int = 200):
+        self.frame_ms = frame_ms
+        self.level = level
+        self.min_pause_ms = min_pause_ms
+        self.caller_last_speech = None  # Arrival of the last caller speech frame not answered yet
+        self.caller_quiet_ms = 0
+
+    def is_speech(self, pcm: bytes) -> bool:
+        samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32)
+        return samples.size > 0 and float(np.sqrt(np.mean(samples * samples))) > self.level
+
+    def caller_frame(self, pcm: bytes, arrival: float = None):
+        if arrival is not None and self.is_speech(pcm):
+            self.caller_last_speech = arrival
+            self.caller_quiet_ms = 0
+        else:
+            self.caller_quiet_ms += self.frame_ms
+
+    def agent_frame(self, pcm: bytes, now: float = None):
+        """Response latency in ms if this frame starts the answer to the caller, else None."""
+        if self.caller_last_speech is None or not self.is_speech(pcm):
+            return None
+        last_speech, self.caller_last_speech = self.caller_last_speech, None
+        if self.caller_quiet_ms < self.min_pause_ms:
+            return None  # Talking over the caller
+        now = time.monotonic() if now is None else now
+        return (now - last_speech) * 1000
+
+
 class PipelineObservability:
     """Observability system for pipeline stages with counters, timestamps, and deltas."""
     
@@ -457,6 +1430,9 @@ class PipelineObservability:
         
         # Stalled stage tracking
         self.stall_warnings = {}
+        
+        # Per-chunk stage latencies and response latency (LATENCY_STAGES)
+        self.latency = {stage: LatencyHistogram() for stage in LATENCY_STAGES}
     
     def update_counter(self, key: str, delta: int = 1, bytes_delta: int = 0):
         """Update a counter and activity timestamp."""
@@ -472,6 +1448,19 @@ class PipelineObservability:
         if stage in self.last_activity:
             self.last_activity[stage] = time.monotonic()
     
+    def record_latency(self, stage: str, since: float, now: float = None):
+        """Add the latency of a chunk from the monotonic time since to now."""
+        now = time.monotonic() if now is None else now
+        self.latency[stage].add((now - since) * 1000)
+    
+    def format_latency(self) -> str:
+        """p50/p90/p99 of each stage with samples, for the end of call summary."""
+        parts = []
+        for stage, h in self.latency.items():
+            if h.count:
+                parts.append(f"{stage}={h.percentile(50):.0f}/{h.percentile(90):.0f}/{h.percentile(99):.0f}ms(n={h.count})")
+        return " ".join(parts) if parts else "no samples"
+    
     def get_deltas(self):
         """Calculate deltas since last heartbeat."""
         deltas = {}
@@ -487,10 +1476,11 @@ class PipelineObservability:
         deltas = self.get_deltas()
         
         # Queue sizes
-        q8k = queues.get('pcm8k_q', 'N/A')
+        inbound_ms = queues.get('inbound_ms', 'N/A')
         q24k = queues.get('pcm24k_q', 'N/A')
         qogg = queues.get('ogg_q', 'N/A')
-        qpcm = queues.get('pcm_out_q', 'N/A')
+        playout_ms = queues.get('playout_ms', 'N/A')
+        playout_target_ms = queues.get('playout_target_ms', 'N/A')
         
         # Format deltas
         delta_strs = []
@@ -531,7 +1521,8 @@ class PipelineObservability:
                     del self.stall_warnings[stage]
         
         # Build heartbeat line
-        hb = f"HB t={elapsed:.1f}s q8k={q8k} q24k={q24k} qogg={qogg} qpcm={qpcm}"
+        hb = (f"HB t={elapsed:.1f}s inbound={inbound_ms}ms q24k={q24k} qogg={qogg} "
+              f"playout={playout_ms}/{playout_target_ms}ms underruns={self.counters.get('playout_underruns', 0)}")
         if delta_strs:
             hb += " " + " ".join(delta_strs)
         if last_strs:
@@ -546,6 +1537,337 @@ class PipelineObservability:
         return hb
 
 
+# Calls of this process, reported to the supervisor in multi-process mode
+WORKER_STATS = {
+    'calls_total': 0,
+    'sessions': {},  # session_id -> PipelineObservability of the active calls
+    'counters': {},  # counters summed over the finished calls
+    'latency': {stage: LatencyHistogram() for stage in LATENCY_STAGES},  # histograms of the finished calls
+}
+
+
+def worker_report(worker_id: int) -> dict:
+    """Snapshot of the calls of this process, with the counters and latencies of finished and active calls summed."""
+    counters = dict(WORKER_STATS['counters'])
+    latency = {stage: LatencyHistogram() for stage in LATENCY_STAGES}
+    for stage, h in WORKER_STATS['latency'].items():
+        latency[stage].merge(h)
+    for obs in list(WORKER_STATS['sessions'].values()):
+        for key, value in obs.counters.items():
+            counters[key] = counters.get(key, 0) + value
+        for stage, h in obs.latency.items():
+            latency[stage].merge(h)
+    return {
+        'worker': worker_id,
+        'pid': os.getpid(),
+        'time': time.time(),
+        'active_calls': len(WORKER_STATS['sessions']),
+        'calls_total': WORKER_STATS['calls_total'],
+        'counters': counters,
+        'latency': {stage: h.to_dict() for stage, h in latency.items()},
+    }
+
+
+def write_metrics_file(metrics: dict):
+    """Replace BRIDGE_METRICS_FILE with metrics as JSON, atomically for the scrapers."""
+    tmp_path = BRIDGE_METRICS_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(metrics, f)
+    os.replace(tmp_path, BRIDGE_METRICS_FILE)
+
+
+async def metrics_file_loop():
+    """Single-process mode: write the worker report to BRIDGE_METRICS_FILE every BRIDGE_METRICS_SECS."""
+    while True:
+        await asyncio.sleep(BRIDGE_METRICS_SECS)
+        report = worker_report(0)
+        latency = {stage: LatencyHistogram.from_dict(d) for stage, d in report.pop('latency').items()}
+        report['latency_ms'] = latency_metrics(latency)
+        report['latency_buckets_ms'] = list(LATENCY_BUCKETS_MS)
+        write_metrics_file(report)
+
+
+# ========== ENGINE LOAD BALANCING ==========
+def engine_status_url(engine_url: str) -> str:
+    """http(s)://host:port/api/status of an engine, from its ws(s)://host:port/api/chat URL."""
+    parts = urlsplit(engine_url)
+    scheme = {"wss": "https", "ws": "http"}.get(parts.scheme, parts.scheme)
+    return urlunsplit((scheme, parts.netloc, "/api/status", "", ""))
+
+
+def fetch_engine_status(status_url: str, timeout: float = 2.0) -> dict:
+    """GET the engine status (blocking, run it in a thread)."""
+    ctx = ssl_no_verify() if status_url.startswith("https://") else None
+    with urllib.request.urlopen(status_url, timeout=timeout, context=ctx) as response:
+        return json.loads(response.read())
+
+
+class EngineBackend:
+    """One engine of ENGINE_URLS, with its capacity and load as seen by this process."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.ws_url = engine_ws_url(url)
+        self.status_url = engine_status_url(url)
+        self.healthy = True
+        self.has_status = False  # True once /api/status answered
+        self.capacity = BRIDGE_ENGINE_CAPACITY  # 0 = unknown
+        self.engine_load = 0  # Active and waiting sessions reported by the engine at the last poll
+        self.inflight = 0  # Sessions of this process on the engine, calls and pooled sessions
+        self.opened = 0  # Sessions of this process opened since the last poll, not in engine_load yet
+
+    def free(self):
+        """Free sessions, or None when the capacity is unknown."""
+        if not self.capacity:
+            return None
+        load = self.engine_load + self.opened if self.has_status else self.inflight
+        return self.capacity - load
+
+    def describe(self) -> str:
+        free = self.free()
+        return (f"{self.url}: healthy={self.healthy} free={'?' if free is None else free}/{self.capacity or '?'} "
+                f"inflight={self.inflight}")
+
+
+class EngineBalancer:
+    """Routes the calls to the engine with the most free sessions.
+
+    The capacity of each engine is polled from its /api/status every BRIDGE_ENGINE_STATUS_SECS,
+    and its load is kept up to date with the sessions this process opens and closes until the
+    next poll. Engines without /api/status are
+    balanced on the sessions of this process, against BRIDGE_ENGINE_CAPACITY if set. An engine
+    that cannot be reached is skipped until it answers a poll again. When all the engines are
+    full, acquire() waits up to its timeout for a session to end, and returns None after it.
+    """
+
+    def __init__(self, urls: list):
+        self.backends = [EngineBackend(url) for url in urls]
+        self.changed = asyncio.Event()
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._poll_loop())
+        logger.info(f"ENGINE_BALANCER: {len(self.backends)} engines: {', '.join(b.url for b in self.backends)}")
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    def pick(self):
+        """Healthy engine with the most free sessions, then the fewest sessions of this process."""
+        candidates = []
+        for backend in self.backends:
+            free = backend.free()
+            if backend.healthy and (free is None or free > 0):
+                candidates.append((free is None, -(free or 0), backend.inflight, backend))
+        if not candidates:
+            return None
+        return min(candidates, key=lambda c: c[:3])[3]
+
+    async def acquire(self, timeout: float = 0.0):
+        """Reserve a session on the least loaded engine, or None if all stay full for timeout seconds."""
+        deadline = time.monotonic() + timeout
+        while True:
+            backend = self.pick()
+            if backend is not None:
+                backend.inflight += 1
+                backend.opened += 1
+                return backend
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            self.changed.clear()
+            try:
+                await asyncio.wait_for(self.changed.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return None
+
+    def release(self, backend: EngineBackend):
+        """The session reserved by acquire() is closed."""
+        backend.inflight -= 1
+        if backend.opened > 0:
+            backend.opened -= 1
+        elif backend.engine_load > 0:
+            backend.engine_load -= 1
+        self.changed.set()
+
+    def mark_failed(self, backend: EngineBackend, error):
+        if backend.healthy:
+            logger.warning(f"ENGINE_BALANCER: {backend.url} failed ({error}), skipped until it answers again")
+        backend.healthy = False
+
+    def describe(self) -> str:
+        return "; ".join(backend.describe() for backend in self.backends)
+
+    async def _poll(self, backend: EngineBackend):
+        try:
+            status = await asyncio.to_thread(fetch_engine_status, backend.status_url)
+        except urllib.error.HTTPError:
+            # Reachable, but without /api/status: balanced on the sessions of this process
+            backend.has_status = False
+            backend.capacity = BRIDGE_ENGINE_CAPACITY
+        except Exception as e:
+            self.mark_failed(backend, e)
+            return
+        else:
+            backend.has_status = True
+            backend.capacity = int(status["batch_size"])
+            backend.engine_load = int(status["active_sessions"]) + int(status.get("waiting_sessions", 0))
+            backend.opened = 0
+        if not backend.healthy:
+            logger.info(f"ENGINE_BALANCER: {backend.url} is back")
+        backend.healthy = True
+
+    async def _poll_loop(self):
+        while True:
+            await asyncio.gather(*(self._poll(backend) for backend in self.backends))
+            self.changed.set()
+            await asyncio.sleep(BRIDGE_ENGINE_STATUS_SECS)
+
+
+ENGINE_BALANCER = None  # EngineBalancer of this process, set by start_engines()
+
+
+# ========== WARM ENGINE POOL ==========
+async def open_engine_session(ws_url: str, timeout: float = 15.0):
+    """Connect to PersonaPlex and wait for the 0x00 handshake, sent once the system prompts are prefilled."""
+    ws = await websockets.connect(
+        ws_url,
+        ssl=ssl_no_verify() if ws_url.startswith("wss://") else None,
+        max_size=None,
+        ping_interval=5,
+        ping_timeout=5,
+        close_timeout=2,
+        open_timeout=10,
+    )
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            msg = await asyncio.wait_for(ws.recv(), timeout=max(0.0, deadline - time.monotonic()))
+            if isinstance(msg, (bytes, bytearray)) and len(msg) > 0:
+                if msg[0] == 0x00:
+                    return ws
+                logger.warning(f"Unexpected frame type {msg[0]:02x} during handshake")
+    except BaseException:
+        await ws.close()
+        raise
+
+
+class EnginePool:
+    """Engine sessions connected and past the handshake, ready to be attached to incoming calls.
+
+    A background task keeps `size` sessions ready, opening the missing ones in parallel.
+    Sessions older than `ttl` seconds, or closed by the engine, are closed and replaced,
+    so that a call never gets a stale connection. acquire() never waits: when the pool is
+    empty the call connects by itself, as without the pool.
+    """
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self.ready = deque()  # (ws, ready_ts, backend), oldest first
+        self.pending = 0
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.closed = False
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'failures': 0}
+
+    def start(self):
+        self.task = asyncio.create_task(self._refill_loop())
+        logger.info(f"ENGINE_POOL: started, size={self.size} ttl={self.ttl}s")
+
+    async def stop(self):
+        self.closed = True
+        if self.task:
+            self.task.cancel()
+        while self.ready:
+            ws, _, backend = self.ready.popleft()
+            ENGINE_BALANCER.release(backend)
+            await ws.close()
+
+    def acquire(self):
+        """Return a ready engine session and its EngineBackend, or None if there is none.
+
+        The caller owns the engine session of the backend, and releases it from ENGINE_BALANCER.
+        """
+        if self.closed:
+            return None
+        now = time.monotonic()
+        session = None
+        while self.ready:
+            ws, ready_ts, backend = self.ready.popleft()
+            if ws.open and now - ready_ts < self.ttl:
+                session = (ws, backend)
+                break
+            self._discard(ws, backend)
+        self.stats['hits' if session else 'misses'] += 1
+        self.wakeup.set()
+        return session
+
+    def _discard(self, ws, backend):
+        self.stats['expired'] += 1
+        ENGINE_BALANCER.release(backend)
+        asyncio.create_task(ws.close())
+
+    async def _fill_one(self):
+        backend = None
+        try:
+            backend = await ENGINE_BALANCER.acquire()
+            if backend is None:
+                await asyncio.sleep(1.0)  # All the engines are full, check again later
+                return
+            ws = await open_engine_session(backend.ws_url)
+            if self.closed:
+                ENGINE_BALANCER.release(backend)
+                await ws.close()
+            else:
+                self.ready.append((ws, time.monotonic(), backend))
+        except Exception as e:
+            self.stats['failures'] += 1
+            logger.warning(f"ENGINE_POOL: failed to open a session: {e!r}")
+            if not isinstance(e, asyncio.TimeoutError):  # A busy engine is slow to prefill, not down
+                ENGINE_BALANCER.mark_failed(backend, e)
+            ENGINE_BALANCER.release(backend)
+            await asyncio.sleep(1.0)  # Do not hammer an engine that is down
+        finally:
+            self.pending -= 1
+            self.wakeup.set()
+
+    async def _refill_loop(self):
+        while True:
+            now = time.monotonic()
+            fresh = deque()
+            for ws, ready_ts, backend in self.ready:
+                if ws.open and now - ready_ts < self.ttl:
+                    fresh.append((ws, ready_ts, backend))
+                else:
+                    self._discard(ws, backend)
+            self.ready = fresh
+            for _ in range(self.size - len(self.ready) - self.pending):
+                self.pending += 1
+                asyncio.create_task(self._fill_one())
+            self.wakeup.clear()
+            # Wake up on acquire/refill, or in time for the next expiry
+            timeout = self.ttl - (now - self.ready[0][1]) if self.ready else self.ttl
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=max(0.1, min(timeout, 5.0)))
+            except asyncio.TimeoutError:
+                pass
+
+
+ENGINE_POOL = None  # EnginePool of this process, if BRIDGE_ENGINE_POOL_SIZE > 0
+
+
+def start_engines():
+    """Start the engine balancer, and the warm engine pool if enabled, of this process."""
+    global ENGINE_BALANCER, ENGINE_POOL
+    ENGINE_BALANCER = EngineBalancer(ENGINE_URLS)
+    ENGINE_BALANCER.start()
+    if BRIDGE_ENGINE_POOL_SIZE > 0:
+        ENGINE_POOL = EnginePool(BRIDGE_ENGINE_POOL_SIZE, BRIDGE_ENGINE_POOL_TTL)
+        ENGINE_POOL.start()
+
+
 # ========== HELPER FUNCTIONS ==========
 def ssl_no_verify():
     """Create SSL context that doesn't verify certificates."""
@@ -597,6 +1919,9 @@ async def handler(exotel_ws, path=None):
     
     # Initialize observability
     obs = PipelineObservability(session_id)
+    tracer = FrameTracer(session_id) if BRIDGE_TRACE else None
+    WORKER_STATS['calls_total'] += 1
+    WORKER_STATS['sessions'][session_id] = obs
     
     # Artifact capture setup
     capture_enabled = os.getenv("CAPTURE", "0") == "1"
@@ -619,6 +1944,7 @@ async def handler(exotel_ws, path=None):
     
     # Connection state
     pp_ws = None
+    engine_backend = None  # EngineBackend of the call, released at the end
     resampler_8k_to_24k = None
     resampler_24k_to_8k = None
     opus_writer = None
@@ -635,28 +1961,64 @@ async def handler(exotel_ws, path=None):
     last_decoder_pcm_ts = None
     
     # Queues (defined once in handler scope - CREATE IMMEDIATELY)
-    pcm8k_queue = asyncio.Queue(maxsize=500)  # Exotel PCM8k frames
-    pcm24k_queue = asyncio.Queue(maxsize=500)  # Resampled PCM24k chunks
-    opus_queue = asyncio.Queue(maxsize=500)  # Queue for Ogg Opus payloads
-    pcm_out_queue = asyncio.Queue(maxsize=500)  # Queue for PCM8k chunks (20ms frames)
+    # Exotel PCM8k: jitter buffer fed to the engine on the 20ms clock of resample_loop
+    inbound = InboundJitterBuffer(
+        sample_rate=EXOTEL_SR,
+        latency_ms=BRIDGE_INBOUND_JITTER_MS,
+        max_ms=BRIDGE_INBOUND_MAX_MS,
+        counters=obs.counters,
+    )
+    # Chunks carry the monotonic time their audio arrived (from Exotel, from the engine) for the latency histograms
+    pcm24k_queue = asyncio.Queue(maxsize=500)  # (PCM24k, arrival) chunks
+    opus_queue = asyncio.Queue(maxsize=500)  # (Ogg Opus payload, arrival)
+    # PCM8k to Exotel: jitter buffer played out on the 20ms clock of exotel_send_loop
+    playout = PlayoutBuffer(
+        frame_bytes=EXOTEL_SR * 2 * 20 // 1000,
+        target_ms=BRIDGE_PLAYOUT_TARGET_MS,
+        min_ms=BRIDGE_PLAYOUT_MIN_MS,
+        max_ms=BRIDGE_PLAYOUT_MAX_MS,
+        counters=obs.counters,
+    )
+    # End of the caller speech -> first agent audio
+    response_latency = ResponseLatencyTracker(frame_ms=inbound.frame_ms)
     
     # Log queue identity at creation
-    logger.info(f"QUEUE_CREATE: pcm8k_queue id={id(pcm8k_queue)}")
     logger.info(f"QUEUE_CREATE: pcm24k_queue id={id(pcm24k_queue)}")
     logger.info(f"QUEUE_CREATE: opus_queue id={id(opus_queue)}")
-    logger.info(f"QUEUE_CREATE: pcm_out_queue id={id(pcm_out_queue)}")
     
     try:
+        # Attach a pooled engine session, already past the handshake, if there is one ready
+        pooled = False
+        if ENGINE_POOL is not None:
+            pooled_session = ENGINE_POOL.acquire()
+            if pooled_session is not None:
+                pp_ws, engine_backend = pooled_session
+                pooled = True
+            logger.info(
+                f"ENGINE_POOL: {'attached a pooled session' if pooled else 'empty, connecting'} "
+                f"(ready={len(ENGINE_POOL.ready)} pending={ENGINE_POOL.pending} stats={ENGINE_POOL.stats})"
+            )
+        
+        # Pick the least loaded engine, fail fast (or after BRIDGE_ENGINE_QUEUE_SECS) when they are all full
+        if not pooled:
+            engine_backend = await ENGINE_BALANCER.acquire(timeout=BRIDGE_ENGINE_QUEUE_SECS)
+            if engine_backend is None:
+                logger.error(f"ENGINE_BALANCER: all engines are full, rejecting the call ({ENGINE_BALANCER.describe()})")
+                logger.info(f"SERVER_INITIATED_EXOTEL_CLOSE: session={session_id} reason=engines_full")
+                await exotel_ws.close()
+                return
+            logger.info(f"ENGINE_BALANCER: routing to {engine_backend.describe()}")
+        
         # Connect to PersonaPlex with retry
-        max_retries = 5
+        max_retries = 0 if pooled else 5
         retry_delay = 1.0
         
         for attempt in range(max_retries):
             try:
                 logger.info(f"Connecting to PersonaPlex (attempt {attempt + 1}/{max_retries})")
                 pp_ws = await websockets.connect(
-                    PERSONAPLEX_WS,
-                    ssl=ssl_no_verify(),
+                    engine_backend.ws_url,
+                    ssl=ssl_no_verify() if engine_backend.ws_url.startswith("wss://") else None,
                     max_size=None,
                     ping_interval=5,
                     ping_timeout=5,
@@ -672,6 +2034,7 @@ async def handler(exotel_ws, path=None):
                     retry_delay *= 2
                 else:
                     logger.error(f"Failed to connect to PersonaPlex after {max_retries} attempts: {e}")
+                    ENGINE_BALANCER.mark_failed(engine_backend, e)
                     await exotel_ws.close()
                     return
         
@@ -686,8 +2049,8 @@ async def handler(exotel_ws, path=None):
             return
         
         # Wait for handshake (0x00 byte)
-        handshake_received = False
-        for _ in range(150):  # 15 second timeout
+        handshake_received = pooled
+        for _ in range(0 if pooled else 150):  # 15 second timeout
             try:
                 msg = await asyncio.wait_for(pp_ws.recv(), timeout=0.1)
                 if isinstance(msg, (bytes, bytearray)) and len(msg) > 0:
@@ -712,8 +2075,9 @@ async def handler(exotel_ws, path=None):
             return
         
         # PHASE 2: Initialize Python-based resamplers (no FFmpeg subprocess buffering)
-        resampler_8k_to_24k = PythonResampler(EXOTEL_SR, MODEL_SR, "8k->24k")
-        resampler_24k_to_8k = PythonResampler(MODEL_SR, EXOTEL_SR, "24k->8k")
+        # Streaming resamplers keep the filter state across the 20ms chunks.
+        resampler_8k_to_24k = StreamingResampler(EXOTEL_SR, MODEL_SR, "8k->24k")
+        resampler_24k_to_8k = StreamingResampler(MODEL_SR, EXOTEL_SR, "24k->8k")
         
         try:
             resampler_8k_to_24k.start()
@@ -729,250 +2093,28 @@ async def handler(exotel_ws, path=None):
             await exotel_ws.close()
             return
         
-        # PHASE B: Initialize FFmpeg Opus encoder for streaming encoding
-        # Define FfmpegOpusEncoder class inline
-        class FfmpegOpusEncoder:
-            """Manages a persistent ffmpeg subprocess for PCM24k to raw Opus encoding (not Ogg).
-            
-            PHASE 2: Engine expects raw Opus packets (sphn.OpusStreamReader.append_bytes accepts ogg/opus bytes).
-            We use raw Opus format (-f opus) instead of Ogg container for better streaming performance.
-            """
-            def __init__(self, sample_rate=24000, observability=None):
-                self.sample_rate = sample_rate
-                self.proc = None
-                self._closed = False
-                self.tag = "opus_encoder"
-                self.stderr_buffer = bytearray()
-                self.stderr_task = None
-                self.encode_in_bytes_total = 0
-                self.encode_out_bytes_total = 0
-                self.encode_out_chunks_total = 0
-                self.last_log_time = time.monotonic()
-                self.observability = observability
-            
-            def start(self):
-                """Start ffmpeg encoder subprocess for raw Opus packets."""
-                try:
-                    import shlex
-                    # Use Ogg Opus format (engine expects Ogg based on logs showing OggS=True)
-                    # Add -flush_packets 1 to force immediate output
-                    command = [
-                        "ffmpeg",
-                        "-hide_banner",
-                        "-loglevel", "error",
-                        "-f", "s16le",
-                        "-ar", str(self.sample_rate),
-                        "-ac", "1",
-                        "-i", "pipe:0",
-                        "-c:a", "libopus",
-                        "-application", "voip",
-                        "-frame_duration", "20",
-                        "-vbr", "off",
-                        "-b:a", "24k",
-                        "-flush_packets", "1",  # Force immediate packet output
-                        "-f", "ogg",  # Ogg Opus format (matches engine output)
-                        "pipe:1"
-                    ]
-                    logger.info(f"Opus encoder cmd: {' '.join(shlex.quote(x) for x in command)}")
-                    
-                    self.proc = subprocess.Popen(
-                        command,
-                        stdin=subprocess.PIPE,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        bufsize=0,
-                    )
-                    if self.proc.poll() is not None:
-                        stderr = self.proc.stderr.read().decode(errors="ignore")
-                        raise RuntimeError(f"{self.tag} exited immediately: {stderr}")
-                    
-                    logger.info(
-                        f"{self.tag} started: PCM{self.sample_rate // 1000}k → Ogg Opus, "
-                        f"PID={self.proc.pid}, stdin_open={self.proc.stdin is not None}, "
-                        f"stdout_open={self.proc.stdout is not None}, stderr_open={self.proc.stderr is not None}"
-                    )
-                    
-                    # STEP 3: Start async stderr reader task
-                    self.stderr_task = asyncio.create_task(self._stderr_reader())
-                    
-                except FileNotFoundError:
-                    raise RuntimeError(f"ffmpeg not found. Install with: apt-get install -y ffmpeg")
-                except Exception as e:
-                    raise RuntimeError(f"{self.tag} failed to start: {e}")
-            
-            async def _stderr_reader(self):
-                """Continuously read and log stderr with prefix [ffmpeg-enc]. Uses non-blocking read1."""
-                try:
-                    loop = asyncio.get_event_loop()
-                    line_buf = bytearray()
-                    while not self._closed and self.proc and self.proc.poll() is None:
-                        try:
-                            # Use read1 (non-blocking) with small chunks
-                            chunk = await asyncio.wait_for(
-                                loop.run_in_executor(None, lambda: self.proc.stderr.read1(256)),
-                                timeout=0.1
-                            )
-                            if chunk:
-                                self.stderr_buffer.extend(chunk)
-                                if len(self.stderr_buffer) > 1024:
-                                    self.stderr_buffer = self.stderr_buffer[-512:]
-                                
-                                # Process complete lines
-                                line_buf.extend(chunk)
-                                while b'\n' in line_buf:
-                                    line, line_buf = line_buf.split(b'\n', 1)
-                                    if line:
-                                        line_str = line.decode(errors="ignore").strip()
-                                        if line_str:
-                                            logger.warning(f"[ffmpeg-enc] {line_str}")
-                            elif self.proc.poll() is not None:
-                                break
-                        except asyncio.TimeoutError:
-                            continue
-                        except Exception as e:
-                            logger.error(f"[ffmpeg-enc] stderr reader error: {e}", exc_info=True)
-                            break
-                except Exception as e:
-                    logger.error(f"[ffmpeg-enc] stderr reader fatal: {e}", exc_info=True)
-            
-            def write(self, pcm_bytes: bytes):
-                """Write PCM bytes to encoder input with logging."""
-                if self._closed or self.proc is None:
-                    return False
-                try:
-                    self.proc.stdin.write(pcm_bytes)
-                    self.proc.stdin.flush()
-                    self.encode_in_bytes_total += len(pcm_bytes)
-                    if self.observability:
-                        self.observability.update_counter('opus_encode_in_pcm_bytes', bytes_delta=len(pcm_bytes))
-                        self.observability.update_activity('encode_in')
-                    
-                    # Rate-limited logging (every 1 second)
-                    now = time.monotonic()
-                    if now - self.last_log_time >= 1.0:
-                        logger.debug(
-                            f"{self.tag} write: total_in={self.encode_in_bytes_total}b, "
-                            f"total_out={self.encode_out_bytes_total}b, chunks={self.encode_out_chunks_total}"
-                        )
-                        self.last_log_time = now
-                    
-                    return True
-                except BrokenPipeError:
-                    logger.error(f"{self.tag} write: BrokenPipeError - process may have died")
-                    self._closed = True
-                    return False
-                except OSError as e:
-                    logger.error(f"{self.tag} write: OSError: {e}")
-                    self._closed = True
-                    return False
-            
-            async def read(self, nbytes: int, timeout: float = 0.1):
-                """Read encoded Ogg Opus bytes (async) with metrics.
-                
-                Uses read1 (non-blocking) if available, else read with timeout.
-                Returns empty bytes on timeout, None on error.
-                """
-                if self._closed or self.proc is None:
-                    return None
-                try:
-                    loop = asyncio.get_event_loop()
-                    # Try read1 first (non-blocking), fallback to read
-                    if hasattr(self.proc.stdout, 'read1'):
-                        data = await asyncio.wait_for(
-                            loop.run_in_executor(None, self.proc.stdout.read1, min(nbytes, 4096)),
-                            timeout=timeout
-                        )
-                    else:
-                        data = await asyncio.wait_for(
-                            loop.run_in_executor(None, self.proc.stdout.read, nbytes),
-                            timeout=timeout
-                        )
-                    if data:
-                        self.encode_out_bytes_total += len(data)
-                        self.encode_out_chunks_total += 1
-                        if self.observability:
-                            self.observability.update_counter('opus_encode_out_bytes', bytes_delta=len(data))
-                            self.observability.update_activity('encode_out')
-                        
-                        # Rate-limited logging (every 1 second)
-                        now = time.monotonic()
-                        if now - self.last_log_time >= 1.0:
-                            logger.debug(
-                                f"[ffmpeg-{self.tag}] read: got {len(data)} bytes, "
-                                f"total_out={self.encode_out_bytes_total}b, chunks={self.encode_out_chunks_total}"
-                            )
-                            self.last_log_time = now
-                    elif self.proc.poll() is not None:
-                        logger.warning(f"[ffmpeg-{self.tag}] read: EOF and process exited (code={self.proc.returncode})")
-                        self._closed = True
-                    return data if data else b""
-                except asyncio.TimeoutError:
-                    return b""  # Timeout is normal, return empty bytes
-                except Exception as e:
-                    logger.error(f"[ffmpeg-{self.tag}] read error: {e}", exc_info=True)
-                    self._closed = True
-                    return None
-            
-            def check_stderr(self):
-                """Check and return any stderr output from ffmpeg."""
-                if self.proc and self.proc.stderr:
-                    try:
-                        err = self.proc.stderr.read()
-                        if err:
-                            self.stderr_buffer.extend(err)
-                            if len(self.stderr_buffer) > 1024:
-                                self.stderr_buffer = self.stderr_buffer[-512:]
-                            return self.stderr_buffer.decode(errors="ignore")
-                    except Exception:
-                        pass
-                return None
-            
-            def stop(self):
-                """Stop and cleanup encoder."""
-                self._closed = True
-                
-                # Cancel stderr reader task
-                if self.stderr_task and not self.stderr_task.done():
-                    self.stderr_task.cancel()
-                
-                if self.proc:
-                    try:
-                        self.proc.stdin.close()
-                    except Exception:
-                        pass
-                    try:
-                        self.proc.stdout.close()
-                    except Exception:
-                        pass
-                    try:
-                        self.proc.terminate()
-                        self.proc.wait(timeout=2)
-                    except subprocess.TimeoutExpired:
-                        self.proc.kill()
-                    except Exception:
-                        pass
-                    self.proc = None
-                    logger.info(
-                        f"{self.tag} stopped: total_in={self.encode_in_bytes_total}b, "
-                        f"total_out={self.encode_out_bytes_total}b, chunks={self.encode_out_chunks_total}"
-                    )
-        
-        # Initialize FFmpeg Opus encoder
+        # Initialize Opus encoder (in-process sphn, or FFmpeg subprocess fallback)
+        use_ffmpeg_codec = BRIDGE_FFMPEG_CODEC or sphn is None
+        if use_ffmpeg_codec and not BRIDGE_FFMPEG_CODEC:
+            logger.warning("sphn not installed, falling back to the FFmpeg Opus codec")
         opus_encoder = None
         try:
-            opus_encoder = FfmpegOpusEncoder(MODEL_SR, observability=obs)
+            if use_ffmpeg_codec:
+                opus_encoder = FfmpegOpusEncoder(MODEL_SR, observability=obs)
+            else:
+                opus_encoder = SphnOpusEncoder(MODEL_SR, observability=obs)
             opus_encoder.start()
-            logger.info("FFmpeg Opus encoder started")
+            logger.info(f"Opus encoder started ({'ffmpeg' if use_ffmpeg_codec else 'in-process'})")
         except Exception as e:
-            logger.error(f"Failed to start FFmpeg Opus encoder: {e}", exc_info=True)
+            logger.error(f"Failed to start Opus encoder: {e}", exc_info=True)
             await exotel_ws.close()
             return
         
-        # Keep sphn as fallback (not used if FFmpeg works)
-        opus_writer = None
-        
-        # Initialize FFmpeg Ogg decoder for inbound (Engine → Exotel)
-        ogg_decoder = FfmpegOggDecoder(observability=obs)
+        # Initialize Ogg decoder for inbound (Engine → Exotel)
+        if use_ffmpeg_codec:
+            ogg_decoder = FfmpegOggDecoder(observability=obs)
+        else:
+            ogg_decoder = SphnOpusDecoder(MODEL_SR, observability=obs)
         ogg_decoder.start()
         
         # Frame sizes
@@ -999,7 +2141,7 @@ async def handler(exotel_ws, path=None):
         # Heartbeat task - logs pipeline status every 1 second
         async def heartbeat_task():
             """Log pipeline heartbeat with deltas and queue sizes."""
-            logger.info(f"heartbeat_task: ENTRY queues: pcm8k={id(pcm8k_queue)}, pcm24k={id(pcm24k_queue)}, opus={id(opus_queue)}, pcm_out={id(pcm_out_queue)}")
+            logger.info(f"heartbeat_task: ENTRY queues: pcm24k={id(pcm24k_queue)}, opus={id(opus_queue)}")
             while connection_active:
                 try:
                     await asyncio.sleep(1.0)
@@ -1008,13 +2150,16 @@ async def handler(exotel_ws, path=None):
                     
                     # Access queues directly (they're in handler scope)
                     queues = {
-                        'pcm8k_q': pcm8k_queue.qsize(),
+                        'inbound_ms': inbound.depth_ms(),
                         'pcm24k_q': pcm24k_queue.qsize(),
                         'ogg_q': opus_queue.qsize(),
-                        'pcm_out_q': pcm_out_queue.qsize(),
+                        'playout_ms': playout.depth_ms(),
+                        'playout_target_ms': playout.target_ms(),
                     }
                     hb_line = obs.format_heartbeat(queues)
                     logger.info(hb_line)
+                    if BRIDGE_TRACE:
+                        tracer.flush()
                 except Exception as e:
                     logger.exception(f"FATAL: heartbeat_task crashed: {e}")
                     raise
@@ -1023,9 +2168,7 @@ async def handler(exotel_ws, path=None):
         # Three-stage streaming pipeline with queues (queues already created above)
         
         async def exotel_to_engine():
-            """Stage 1 - Receive Exotel frames and push to queue."""
-            # Verify queue identity
-            logger.info(f"exotel_to_engine: ENTRY pcm8k_queue id={id(pcm8k_queue)}")
+            """Stage 1 - Receive Exotel frames and push them to the inbound jitter buffer."""
             logger.info("exotel_to_engine: started")
             last_audio_time = None
             SILENCE_TAIL_MS = 500  # 500ms silence to trigger engine response
@@ -1036,7 +2179,7 @@ async def handler(exotel_ws, path=None):
                         break
                     
                     try:
-                        data = json.loads(msg)
+                        data, payload = parse_message(msg)
                     except json.JSONDecodeError:
                         logger.warning(f"Invalid JSON from Exotel: {msg[:100]}")
                         continue
@@ -1062,18 +2205,9 @@ async def handler(exotel_ws, path=None):
                             f"drain_after_stop={EXOTEL_DRAIN_AFTER_STOP} "
                             f"next_action=break_exotel_to_engine_loop"
                         )
-                        # Send silence tail
+                        # Send silence tail, then end of input to the pipeline
                         silence_pcm8k = np.zeros(int(EXOTEL_SR * SILENCE_TAIL_MS / 1000), dtype=np.int16)
-                        silence_bytes = silence_pcm8k.tobytes()
-                        try:
-                            pcm8k_queue.put_nowait(silence_bytes)
-                        except asyncio.QueueFull:
-                            pass
-                        # Signal end of input to pipeline
-                        try:
-                            await pcm8k_queue.put(None)
-                        except Exception:
-                            pass
+                        inbound.close(silence_pcm8k.tobytes())
                         # If drain mode enabled, set flag but don't break yet
                         if EXOTEL_DRAIN_AFTER_STOP:
                             drain_mode = True
@@ -1081,22 +2215,20 @@ async def handler(exotel_ws, path=None):
                         break
                     
                     if event_type == "media":
-                        payload = data.get("media", {}).get("payload")
                         if not payload:
                             logger.warning("Media event with no payload")
                             continue
                         
                         try:
-                            pcm8k = base64.b64decode(payload)
+                            pcm8k = decode_payload(payload)
                             obs.update_counter('exotel_in_frames', delta=1, bytes_delta=len(pcm8k))
                             obs.update_counter('pcm8k_in_bytes', bytes_delta=len(pcm8k))
                             obs.update_activity('exotel_in')
                             obs.update_activity('pcm8k')
                             last_audio_time = time.monotonic()
                             
-                            # PHASE 1: Live debugging - Exotel WS receive
-                            print(f"[LIVE][EXOTEL_IN] bytes={len(pcm8k)} q_pcm8k={pcm8k_queue.qsize()} t={time.time()}")
-                            logger.info(f"exotel_to_engine: received media frame {obs.counters['exotel_in_frames']}: {len(pcm8k)} bytes")
+                            if BRIDGE_TRACE:
+                                tracer.record(TRACE_EXOTEL_IN, len(pcm8k), inbound.depth_ms())
                             last_exotel_inbound_ts = time.monotonic()
                             
                             # Artifact capture
@@ -1109,38 +2241,24 @@ async def handler(exotel_ws, path=None):
                             if obs.counters['exotel_in_frames'] <= 5:
                                 logger.info(f"exotel_to_engine: received media frame {obs.counters['exotel_in_frames']}: {len(pcm8k)} bytes")
                             
-                            # Push to queue (non-blocking)
-                            try:
-                                pcm8k_queue.put_nowait(pcm8k)
-                                # PHASE 1: Live debugging - pcm8k_queue.put()
-                                print(f"[LIVE][PCM8K_PUT] bytes={len(pcm8k)} q_pcm8k={pcm8k_queue.qsize()} t={time.time()}")
-                                if obs.counters['exotel_in_frames'] <= 5:
-                                    logger.info(f"exotel_to_engine: put {len(pcm8k)} bytes into pcm8k_queue (qsize={pcm8k_queue.qsize()})")
-                            except asyncio.QueueFull:
-                                # Drop oldest
-                                try:
-                                    pcm8k_queue.get_nowait()
-                                    pcm8k_queue.put_nowait(pcm8k)
-                                    logger.warning("pcm8k_queue full, dropped oldest")
-                                except asyncio.QueueEmpty:
-                                    pass
+                            # Reordered on the media timestamp/sequence, played out by resample_loop
+                            inbound.push(pcm8k, media_position(data), last_exotel_inbound_ts)
+                            if BRIDGE_TRACE:
+                                tracer.record(TRACE_PCM8K_PUT, len(pcm8k), inbound.depth_ms())
+                            if obs.counters['exotel_in_frames'] <= 5:
+                                logger.info(f"exotel_to_engine: buffered {len(pcm8k)} bytes (inbound={inbound.depth_ms()}ms)")
                         except Exception as e:
                             logger.exception(f"FATAL: Error processing media frame: {e}")
                             raise
                 
-                # After Exotel closes, send silence tail
-                if last_audio_time:
-                    logger.info("Sending silence tail to trigger engine response")
-                    silence_pcm8k = np.zeros(int(EXOTEL_SR * SILENCE_TAIL_MS / 1000), dtype=np.int16)
-                    silence_bytes = silence_pcm8k.tobytes()
-                    try:
-                        pcm8k_queue.put_nowait(silence_bytes)
-                    except asyncio.QueueFull:
-                        pass
-                    # Signal end of input
-                    await pcm8k_queue.put(None)
-                else:
-                    await pcm8k_queue.put(None)
+                # After Exotel closes, send silence tail (unless the stop event already did)
+                if not inbound.closed:
+                    if last_audio_time:
+                        logger.info("Sending silence tail to trigger engine response")
+                        silence_pcm8k = np.zeros(int(EXOTEL_SR * SILENCE_TAIL_MS / 1000), dtype=np.int16)
+                        inbound.close(silence_pcm8k.tobytes())
+                    else:
+                        inbound.close()
                     
             except websockets.exceptions.ConnectionClosed:
                 logger.info("Exotel connection closed (normal)")
@@ -1152,55 +2270,63 @@ async def handler(exotel_ws, path=None):
         
         # Stage 2 - Resampler loop (8k → 24k)
         async def resample_loop():
-            """Continuously resample PCM8k to PCM24k."""
-            # Verify queue identity
-            logger.info(f"resample_loop: ENTRY pcm8k_queue id={id(pcm8k_queue)}, pcm24k_queue id={id(pcm24k_queue)}")
-            last_progress_ts = time.monotonic()
+            """Play the inbound jitter buffer out on a 20ms clock and resample PCM8k to PCM24k."""
+            logger.info(f"resample_loop: ENTRY pcm24k_queue id={id(pcm24k_queue)}")
             frames_processed = 0
+            frame_secs = inbound.frame_ms / 1000
+            next_tick = time.monotonic()
             
             try:
                 while connection_active:
                     try:
-                        # Watchdog: if queue has items but no progress for 2s, abort
-                        if pcm8k_queue.qsize() > 0:
-                            if time.monotonic() - last_progress_ts > 2.0:
-                                logger.error(f"PIPELINE STALL DETECTED at resample_loop: queue_size={pcm8k_queue.qsize()}, no progress for {time.monotonic() - last_progress_ts:.1f}s")
-                                raise RuntimeError("resample_loop stalled")
+                        if inbound.finished():  # End of input, tail included
+                            logger.info("resample_loop: inbound audio finished, exiting")
+                            break
                         
-                        pcm8k = await asyncio.wait_for(pcm8k_queue.get(), timeout=1.0)
+                        # Wait for the next tick; after a stall of the event loop, catch up on the
+                        # missed frames, or restart the clock if too many were missed
+                        next_tick += frame_secs
+                        delay = next_tick - time.monotonic()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                        elif delay < -5 * frame_secs:
+                            next_tick = time.monotonic()
                         
-                        # Log first get
-                        if frames_processed == 0:
-                            logger.info(f"resample_loop: FIRST_GET pcm8k_queue id={id(pcm8k_queue)}, got {len(pcm8k) if pcm8k else 0} bytes")
+                        pcm8k = inbound.pop_frame()
+                        if pcm8k is None:  # No audio from Exotel yet
+                            continue
+                        arrival = inbound.frame_arrival  # None for silence
+                        response_latency.caller_frame(pcm8k, arrival)
                         
-                        if pcm8k is None:  # End signal
-                            logger.info("resample_loop: received None signal, exiting")
-                            break
+                        # Log first frame
+                        if frames_processed == 0:
+                            logger.info(f"resample_loop: FIRST_FRAME {len(pcm8k)} bytes, inbound={inbound.depth_ms()}ms")
                         
                         assert pcm8k, "Got empty PCM8k frame"
                         assert len(pcm8k) > 0, f"Got zero-length PCM8k frame"
                         
-                        logger.debug(f"resample_loop: got {len(pcm8k)} bytes")
+                        if LOG_DEBUG:
+                            logger.debug(f"resample_loop: got {len(pcm8k)} bytes")
                         frames_processed += 1
-                        last_progress_ts = time.monotonic()
                         
                         obs.update_counter('resample_8k_to_24k_in_bytes', bytes_delta=len(pcm8k))
                         obs.update_activity('resample_in')
                         
-                        # PHASE 1: Live debugging - resample_loop before resampler
-                        print(f"[LIVE][RESAMPLE][IN] bytes={len(pcm8k)} q_pcm8k={pcm8k_queue.qsize()} q_pcm24k={pcm24k_queue.qsize()} t={time.time()}")
+                        if BRIDGE_TRACE:
+                            tracer.record(TRACE_RESAMPLE_IN, len(pcm8k), inbound.depth_ms(), pcm24k_queue.qsize())
                         
                         # Use Python resampler (synchronous, no subprocess)
                         pcm24k = resampler_8k_to_24k.resample(pcm8k)
                         
-                        # PHASE 1: Live debugging - resample_loop after resampler
-                        print(f"[LIVE][RESAMPLE][OUT] bytes={len(pcm24k)} q_pcm8k={pcm8k_queue.qsize()} q_pcm24k={pcm24k_queue.qsize()} t={time.time()}")
+                        if BRIDGE_TRACE:
+                            tracer.record(TRACE_RESAMPLE_OUT, len(pcm24k), inbound.depth_ms(), pcm24k_queue.qsize())
                         
                         if not pcm24k or len(pcm24k) == 0:
                             logger.error(f"FATAL: Python resampler returned empty output for {len(pcm8k)} bytes input")
                             raise RuntimeError("Resampler returned empty output")
                         
-                        logger.debug(f"resample_loop: produced {len(pcm24k)} bytes")
+                        if LOG_DEBUG:
+                            logger.debug(f"resample_loop: produced {len(pcm24k)} bytes")
                         obs.update_counter('resample_8k_to_24k_out_bytes', bytes_delta=len(pcm24k))
                         obs.update_activity('resample_out')
                         
@@ -1213,20 +2339,20 @@ async def handler(exotel_ws, path=None):
                         
                         # Push to next stage
                         try:
-                            await pcm24k_queue.put(pcm24k)
-                            # PHASE 1: Live debugging - pcm24k_queue.put()
-                            print(f"[LIVE][PCM24K_PUT] bytes={len(pcm24k)} q_pcm24k={pcm24k_queue.qsize()} t={time.time()}")
+                            await pcm24k_queue.put((pcm24k, arrival))
+                            if arrival is not None:
+                                obs.record_latency('exotel_in_to_resampled', arrival)
+                            if BRIDGE_TRACE:
+                                tracer.record(TRACE_PCM24K_PUT, len(pcm24k), pcm24k_queue.qsize())
                             if frames_processed <= 5:
                                 logger.info(f"resample_loop: put {len(pcm24k)} bytes into pcm24k_queue (qsize={pcm24k_queue.qsize()})")
                         except asyncio.QueueFull:
                             try:
                                 pcm24k_queue.get_nowait()
-                                await pcm24k_queue.put(pcm24k)
+                                await pcm24k_queue.put((pcm24k, arrival))
                                 logger.warning("pcm24k_queue full, dropped oldest")
                             except asyncio.QueueEmpty:
                                 pass
-                    except asyncio.TimeoutError:
-                        continue
                     except Exception as e:
                         # PHASE 2: Live debugging - explicit exception handling
                         print(f"[LIVE][ERROR][RESAMPLE] {repr(e)} t={time.time()}")
@@ -1241,6 +2367,14 @@ async def handler(exotel_ws, path=None):
                 raise
             finally:
                 logger.info(f"resample_loop: exiting, processed={frames_processed}, resample_out={obs.counters['resample_8k_to_24k_out_bytes']}b")
+                logger.info(
+                    f"INBOUND lost_frames={obs.counters['inbound_lost_frames']} "
+                    f"late_frames={obs.counters['inbound_late_frames']} "
+                    f"reordered_frames={obs.counters['inbound_reordered_frames']} "
+                    f"underrun_frames={obs.counters['inbound_underrun_frames']} "
+                    f"dropped_frames={obs.counters['inbound_dropped_frames']} "
+                    f"drift={inbound.drift_ms:.0f}ms jitter={inbound.jitter_ms():.0f}ms"
+                )
                 resampler_8k_to_24k.stop()
         
         # Stage 3 - Encoder loop (PCM24k → Ogg Opus → engine)
@@ -1262,11 +2396,22 @@ async def handler(exotel_ws, path=None):
             first_output_sent = False
             first_output_log_time = 0
             
-            # PCM buffering: accumulate 200ms @ 24kHz = 9600 bytes before writing
-            THRESHOLD_MS = 200
+            # PCM buffering: accumulate 200ms @ 24kHz = 9600 bytes before writing to FFmpeg,
+            # the in-process encoder takes every 20ms frame as it comes
+            THRESHOLD_MS = 200 if use_ffmpeg_codec else AUDIO_CHUNK_MS
             THRESHOLD_BYTES = int(MODEL_SR * (THRESHOLD_MS / 1000) * 2)  # 24kHz * 0.2s * 2 bytes/sample
             MAX_BUF_BYTES = int(MODEL_SR * 2.0 * 2)  # Cap at 2 seconds
             pcm_buf = bytearray()
+            buffered_arrivals = []  # Exotel arrival times of the chunks in pcm_buf
+            encoding_arrivals = []  # ... of the chunks written to the encoder, not sent yet
+            
+            def record_sent(encoded_ts: float):
+                """Latencies of the chunks written to the encoder, its output was just sent to the engine."""
+                sent_ts = time.monotonic()
+                for arrival in encoding_arrivals:
+                    obs.record_latency('exotel_in_to_encoded', arrival, encoded_ts)
+                    obs.record_latency('exotel_in_to_engine_sent', arrival, sent_ts)
+                encoding_arrivals.clear()
             
             logger.info(f"encode_and_send_loop: PCM buffer threshold={THRESHOLD_BYTES}b ({THRESHOLD_MS}ms), max={MAX_BUF_BYTES}b")
             
@@ -1295,10 +2440,10 @@ async def handler(exotel_ws, path=None):
                     
                     # Non-blocking read with timeout
                     opus_chunk = await opus_encoder.read(4096, timeout=base_timeout)
+                    encoded_ts = time.monotonic()
                     
-                    # PHASE 1: Live debugging - encode_loop after encoder.read()
-                    if opus_chunk:
-                        print(f"[LIVE][ENCODE][OUT] bytes={len(opus_chunk)} t={time.time()}")
+                    if BRIDGE_TRACE and opus_chunk:
+                        tracer.record(TRACE_ENCODE_OUT, len(opus_chunk))
                     
                     if not opus_chunk:
                         empty_reads += 1
@@ -1315,9 +2460,10 @@ async def handler(exotel_ws, path=None):
                     # Send to engine
                     try:
                         frame_data = b"\x01" + opus_chunk
-                        # PHASE 1: Live debugging - engine_ws.send()
-                        print(f"[LIVE][ENGINE_SEND] bytes={len(opus_chunk)} t={time.time()}")
+                        if BRIDGE_TRACE:
+                            tracer.record(TRACE_ENGINE_SEND, len(opus_chunk))
                         await pp_ws.send(frame_data)
+                        record_sent(encoded_ts)
                         engine_send_frames += 1
                         engine_send_bytes += len(opus_chunk)
                         obs.update_counter('engine_out_frames', delta=1, bytes_delta=len(opus_chunk))
@@ -1351,7 +2497,8 @@ async def handler(exotel_ws, path=None):
                         break  # Partial chunk, likely no more data for now
                 
                 if chunks_read > 0:
-                    logger.debug(f"drain_encoder_output: read {chunks_read} chunks, {total_drained} bytes")
+                    if LOG_DEBUG:
+                        logger.debug(f"drain_encoder_output: read {chunks_read} chunks, {total_drained} bytes")
                 elif is_first_drain:
                     logger.warning(f"drain_encoder_output: first drain produced no output (encoder_in={opus_encoder.encode_in_bytes_total}b)")
                 
@@ -1387,7 +2534,8 @@ async def handler(exotel_ws, path=None):
                             )
                             raise RuntimeError("encode_and_send_loop stalled: encoder buffering/no output")
                         
-                        pcm24k = await asyncio.wait_for(pcm24k_queue.get(), timeout=1.0)
+                        item = await asyncio.wait_for(pcm24k_queue.get(), timeout=1.0)
+                        pcm24k, arrival = item if item is not None else (None, None)
                         
                         # Log first get
                         if frames_processed == 0:
@@ -1397,6 +2545,8 @@ async def handler(exotel_ws, path=None):
                             # Flush any remaining buffer
                             if len(pcm_buf) > 0:
                                 logger.info(f"encode_and_send_loop: flushing final buffer ({len(pcm_buf)} bytes)")
+                                encoding_arrivals.extend(buffered_arrivals)
+                                buffered_arrivals.clear()
                                 if opus_encoder.write(bytes(pcm_buf)):
                                     encode_batch_writes += 1
                                     encode_batch_bytes += len(pcm_buf)
@@ -1414,9 +2564,11 @@ async def handler(exotel_ws, path=None):
                                 opus_chunk = await opus_encoder.read(4096, timeout=0.1)
                                 if not opus_chunk:
                                     break
+                                encoded_ts = time.monotonic()
                                 try:
                                     frame_data = b"\x01" + opus_chunk
                                     await pp_ws.send(frame_data)
+                                    record_sent(encoded_ts)
                                     engine_send_frames += 1
                                     engine_send_bytes += len(opus_chunk)
                                     obs.update_counter('engine_out_frames', delta=1, bytes_delta=len(opus_chunk))
@@ -1440,6 +2592,8 @@ async def handler(exotel_ws, path=None):
                         
                         # Accumulate into buffer
                         pcm_buf.extend(pcm24k)
+                        if arrival is not None:
+                            buffered_arrivals.append(arrival)
                         
                         # Check buffer cap (safety)
                         if len(pcm_buf) > MAX_BUF_BYTES:
@@ -1449,9 +2603,11 @@ async def handler(exotel_ws, path=None):
                         if len(pcm_buf) >= THRESHOLD_BYTES:
                             batch = bytes(pcm_buf)
                             pcm_buf.clear()
+                            encoding_arrivals.extend(buffered_arrivals)
+                            buffered_arrivals.clear()
                             
-                            # PHASE 1: Live debugging - encode_loop before encoder.write()
-                            print(f"[LIVE][ENCODE][IN] bytes={len(batch)} q_pcm24k={pcm24k_queue.qsize()} t={time.time()}")
+                            if BRIDGE_TRACE:
+                                tracer.record(TRACE_ENCODE_IN, len(batch), pcm24k_queue.qsize())
                             
                             if not opus_encoder.write(batch):
                                 logger.error(f"FATAL: Opus encoder write failed after {frames_processed} frames")
@@ -1487,9 +2643,11 @@ async def handler(exotel_ws, path=None):
                             # Try a quick read
                             opus_chunk = await opus_encoder.read(4096, timeout=0.05)
                             if opus_chunk:
+                                encoded_ts = time.monotonic()
                                 try:
                                     frame_data = b"\x01" + opus_chunk
                                     await pp_ws.send(frame_data)
+                                    record_sent(encoded_ts)
                                     engine_send_frames += 1
                                     engine_send_bytes += len(opus_chunk)
                                     last_progress_ts = time.monotonic()
@@ -1530,7 +2688,7 @@ async def handler(exotel_ws, path=None):
             nonlocal last_engine_inbound_ts, last_decoder_pcm_ts, last_exotel_outbound_ts, stop_received_ts, drain_mode
             frame_log_count = 0
             last_exotel_out_time = time.time()
-            chunk_size_8k = 320  # 20ms @ 8kHz = 160 samples * 2 bytes = 320 bytes
+            decoding_arrivals = deque()  # Arrival times of the engine frames written to the decoder, not read yet
             
             # STAGE 1: Engine receive loop - instrumented with detailed logging
             async def engine_recv_loop():
@@ -1542,9 +2700,9 @@ async def handler(exotel_ws, path=None):
                         try:
                             # PHASE 1: Longer timeout, better error handling
                             msg = await asyncio.wait_for(pp_ws.recv(), timeout=5.0)
-                            # PHASE 1: Live debugging - engine_ws.recv()
                             if isinstance(msg, (bytes, bytearray)) and len(msg) > 0:
-                                print(f"[LIVE][ENGINE_RECV] bytes={len(msg)} t={time.time()}")
+                                if BRIDGE_TRACE:
+                                    tracer.record(TRACE_ENGINE_RECV, len(msg))
                                 last_engine_inbound_ts = time.monotonic()
                             last_frame_time = time.time()
                         except asyncio.TimeoutError:
@@ -1627,12 +2785,12 @@ async def handler(exotel_ws, path=None):
                             
                             # Non-blocking queue put to prevent backpressure
                             try:
-                                opus_queue.put_nowait(payload)
+                                opus_queue.put_nowait((payload, last_engine_inbound_ts))
                             except asyncio.QueueFull:
                                 # Drop oldest if queue full
                                 try:
                                     opus_queue.get_nowait()
-                                    opus_queue.put_nowait(payload)
+                                    opus_queue.put_nowait((payload, last_engine_inbound_ts))
                                     logger.warning("Opus queue full, dropped oldest packet")
                                 except asyncio.QueueEmpty:
                                     pass
@@ -1650,17 +2808,19 @@ async def handler(exotel_ws, path=None):
                 """Feed Ogg packets to FFmpeg continuously."""
                 total_ogg_bytes = 0
                 iterations = 0
+                max_batch_packets = 20 if use_ffmpeg_codec else 1
                 try:
                     while connection_active:
                         # Drain opus_queue and feed to FFmpeg
                         ogg_buffer = bytearray()
+                        batch_arrivals = []
                         packets_this_batch = 0
                         
-                        # Collect a batch of Ogg packets
-                        while packets_this_batch < 20:
+                        # Collect a batch of Ogg packets (FFmpeg only, the in-process decoder takes each packet as it comes)
+                        while packets_this_batch < max_batch_packets:
                             try:
-                                payload = await asyncio.wait_for(opus_queue.get(), timeout=0.1)
-                                if payload is None:  # Sentinel to stop
+                                item = await asyncio.wait_for(opus_queue.get(), timeout=0.1)
+                                if item is None:  # Sentinel to stop
                                     # Close stdin to signal end of stream (allows FFmpeg to flush)
                                     if ogg_decoder.proc and ogg_decoder.proc.stdin:
                                         try:
@@ -1671,7 +2831,9 @@ async def handler(exotel_ws, path=None):
                                     # Don't return immediately - let read loop drain remaining data
                                     # The read loop will detect stdin closed and continue until process exits
                                     break
+                                payload, arrival = item
                                 ogg_buffer.extend(payload)
+                                batch_arrivals.append(arrival)
                                 packets_this_batch += 1
                             except asyncio.TimeoutError:
                                 break
@@ -1684,6 +2846,7 @@ async def handler(exotel_ws, path=None):
                         iterations += 1
                         
                         # Write Ogg bytes to FFmpeg decoder
+                        decoding_arrivals.extend(batch_arrivals)
                         if not ogg_decoder.write(bytes(ogg_buffer)):
                             logger.error("FFmpeg decoder write failed")
                             break
@@ -1700,6 +2863,7 @@ async def handler(exotel_ws, path=None):
                 """Continuously read PCM24k from FFmpeg and process."""
                 total_pcm24k_bytes = 0
                 iterations = 0
+                arrival = newest = None
                 try:
                     while connection_active:
                         # Continuously read from FFmpeg (non-blocking with timeout)
@@ -1727,8 +2891,18 @@ async def handler(exotel_ws, path=None):
                         total_pcm24k_bytes += len(pcm24k)
                         iterations += 1
                         
-                        # PHASE 1: Live debugging - decode_loop after decoder.read()
-                        print(f"[LIVE][DECODE][OUT] bytes={len(pcm24k)} t={time.time()}")
+                        # The engine frames written before this read are decoded; the audio is dated from
+                        # the oldest of them, the rest of their audio read later from the newest
+                        if decoding_arrivals:
+                            arrival = decoding_arrivals[0]
+                            while decoding_arrivals:
+                                newest = decoding_arrivals.popleft()
+                                obs.record_latency('engine_in_to_decoded', newest, last_decoder_pcm_ts)
+                        else:
+                            arrival = newest
+                        
+                        if BRIDGE_TRACE:
+                            tracer.record(TRACE_DECODE_OUT, len(pcm24k))
                         
                         if iterations <= 5:
                             logger.info(f"FFmpeg read: got {len(pcm24k)} bytes PCM24k (total: {total_pcm24k_bytes})")
@@ -1748,36 +2922,22 @@ async def handler(exotel_ws, path=None):
                                     cap['file'].write(pcm24k)
                                     cap['size'] += len(pcm24k)
                             
-                            # Chunk into 20ms frames and put in queue
-                            offset = 0
-                            while offset + chunk_size_8k <= len(pcm8k):
-                                chunk = pcm8k[offset:offset+chunk_size_8k]
-                                try:
-                                    await pcm_out_queue.put(chunk)
-                                except asyncio.QueueFull:
-                                    logger.warning("PCM8k queue full, dropping chunk")
-                                offset += chunk_size_8k
-                            
-                            # Handle remainder
-                            if offset < len(pcm8k):
-                                remainder = pcm8k[offset:]
-                                if len(remainder) >= 160:  # At least 10ms
-                                    try:
-                                        await pcm_out_queue.put(remainder)
-                                    except asyncio.QueueFull:
-                                        pass
+                            # Played out in exact 20ms frames by exotel_send_loop
+                            playout.write(pcm8k, arrival)
                 except Exception as e:
                     # PHASE 2: Live debugging - explicit exception handling
                     print(f"[LIVE][ERROR][FFMPEG_READ] {repr(e)} t={time.time()}")
                     logger.error(f"ffmpeg_read_loop error: {e}", exc_info=True)
                     raise
             
-            # STAGE 3: Exotel send loop - drain pcm8k_queue and send JSON frames
+            # STAGE 3: Exotel send loop - play the jitter buffer out on a monotonic 20ms clock
             async def exotel_send_loop():
                 nonlocal last_exotel_out_time, drain_mode, stop_received_ts
                 exotel_send_frames = 0
                 exotel_send_bytes = 0
-                last_silence_send_ts = None
+                last_latency_check = time.monotonic()
+                frame_secs = playout.frame_ms / 1000
+                next_tick = time.monotonic()
                 try:
                     while connection_active or (drain_mode and stop_received_ts is not None):
                         # In drain mode, check exit conditions
@@ -1788,51 +2948,49 @@ async def handler(exotel_ws, path=None):
                                 logger.info(f"EXOTEL_DRAIN_MODE: Timeout ({EXOTEL_DRAIN_SECS}s) reached, exiting")
                                 drain_mode = False
                                 break
-                            # Check if playback finished (queue empty AND no new decoder audio for 500ms)
-                            if pcm_out_queue.qsize() == 0:
+                            # Check if playback finished (buffer empty AND no new decoder audio for 500ms)
+                            if playout.depth_frames() == 0:
                                 time_since_decoder = now - last_decoder_pcm_ts if last_decoder_pcm_ts else float('inf')
                                 if time_since_decoder >= 0.5:
                                     logger.info(f"EXOTEL_DRAIN_MODE: Playback finished (no decoder audio for {time_since_decoder:.2f}s), exiting")
                                     drain_mode = False
                                     break
                         
-                        try:
-                            timeout = 0.2 if (drain_mode and EXOTEL_SEND_SILENCE_WHEN_IDLE) else 1.0
-                            pcm8k_chunk = await asyncio.wait_for(pcm_out_queue.get(), timeout=timeout)
-                        except asyncio.TimeoutError:
-                            # In drain mode with silence keepalive, send silence frames
+                        # Wait for the next tick; after a stall of the event loop, restart the clock
+                        # instead of sending the missed frames in a burst
+                        next_tick += frame_secs
+                        delay = next_tick - time.monotonic()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                        elif delay < -5 * frame_secs:
+                            next_tick = time.monotonic()
+                        
+                        pcm8k_chunk = playout.pop_frame()
+                        if pcm8k_chunk is None:
+                            # Nothing played yet: silence keepalive in drain mode if enabled
                             if drain_mode and EXOTEL_SEND_SILENCE_WHEN_IDLE and not exotel_ws.closed:
-                                now = time.monotonic()
-                                if last_silence_send_ts is None or (now - last_silence_send_ts) >= 0.02:  # 20ms cadence
-                                    # Send valid silence frame (320 bytes @ 8kHz PCM)
-                                    silence_pcm8k = np.zeros(160, dtype=np.int16)  # 20ms @ 8kHz = 160 samples
-                                    silence_bytes = silence_pcm8k.tobytes()
-                                    payload_b64 = base64.b64encode(silence_bytes).decode("ascii")
-                                    media_frame = {"event": "media", "media": {"payload": payload_b64}}
-                                    try:
-                                        await exotel_ws.send(json.dumps(media_frame))
-                                        last_silence_send_ts = now
-                                        if int(now * 10) % 50 == 0:  # Log every 5s
-                                            logger.debug(f"EXOTEL_DRAIN_MODE: Sent silence keepalive frame")
-                                    except Exception:
-                                        pass  # Socket may be closed, will be caught below
+                                try:
+                                    await exotel_ws.send(silence_media(len(playout.silence)))
+                                except Exception:
+                                    pass  # Socket may be closed, will be caught below
                                 continue
                             
-                            # Check for latency (non-drain mode)
+                            # Check for latency (non-drain mode), once per second
                             now = time.monotonic()
-                            if (now - last_exotel_out_time) > 3.0 and obs.counters['engine_audio_frames'] > 0 and obs.counters['exotel_out_frames'] == 0:
-                                logger.warning(
-                                    f"LATENCY: No exotel_out for {now - last_exotel_out_time:.1f}s "
-                                    f"while engine_audio={obs.counters['engine_audio_frames']}f/{obs.counters['engine_audio_bytes']}b"
-                                )
+                            if now - last_latency_check >= 1.0:
+                                last_latency_check = now
+                                if (now - last_exotel_out_time) > 3.0 and obs.counters['engine_audio_frames'] > 0 and obs.counters['exotel_out_frames'] == 0:
+                                    logger.warning(
+                                        f"LATENCY: No exotel_out for {now - last_exotel_out_time:.1f}s "
+                                        f"while engine_audio={obs.counters['engine_audio_frames']}f/{obs.counters['engine_audio_bytes']}b"
+                                    )
                             continue
                         
-                        # Encode to base64 and send JSON
-                        payload_b64 = base64.b64encode(pcm8k_chunk).decode("ascii")
-                        media_frame = {
-                            "event": "media",
-                            "media": {"payload": payload_b64}
-                        }
+                        # Encode to base64 and send JSON (underrun silence is encoded once)
+                        if pcm8k_chunk is playout.silence:
+                            media_frame = silence_media(len(pcm8k_chunk))
+                        else:
+                            media_frame = encode_media(pcm8k_chunk)
                         
                         try:
                             # Check if Exotel websocket is closed before sending
@@ -1840,12 +2998,18 @@ async def handler(exotel_ws, path=None):
                                 logger.warning("EXOTEL_SEND: Exotel websocket closed, cannot send")
                                 break
                             
-                            # PHASE 1: Live debugging - exotel_ws.send()
-                            print(f"[LIVE][EXOTEL_OUT] bytes={len(pcm8k_chunk)} q_pcm_out={pcm_out_queue.qsize()} t={time.time()}")
-                            await exotel_ws.send(json.dumps(media_frame))
+                            if BRIDGE_TRACE:
+                                tracer.record(TRACE_EXOTEL_OUT, len(pcm8k_chunk), playout.depth_frames())
+                            await exotel_ws.send(media_frame)
                             exotel_send_frames += 1
                             exotel_send_bytes += len(pcm8k_chunk)
                             last_exotel_outbound_ts = time.monotonic()
+                            if playout.frame_arrival is not None:
+                                obs.record_latency('engine_in_to_exotel_out', playout.frame_arrival, last_exotel_outbound_ts)
+                                response_ms = response_latency.agent_frame(pcm8k_chunk, last_exotel_outbound_ts)
+                                if response_ms is not None:
+                                    obs.latency['response'].add(response_ms)
+                                    logger.info(f"RESPONSE_LATENCY: {response_ms:.0f}ms (caller speech end -> first agent audio)")
                             obs.update_counter('exotel_out_frames', delta=1, bytes_delta=len(pcm8k_chunk))
                             obs.update_activity('exotel_out')
                             last_exotel_out_time = time.monotonic()
@@ -1871,6 +3035,13 @@ async def handler(exotel_ws, path=None):
                     raise
                 finally:
                     logger.info(f"EXOTEL_SEND frames={exotel_send_frames} bytes={exotel_send_bytes}")
+                    logger.info(
+                        f"PLAYOUT underruns={obs.counters['playout_underruns']} "
+                        f"underrun_frames={obs.counters['playout_underrun_frames']} "
+                        f"trimmed_frames={obs.counters['playout_trimmed_frames']} "
+                        f"compressed_frames={obs.counters['playout_compressed_frames']} "
+                        f"target={playout.target_ms()}ms"
+                    )
             
             # Start all stages (4 tasks: recv, feed, read, send)
             logger.info("Starting engine_to_exotel tasks: engine_recv, ffmpeg_feed, ffmpeg_read, exotel_send")
@@ -1971,7 +3142,7 @@ async def handler(exotel_ws, path=None):
                             connection_active = False
                             break
                         # Check if playback finished
-                        if pcm_out_queue.qsize() == 0:
+                        if playout.depth_frames() == 0:
                             time_since_decoder = now - last_decoder_pcm_ts if last_decoder_pcm_ts else float('inf')
                             if time_since_decoder >= 0.5:
                                 logger.info(f"EXOTEL_DRAIN_MODE: Playback finished, ending drain")
@@ -2019,6 +3190,13 @@ async def handler(exotel_ws, path=None):
     finally:
         # Cleanup
         connection_active = False
+        if engine_backend is not None:
+            ENGINE_BALANCER.release(engine_backend)
+        WORKER_STATS['sessions'].pop(session_id, None)
+        for key, value in obs.counters.items():
+            WORKER_STATS['counters'][key] = WORKER_STATS['counters'].get(key, 0) + value
+        for stage, h in obs.latency.items():
+            WORKER_STATS['latency'][stage].merge(h)
         
         # Cancel and await all tasks safely
         # Note: 'tasks' is defined in the handler scope, so it should be accessible here
@@ -2050,6 +3228,9 @@ async def handler(exotel_ws, path=None):
         if ogg_decoder:
             ogg_decoder.stop()
         
+        if BRIDGE_TRACE:
+            tracer.flush()
+        
         # Close capture files
         if capture_enabled and capture_files:
             for name, cap_info in capture_files.items():
@@ -2060,6 +3241,7 @@ async def handler(exotel_ws, path=None):
                 except Exception as e:
                     logger.error(f"Error closing capture file {name}: {e}")
         
+        logger.info(f"SESSION_END: {session_id} latency p50/p90/p99: {obs.format_latency()}")
         logger.info(f"SESSION_END: {session_id} cleanup complete")
 
 
@@ -2069,7 +3251,7 @@ async def main():
     logger.info("Exotel Bridge Starting")
     logger.info("=" * 60)
     logger.info(f"Bridge listening on: ws://{BRIDGE_HOST}:{BRIDGE_PORT}")
-    logger.info(f"PersonaPlex engine: {PERSONAPLEX_WS}")
+    logger.info(f"PersonaPlex engines: {', '.join(ENGINE_URLS)} (prompts: {PERSONAPLEX_WS.partition('?')[2][:60]}...)")
     logger.info(f"Audio: Exotel {EXOTEL_SR}Hz <-> Model {MODEL_SR}Hz")
     logger.info(f"Voice prompt: {VOICE_PROMPT}")
     logger.info(f"Text prompt: {TEXT_PROMPT[:50]}...")
@@ -2077,9 +3259,294 @@ async def main():
     logger.info("Bridge ready! Waiting for Exotel connections...")
     logger.info("")
     
+    start_engines()
+    metrics_task = asyncio.create_task(metrics_file_loop()) if BRIDGE_METRICS_FILE else None
     async with websockets.serve(handler, BRIDGE_HOST, BRIDGE_PORT, max_size=None):
         await asyncio.Future()
 
 
+# ========== MULTI-PROCESS SUPERVISOR ==========
+async def worker_main(worker_id: int, stats_queue):
+    """Serve calls on BRIDGE_PORT alongside the other workers, and report to the supervisor.
+
+    On SIGTERM the worker stops accepting calls and exits once its active calls are over,
+    or after BRIDGE_WORKER_DRAIN_SECS.
+    """
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    loop.add_signal_handler(os_signal.SIGTERM, stop.set)
+    loop.add_signal_handler(os_signal.SIGINT, stop.set)
+    os_signal.signal(os_signal.SIGHUP, os_signal.SIG_IGN)
+
+    async def report_loop():
+        while True:
+            stats_queue.put(worker_report(worker_id))
+            await asyncio.sleep(BRIDGE_WORKER_REPORT_SECS)
+
+    start_engines()
+    server = await websockets.serve(handler, BRIDGE_HOST, BRIDGE_PORT, max_size=None, reuse_port=True)
+    logger.info(f"WORKER_START: worker={worker_id} pid={os.getpid()} listening on ws://{BRIDGE_HOST}:{BRIDGE_PORT}")
+    report_task = asyncio.create_task(report_loop())
+    await stop.wait()
+
+    if ENGINE_POOL is not None:
+        await ENGINE_POOL.stop()  # Free the engine slots of the pooled sessions
+    active = len(WORKER_STATS['sessions'])
+    logger.info(
+        f"WORKER_DRAIN: worker={worker_id} pid={os.getpid()} stopped accepting, waiting for {active} active calls"
+    )
+    server.close(close_connections=False)
+    try:
+        await asyncio.wait_for(server.wait_closed(), timeout=BRIDGE_WORKER_DRAIN_SECS)
+    except asyncio.TimeoutError:
+        logger.warning(
+            f"WORKER_DRAIN: worker={worker_id} timeout ({BRIDGE_WORKER_DRAIN_SECS}s), "
+            f"dropping {len(WORKER_STATS['sessions'])} calls"
+        )
+    report_task.cancel()
+    stats_queue.put(worker_report(worker_id))
+    logger.info(f"WORKER_EXIT: worker={worker_id} calls_total={WORKER_STATS['calls_total']}")
+
+
+def run_worker(worker_id: int, stats_queue):
+    """Worker process entry point."""
+    for log_handler in logging.getLogger().handlers:
+        log_handler.setFormatter(logging.Formatter(
+            f'[%(asctime)s] [%(levelname)s] [%(name)s] [worker-{worker_id}] %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S',
+        ))
+    asyncio.run(worker_main(worker_id, stats_queue))
+
+
+class BridgeSupervisor:
+    """Runs BRIDGE_WORKERS bridge processes on the same port, and keeps them healthy.
+
+    The kernel spreads the incoming connections over the workers (SO_REUSEPORT). The
+    supervisor restarts workers that exit or stop reporting for BRIDGE_WORKER_HEALTH_TIMEOUT,
+    logs the metrics of all the workers every BRIDGE_METRICS_SECS, and on SIGHUP replaces
+    the workers one by one: the old worker only stops accepting once the new one listens.
+    SIGTERM/SIGINT drain and stop all the workers.
+    """
+
+    def __init__(self, num_workers: int):
+        self.num_workers = num_workers
+        self.ctx = multiprocessing.get_context("fork")
+        self.stats_queue = self.ctx.Queue()
+        self.workers = {}  # worker_id -> {'proc', 'started', 'report', 'report_ts'}
+        self.starting = {}  # worker_id -> new worker of a rolling restart, not listening yet
+        self.retiring = {}  # pid -> worker draining its calls, with its 'deadline'
+        self.restarts = 0
+        self.stopping = False
+        self.restart_requested = False
+        self.finished_counters = {}  # counters of the workers that are gone
+        self.finished_latency = {stage: LatencyHistogram() for stage in LATENCY_STAGES}
+        self.finished_calls = 0
+
+    def start_worker(self, worker_id: int) -> dict:
+        proc = self.ctx.Process(target=run_worker, args=(worker_id, self.stats_queue), name=f"bridge-worker-{worker_id}")
+        proc.start()
+        logger.info(f"SUPERVISOR: started worker={worker_id} pid={proc.pid}")
+        return {'proc': proc, 'started': time.monotonic(), 'report': None, 'report_ts': time.monotonic()}
+
+    def spawn(self, worker_id: int):
+        self.workers[worker_id] = self.start_worker(worker_id)
+
+    def retire(self, worker_id: int):
+        """Ask a worker to drain its calls and exit, its last counters are kept once it is gone."""
+        worker = self.workers.pop(worker_id)
+        if worker['proc'].is_alive():
+            worker['proc'].terminate()
+        worker['deadline'] = time.monotonic() + BRIDGE_WORKER_DRAIN_SECS + 5.0
+        self.retiring[worker['proc'].pid] = worker
+
+    def collect_reports(self, timeout: float):
+        try:
+            report = self.stats_queue.get(timeout=timeout)
+            while True:
+                # The workers draining their calls keep reporting, up to a final report on exit
+                candidates = (self.workers.get(report['worker']), self.starting.get(report['worker']),
+                              self.retiring.get(report['pid']))
+                for worker in candidates:
+                    if worker and worker['proc'].pid == report['pid']:
+                        worker['report'] = report
+                        worker['report_ts'] = time.monotonic()
+                report = self.stats_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def check_health(self):
+        now = time.monotonic()
+        for worker_id, worker in list(self.workers.items()):
+            proc = worker['proc']
+            if not proc.is_alive():
+                logger.error(f"SUPERVISOR: worker={worker_id} pid={proc.pid} exited (code={proc.exitcode}), restarting")
+            elif now - worker['report_ts'] > BRIDGE_WORKER_HEALTH_TIMEOUT:
+                logger.error(
+                    f"SUPERVISOR: worker={worker_id} pid={proc.pid} silent for {now - worker['report_ts']:.1f}s, restarting"
+                )
+                proc.kill()
+            else:
+                continue
+            self.retire(worker_id)
+            self.restarts += 1
+            if now - worker['started'] < 10.0:
+                time.sleep(1.0)  # Crash loop: do not spin
+            self.spawn(worker_id)
+        self.reap_retiring()
+
+    def reap_retiring(self):
+        now = time.monotonic()
+        exited = [pid for pid, worker in self.retiring.items() if not worker['proc'].is_alive()]
+        if exited:
+            # Their final reports are in the queue pipe by now
+            self.collect_reports(timeout=0)
+        for pid in exited:
+            worker = self.retiring.pop(pid)
+            worker['proc'].join()
+            if worker['report']:
+                self.finished_calls += worker['report']['calls_total']
+                for key, value in worker['report']['counters'].items():
+                    self.finished_counters[key] = self.finished_counters.get(key, 0) + value
+                for stage, d in worker['report']['latency'].items():
+                    self.finished_latency[stage].merge(LatencyHistogram.from_dict(d))
+        for pid, worker in self.retiring.items():
+            if now > worker['deadline']:
+                logger.warning(f"SUPERVISOR: retired worker pid={pid} still running, killing it")
+                worker['proc'].kill()
+
+    def rolling_restart(self):
+        logger.info(f"SUPERVISOR: rolling restart of {len(self.workers)} workers")
+        for worker_id in list(self.workers):
+            old = self.workers[worker_id]
+            # A worker only reports once it listens, the old one keeps accepting until then
+            new = self.starting[worker_id] = self.start_worker(worker_id)
+            deadline = time.monotonic() + BRIDGE_WORKER_START_TIMEOUT
+            while new['report'] is None and new['proc'].is_alive() and not self.stopping \
+                    and time.monotonic() < deadline:
+                self.collect_reports(0.2)
+            del self.starting[worker_id]
+            if new['report'] is None:
+                log = logger.info if self.stopping else logger.error
+                log(
+                    f"SUPERVISOR: new worker={worker_id} pid={new['proc'].pid} not listening "
+                    f"(exit code={new['proc'].exitcode}), keeping pid={old['proc'].pid} and stopping the restart"
+                )
+                if new['proc'].is_alive():
+                    new['proc'].kill()
+                new['deadline'] = time.monotonic() + 5.0
+                self.retiring[new['proc'].pid] = new
+                break
+            # The old worker drains its calls while the new one takes the new calls
+            self.retire(worker_id)
+            self.workers[worker_id] = new
+            logger.info(f"SUPERVISOR: worker={worker_id} replaced, pid {old['proc'].pid} -> {new['proc'].pid}")
+        self.restarts += 1
+
+    def metrics(self) -> dict:
+        counters = dict(self.finished_counters)
+        latency = {stage: LatencyHistogram() for stage in LATENCY_STAGES}
+        for stage, h in self.finished_latency.items():
+            latency[stage].merge(h)
+        calls_total = self.finished_calls
+        retiring_calls = 0
+        for worker in self.retiring.values():
+            # Until they are gone, the draining workers count with their latest report
+            report = worker['report'] or {'active_calls': 0, 'calls_total': 0, 'counters': {}, 'latency': {}}
+            for key, value in report['counters'].items():
+                counters[key] = counters.get(key, 0) + value
+            for stage, d in report['latency'].items():
+                latency[stage].merge(LatencyHistogram.from_dict(d))
+            calls_total += report['calls_total']
+            retiring_calls += report['active_calls']
+        workers = []
+        now = time.monotonic()
+        for worker_id, worker in sorted(self.workers.items()):
+            report = worker['report'] or {'active_calls': 0, 'calls_total': 0, 'counters': {}, 'latency': {}}
+            for key, value in report['counters'].items():
+                counters[key] = counters.get(key, 0) + value
+            for stage, d in report['latency'].items():
+                latency[stage].merge(LatencyHistogram.from_dict(d))
+            workers.append({
+                'worker': worker_id,
+                'pid': worker['proc'].pid,
+                'alive': worker['proc'].is_alive(),
+                'report_age_s': round(now - worker['report_ts'], 1),
+                'active_calls': report['active_calls'],
+                'calls_total': report['calls_total'],
+            })
+        return {
+            'time': time.time(),
+            'workers': workers,
+            'retiring': len(self.retiring),
+            'restarts': self.restarts,
+            'active_calls': retiring_calls + sum(w['active_calls'] for w in workers),
+            'calls_total': calls_total + sum(w['calls_total'] for w in workers),
+            'counters': counters,
+            'latency_ms': latency_metrics(latency),
+            'latency_buckets_ms': list(LATENCY_BUCKETS_MS),
+        }
+
+    def log_metrics(self):
+        m = self.metrics()
+        c = m['counters']
+        lat = m['latency_ms']
+        logger.info(
+            f"SUPERVISOR: workers={sum(w['alive'] for w in m['workers'])}/{self.num_workers} "
+            f"retiring={m['retiring']} restarts={m['restarts']} active_calls={m['active_calls']} "
+            f"calls_total={m['calls_total']} exotel_in={c.get('exotel_in_frames', 0)}f "
+            f"engine_out={c.get('engine_out_frames', 0)}f engine_audio={c.get('engine_audio_frames', 0)}f "
+            f"exotel_out={c.get('exotel_out_frames', 0)}f playout_underruns={c.get('playout_underruns', 0)} "
+            f"playout_trimmed={c.get('playout_trimmed_frames', 0)}f inbound_lost={c.get('inbound_lost_frames', 0)}f "
+            f"inbound_late={c.get('inbound_late_frames', 0)}f "
+            f"response_p50/p90={lat['response']['p50_ms']:.0f}/{lat['response']['p90_ms']:.0f}ms "
+            f"engine_in_to_exotel_out_p90={lat['engine_in_to_exotel_out']['p90_ms']:.0f}ms"
+        )
+        for w in m['workers']:
+            logger.info(
+                f"SUPERVISOR:   worker={w['worker']} pid={w['pid']} alive={w['alive']} "
+                f"active_calls={w['active_calls']} calls_total={w['calls_total']} last_report={w['report_age_s']}s ago"
+            )
+        if BRIDGE_METRICS_FILE:
+            write_metrics_file(m)
+
+    def run(self):
+        def on_stop(signum, frame):
+            self.stopping = True
+
+        def on_hup(signum, frame):
+            self.restart_requested = True
+
+        os_signal.signal(os_signal.SIGTERM, on_stop)
+        os_signal.signal(os_signal.SIGINT, on_stop)
+        os_signal.signal(os_signal.SIGHUP, on_hup)
+        logger.info(f"SUPERVISOR: starting {self.num_workers} workers on ws://{BRIDGE_HOST}:{BRIDGE_PORT} (SO_REUSEPORT)")
+        for worker_id in range(self.num_workers):
+            self.spawn(worker_id)
+        last_metrics = time.monotonic()
+        while not self.stopping:
+            self.collect_reports(timeout=1.0)
+            if self.stopping:
+                break
+            self.check_health()
+            if self.restart_requested:
+                self.restart_requested = False
+                self.rolling_restart()
+            if time.monotonic() - last_metrics >= BRIDGE_METRICS_SECS:
+                last_metrics = time.monotonic()
+                self.log_metrics()
+
+        logger.info("SUPERVISOR: stopping, draining all workers")
+        for worker_id in list(self.workers):
+            self.retire(worker_id)
+        while self.retiring:
+            # Keep reading the reports, a worker cannot exit with reports left in the queue pipe
+            self.collect_reports(timeout=0.5)
+            self.reap_retiring()
+        logger.info("SUPERVISOR: stopped")
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    if BRIDGE_WORKERS > 1:
+        BridgeSupervisor(BRIDGE_WORKERS).run()
+    else:
+        asyncio.run(main())
@@ -0,0 +1,50 @@
+"""
+Exotel media frame codec - JSON/base64 framing of the Exotel WebSocket audio, without the generic paths.
+
+Inbound, the messages are parsed with orjson when it is installed (it comes with
+gradio), json otherwise, and the payload is decoded with binascii directly, without
+the checks of base64.b64decode. Outbound, the frames are the payload spliced into a
+JSON template, byte for byte what json.dumps makes of
+{"event": "media", "media": {"payload": ...}}, and the silence frames are encoded once.
+"""
+import binascii
+import json
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # Optional, json is used instead
+
+# Parses str or bytes; orjson.JSONDecodeError is a json.JSONDecodeError
+_loads = orjson.loads if orjson is not None else json.loads
+
+# json.dumps({"event": "media", "media": {"payload": "<payload>"}}), split around the payload
+MEDIA_PREFIX, MEDIA_SUFFIX = json.dumps({"event": "media", "media": {"payload": "\0"}}).split("\\u0000")
+
+
+def parse_message(msg):
+    """Parse an Exotel message into (data, payload).
+
+    data is the whole message, payload the base64 audio string of a media message,
+    None if there is none. Raises json.JSONDecodeError on invalid JSON.
+    """
+    data = _loads(msg)
+    media = data.get("media") if isinstance(data, dict) else None
+    return data, media.get("payload") if isinstance(media, dict) else None
+
+
+def decode_payload(payload: str) -> bytes:
+    """PCM bytes of a base64 payload (binascii.Error if it is not valid base64)."""
+    return binascii.a2b_base64(payload)
+
+
+def encode_media(pcm: bytes) -> str:
+    """Exotel media message carrying pcm."""
+    return MEDIA_PREFIX + binascii.b2a_base64(pcm, newline=False).decode("ascii") + MEDIA_SUFFIX
+
+
+@lru_cache(maxsize=8)
+def silence_media(nbytes: int = 320) -> str:
+    """Exotel media message carrying nbytes of PCM16 silence (320 = 20ms @ 8kHz)."""
+    return encode_media(bytes(nbytes))
@@ -95,7 +95,7 @@ class _MimiState:
     graphed_tr_enc: CUDAGraphed | None
     graphed_tr_dec: CUDAGraphed | None
 
-    def reset(self):
+    def reset(self, reset_mask: tp.Optional[torch.Tensor] = None):
         pass
 
 
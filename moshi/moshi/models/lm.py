@@ -39,6 +39,7 @@ import sys
 from typing import Optional, Union, List, Tuple, Callable, Iterator
 import sphn
 import torch
+from torch.nn import functional as F
 from tqdm.auto import tqdm
 
 from ..utils.sampling import sample_token
@@ -215,6 +216,68 @@ class ScaledEmbedding(torch.nn.Embedding):
         return y
 
 
+class MultiEmbedding(torch.nn.Module):
+    """Embeddings of several codebooks in a single table, the rows of each codebook following
+    those of the previous one, so that the tokens of all the codebooks are looked up and
+    summed in one op. Same as a `ScaledEmbedding` (without norm) per codebook.
+
+    Args:
+        num_embeddings (list[int]): Vocabulary size of each codebook.
+        embedding_dim (int): Dimension of the embeddings.
+        zero_idx (int): special value indicating that the output should be exactly 0.
+    """
+
+    def __init__(
+        self,
+        num_embeddings: list[int],
+        embedding_dim: int,
+        zero_idx: int = -1,
+        device=None,
+        dtype=None,
+    ):
+        super().__init__()
+        assert zero_idx < 0, "Please use negative values for the zero_idx."
+        self.num_embeddings = list(num_embeddings)
+        self.embedding_dim = embedding_dim
+        self.zero_idx = zero_idx
+        self.weight = torch.nn.Parameter(
+            torch.empty(sum(num_embeddings), embedding_dim, device=device, dtype=dtype)
+        )
+        torch.nn.init.normal_(self.weight)
+        # First row of each codebook, as a list and as a [K, 1] tensor per device.
+        self.starts = [sum(self.num_embeddings[:k]) for k in range(len(self.num_embeddings))]
+        self._starts: dict[torch.device, torch.Tensor] = {}
+
+    def split(self, weight: torch.Tensor) -> tuple[torch.Tensor, ...]:
+        """Split a table into the tables of each codebook."""
+        return weight.split(self.num_embeddings)
+
+    def _embedding_sum(self, indexes: torch.Tensor, weights: torch.Tensor) -> torch.Tensor:
+        # Sum of the rows of `indexes` ([N, K]) multiplied by `weights`, zero for the zero_idx tokens.
+        if indexes.device.type == "mps":
+            # No embedding_bag on MPS.
+            return (F.embedding(indexes, self.weight) * weights[..., None]).sum(1)
+        return F.embedding_bag(indexes, self.weight, mode="sum", per_sample_weights=weights)
+
+    def forward(self, codes: torch.Tensor) -> torch.Tensor:
+        """Sum of the embeddings of all the codebooks, `[B, K, S]` codes to `[B, S, D]`."""
+        B, K, S = codes.shape
+        assert K == len(self.num_embeddings), (K, self.num_embeddings)
+        if codes.device not in self._starts:
+            self._starts[codes.device] = torch.tensor(self.starts, device=codes.device).view(-1, 1)
+        indexes = codes.clamp(min=0) + self._starts[codes.device]
+        weights = (codes != self.zero_idx).to(self.weight.dtype)
+        y = self._embedding_sum(
+            indexes.transpose(1, 2).reshape(B * S, K), weights.transpose(1, 2).reshape(B * S, K)
+        )
+        return y.view(B, S, -1)
+
+    def lookup(self, index: int, codes: torch.Tensor) -> torch.Tensor:
+        """Embeddings of the codebook `index`, `[B, S]` codes to `[B, S, D]`."""
+        y = F.embedding(codes.clamp(min=0) + self.starts[index], self.weight)
+        return y.masked_fill_((codes == self.zero_idx)[..., None], 0)
+
+
 class LMModel(StreamingContainer):
     """Transformer-based language model on multiple streams of codes.
 
@@ -286,13 +349,26 @@ class LMModel(StreamingContainer):
             zero_idx=self.zero_token_id,
         )
         self.EmbeddingFactory = EmbeddingFactory
-        self.emb = torch.nn.ModuleList(
-            [EmbeddingFactory(self.card + 1, dim) for _ in range(n_q)]
-        )
+        # The embeddings of all the codebooks are summed in one op, in the order of the
+        # sequence (text first), except when each of them is normalized.
+        self.codes_emb: Optional[MultiEmbedding] = None
+        if norm_emb:
+            self.emb = torch.nn.ModuleList(
+                [EmbeddingFactory(self.card + 1, dim) for _ in range(n_q)]
+            )
         # Text card + padding token (if not in the original tokenizer)
         extra_text = self.existing_text_padding_id is None
         # Unlike for audio, here we authorize the model to output the special token.
-        self.text_emb = EmbeddingFactory(text_card + 1, dim)
+        if norm_emb:
+            self.text_emb = EmbeddingFactory(text_card + 1, dim)
+        else:
+            self.codes_emb = MultiEmbedding(
+                [text_card + 1] + [self.card + 1] * n_q,
+                dim,
+                zero_idx=self.zero_token_id,
+                device=device,
+                dtype=dtype,
+            )
         self.text_linear = torch.nn.Linear(dim, text_card + extra_text, bias=bias_proj)
         depformer_prefix = "depformer_"
         main_kwargs = {
@@ -331,10 +407,20 @@ class LMModel(StreamingContainer):
                 [torch.nn.Linear(dim, depformer_dim, bias=False)]
             )
         # Only using up to dep_q - 1 because the last codebook is never an input to Depformer.
-        self.depformer_emb = torch.nn.ModuleList(
-            [EmbeddingFactory(self.card + 1, depformer_dim) for _ in range(dep_q - 1)]
-        )
-        self.depformer_text_emb = EmbeddingFactory(text_card + 1, depformer_dim)
+        self.depformer_codes_emb: Optional[MultiEmbedding] = None
+        if norm_emb:
+            self.depformer_emb = torch.nn.ModuleList(
+                [EmbeddingFactory(self.card + 1, depformer_dim) for _ in range(dep_q - 1)]
+            )
+            self.depformer_text_emb = EmbeddingFactory(text_card + 1, depformer_dim)
+        else:
+            self.depformer_codes_emb = MultiEmbedding(
+                [text_card + 1] + [self.card + 1] * (dep_q - 1),
+                depformer_dim,
+                zero_idx=self.zero_token_id,
+                device=device,
+                dtype=dtype,
+            )
         if depformer_dim_feedforward is None:
             depformer_dim_feedforward = int(hidden_scale * depformer_dim)
         self.depformer = StreamingTransformer(
@@ -351,6 +437,33 @@ class LMModel(StreamingContainer):
         self.linears = torch.nn.ModuleList(
             [torch.nn.Linear(dim, self.card, bias=bias_proj) for _ in range(dep_q)]
         )
+        self._register_state_dict_hook(LMModel._state_dict_hook)
+
+    def _embedding_tables(self) -> dict[str, list[str]]:
+        # Names of the embeddings of the codebooks of each `MultiEmbedding`, as in the checkpoints.
+        tables = {}
+        if self.codes_emb is not None:
+            tables["codes_emb"] = ["text_emb"] + [f"emb.{k}" for k in range(self.n_q)]
+        if self.depformer_codes_emb is not None:
+            tables["depformer_codes_emb"] = ["depformer_text_emb"] + [
+                f"depformer_emb.{k}" for k in range(self.dep_q - 1)
+            ]
+        return tables
+
+    @staticmethod
+    def _state_dict_hook(module, state_dict, prefix, local_metadata):
+        # The checkpoints have one embedding per codebook, e.g. `emb.0.weight`, the tables are split back.
+        for table, names in module._embedding_tables().items():
+            weight = state_dict.pop(f"{prefix}{table}.weight")
+            for name, codebook_weight in zip(names, getattr(module, table).split(weight)):
+                state_dict[f"{prefix}{name}.weight"] = codebook_weight
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        for table, names in self._embedding_tables().items():
+            keys = [f"{prefix}{name}.weight" for name in names]
+            if all(key in state_dict for key in keys):
+                state_dict[f"{prefix}{table}.weight"] = torch.cat([state_dict.pop(key) for key in keys])
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
 
     @property
     def initial_token_id(self) -> int:
@@ -427,6 +540,8 @@ class LMModel(StreamingContainer):
         assert (
             K == self.num_codebooks
         ), f"Sequence shape {sequence.shape} must match the number of codebooks."
+        if self.codes_emb is not None:
+            return self.codes_emb(sequence)
         input_sequence = sequence
         input_ = None
         for cb_index in range(self.num_audio_codebooks):
@@ -454,6 +569,14 @@ class LMModel(StreamingContainer):
         text_logits = text_logits[:, None]
         return transformer_out, text_logits
 
+    def advance_codes(self, sequence: torch.Tensor) -> torch.Tensor:
+        """Only run the main transformer to update its streaming state, skipping the heads,
+        e.g. when all the tokens of the step are already known."""
+        return self.advance_embeddings(self.embed_codes(sequence))
+
+    def advance_embeddings(self, input: torch.Tensor) -> torch.Tensor:
+        return self.transformer(input)
+
     def forward_depformer(
         self,
         depformer_cb_index: int,
@@ -476,7 +599,9 @@ class LMModel(StreamingContainer):
             depformer_input = self.depformer_in[depformer_cb_index](depformer_input)
         else:
             depformer_input = self.depformer_in[0](depformer_input)
-        if depformer_cb_index == 0:
+        if self.depformer_codes_emb is not None:
+            last_token_input = self.depformer_codes_emb.lookup(depformer_cb_index, sequence[:, 0])
+        elif depformer_cb_index == 0:
             last_token_input = self.depformer_text_emb(sequence[:, 0])
         else:
             last_token_input = self.depformer_emb[depformer_cb_index - 1](
@@ -511,7 +636,9 @@ class LMModel(StreamingContainer):
                 transformer_in = self.depformer_in[linear_index](transformer_out)
             else:
                 transformer_in = self.depformer_in[0](transformer_out)
-            if cb_index == 0:
+            if self.depformer_codes_emb is not None:
+                token_in = self.depformer_codes_emb.lookup(cb_index, sequence[:, cb_index + self.audio_offset - 1])
+            elif cb_index == 0:
                 token_in = self.depformer_text_emb(sequence[:, 0])
             else:
                 token_in = self.depformer_emb[cb_index - 1](sequence[:, cb_index + self.audio_offset - 1])
@@ -560,11 +687,37 @@ class _LMGenState:
     graphed_main: CUDAGraphed
     graphed_embeddings: CUDAGraphed
     graphed_depth: CUDAGraphed
-    offset: int = 0
-
-    def reset(self):
-        self.offset = 0
-        self.provided[:] = False
+    # Per batch entry offsets and exec mask, kept on the host as they drive the
+    # bookkeeping, see `LMGen.set_exec_mask`.
+    offsets: torch.Tensor
+    exec_mask: torch.Tensor
+    # Last exec mask given to the transformer, to avoid resending it at each step.
+    model_exec_mask: torch.Tensor
+    # Number of consecutive steps for which all the streams were given, per batch entry.
+    forced_steps: torch.Tensor
+    graphed_advance: CUDAGraphed
+    graphed_advance_embeddings: CUDAGraphed
+    # Number of consecutive steps for which the user stream was given, per batch entry.
+    user_steps: torch.Tensor
+    graphed_depth_user_given: CUDAGraphed
+    # Value of the cache entries not generated yet.
+    ungenerated_token_id: int
+
+    def reset(self, reset_mask: Optional[torch.Tensor] = None):
+        if reset_mask is None:
+            self.cache.fill_(self.ungenerated_token_id)
+            self.offsets.zero_()
+            self.forced_steps.zero_()
+            self.user_steps.zero_()
+            self.provided[:] = False
+            self.exec_mask.fill_(True)
+        else:
+            reset_mask = reset_mask.cpu()
+            self.offsets.masked_fill_(reset_mask, 0)
+            self.forced_steps.masked_fill_(reset_mask, 0)
+            self.user_steps.masked_fill_(reset_mask, 0)
+            self.cache[reset_mask.to(self.cache.device)] = self.ungenerated_token_id
+            self.provided[reset_mask.to(self.provided.device)] = False
 
 
 @torch.no_grad()
@@ -576,12 +729,12 @@ def create_loss_report(
     target: torch.Tensor,
     sampled_text_token: torch.Tensor,
     sampled_audio_tokens: torch.Tensor,
-    target_position: int,
+    target_position: torch.Tensor,
 ) -> dict[str, torch.Tensor]:
     report = {}
     B = state_cache.shape[0]
     # model_tokens is the sampled output from model_logits
-    model_tokens = torch.zeros_like(state_cache[:, :, target_position])
+    model_tokens = torch.zeros_like(state_cache[:, :, 0])
     model_tokens[:, 0] = sampled_text_token
     model_tokens[:, 1 : lm_model.dep_q + 1] = sampled_audio_tokens
 
@@ -661,6 +814,9 @@ class LMGen(StreamingModule[_LMGenState]):
         save_voice_prompt_embeddings: bool = False,
         sample_rate: int = 32000,
         frame_rate: int = FRAME_RATE_HZ,
+        skip_forced_steps: bool = True,
+        prefill_chunk_size: int = 32,
+        predict_user_stream: bool = True,
     ):
         assert not lm_model.training, "generation shouldn't be used in training mode."
         super().__init__()
@@ -687,12 +843,26 @@ class LMGen(StreamingModule[_LMGenState]):
         if report_loss:
             return_logits = True
         self.return_logits = return_logits
+        # When all the tokens of a step are given, e.g. for the system prompts, only run the
+        # main transformer, as the sampled tokens would be discarded anyway.
+        # This doesn't change the outputs, but the random generator is used less.
+        self.skip_forced_steps = skip_forced_steps and not return_logits
+        # Number of forced steps pushed at once through the main transformer by `prefill`.
+        self.prefill_chunk_size = prefill_chunk_size
+        # The depformer never samples the user stream codebooks when they are given, e.g. when
+        # serving. When False, it also stops after the agent codebooks when they aren't given,
+        # and the user stream is then left empty, as only the agent audio is decoded.
+        self.predict_user_stream = predict_user_stream
         self.max_delay = max(
             lm_model.delays
         )  # with delays, we need to generate a few more time steps.
         self.delays_cuda = torch.tensor(
             lm_model.delays, device=lm_model.device, dtype=torch.long
         )
+        self.delays_cpu = torch.tensor(lm_model.delays, dtype=torch.long)
+        # Codebooks (and their delays) written by `prepare_step_input` for each combination of
+        # given streams (text, moshi, user), built on first use.
+        self._step_codebooks: dict[tuple[bool, bool, bool], tuple[torch.Tensor, torch.Tensor]] = {}
         self.save_voice_prompt_embeddings = save_voice_prompt_embeddings
         self.voice_prompt_audio: Optional[torch.Tensor] = None
         self.voice_prompt_cache: Optional[torch.Tensor] = None
@@ -720,9 +890,117 @@ class LMGen(StreamingModule[_LMGenState]):
         graphed_main = CUDAGraphed(lm_model.forward_codes, disable=disable)
         graphed_embeddings = CUDAGraphed(lm_model.forward_embeddings, disable=disable)
         graphed_depth = CUDAGraphed(self.depformer_step, disable=disable)
+        graphed_advance = CUDAGraphed(lm_model.advance_codes, disable=disable)
+        graphed_advance_embeddings = CUDAGraphed(lm_model.advance_embeddings, disable=disable)
+        graphed_depth_user_given = CUDAGraphed(partial(self.depformer_step, user_given=True), disable=disable)
+
+        # The depformer doesn't follow the streaming state of the LM, as it runs over the
+        # codebooks of a single frame, but its state is allocated here once for all the frames.
+        lm_model.depformer._start_streaming(batch_size)
+
+        offsets = torch.zeros(batch_size, dtype=torch.long)
+        exec_mask = torch.ones(batch_size, dtype=torch.bool)
+        model_exec_mask = torch.ones(batch_size, dtype=torch.bool)
+        forced_steps = torch.zeros(batch_size, dtype=torch.long)
+        user_steps = torch.zeros(batch_size, dtype=torch.long)
+        return _LMGenState(cache, provided, initial, graphed_main, graphed_embeddings, graphed_depth,
+                           offsets, exec_mask, model_exec_mask, forced_steps,
+                           graphed_advance, graphed_advance_embeddings,
+                           user_steps, graphed_depth_user_given, lm_model.ungenerated_token_id)
+
+    def _stop_streaming(self):
+        super()._stop_streaming()
+        self.lm_model.depformer._stop_streaming()
+
+    def set_exec_mask(self, exec_mask: torch.Tensor):
+        """Select the batch entries (slots) advanced by the next calls to `step`.
+
+        Slots outside of the mask are left untouched, which allows some sessions of a batch
+        to be prefilled or to wait for input while the others keep going.
+        The inner transformer mask is updated lazily by `prepare_step_input`.
+        """
+        state = self._streaming_state
+        if state is None:
+            raise RuntimeError(
+                "You should wrap those calls with a `with lm_gen.streaming(): ...`."
+            )
+        state.exec_mask.copy_(exec_mask)
+
+    def output_ready(self) -> torch.Tensor:
+        """Host-side boolean mask of the slots for which the next `step` returns actual tokens.
+        For the other slots, the returned tokens are meaningless and must be ignored."""
+        state = self._streaming_state
+        return state.exec_mask & (state.offsets > self.max_delay)
+
+    def _set_model_exec_mask(self, exec_mask: torch.Tensor):
+        state = self._streaming_state
+        if not torch.equal(state.model_exec_mask, exec_mask):
+            state.model_exec_mask.copy_(exec_mask)
+            self.lm_model.set_exec_mask(exec_mask.to(self.lm_model.device))
+
+    def _expand_batch(self, tokens: Optional[torch.Tensor], B: int) -> Optional[torch.Tensor]:
+        # Prompt tokens are given for a single stream and broadcast over the slots.
+        if tokens is None or not isinstance(tokens, torch.Tensor) or tokens.dim() == 0:
+            return tokens
+        if tokens.shape[0] == 1 and B > 1:
+            tokens = tokens.expand(B, *tokens.shape[1:])
+        return tokens
+
+    def _get_step_codebooks(self, streams: tuple[bool, bool, bool]) -> tuple[torch.Tensor, torch.Tensor]:
+        # Codebooks of the given streams, in the order of `_write_step_tokens`, and their delays.
+        if streams not in self._step_codebooks:
+            needed_tokens = self.lm_model.num_codebooks - AUDIO_TOKENS_PER_STREAM - 1
+            text, moshi, user = streams
+            ks = []
+            if text:
+                ks.append(0)
+            if moshi:
+                ks.extend(range(1, 1 + needed_tokens))
+            if user:
+                ks.extend(range(AUDIO_TOKENS_PER_STREAM + 1, AUDIO_TOKENS_PER_STREAM + 1 + needed_tokens))
+            ks = torch.tensor(ks, device=self.delays_cuda.device, dtype=torch.long)
+            self._step_codebooks[streams] = ks, self.delays_cuda[ks]
+        return self._step_codebooks[streams]
+
+    def _write_step_tokens(self, rows: torch.Tensor, offsets: torch.Tensor,
+                           input_tokens: Optional[torch.Tensor], moshi_tokens: Optional[torch.Tensor],
+                           text_token: Optional[torch.Tensor]):
+        # Writes the tokens given for the slots `rows`, at offsets + delays, and the initial tokens
+        # of the delayed codebooks at the very beginning, with one scatter into `cache` and one into
+        # `provided` for all the given streams, whatever the number of codebooks.
+        state = self._streaming_state
+        B, K, CT = state.cache.shape
+        device = state.cache.device
+        rows_ = rows.to(device)
+        tokens = []
+        if text_token is not None:
+            text_token = self._expand_batch(text_token, B)
+            if isinstance(text_token, torch.Tensor) and text_token.dim() > 0:
+                text_token = text_token.view(B)[rows_]
+            text_token = torch.as_tensor(text_token, dtype=torch.long, device=device)
+            tokens.append(text_token.view(-1, 1).expand(len(rows), 1))
+        if moshi_tokens is not None:
+            tokens.append(self._expand_batch(moshi_tokens, B)[rows_, :, 0])
+        if input_tokens is not None:
+            tokens.append(self._expand_batch(input_tokens, B)[rows_, :, 0])
+        if tokens:
+            ks, delays = self._get_step_codebooks(
+                (text_token is not None, moshi_tokens is not None, input_tokens is not None))
+            write_positions = (offsets.to(device)[:, None] + delays[None, :]) % CT
+            index = (rows_[:, None], ks[None, :], write_positions)
+            state.cache[index] = tokens[0] if len(tokens) == 1 else torch.cat(tokens, dim=1)
+            state.provided[index] = True
+
+        # Only for the very beginning, we extend the initial token for the acoustic
+        # token that are delayed, and thus have no good value to take.
+        init = offsets[:, None] <= self.delays_cpu[None, :]
+        if init.any():
+            init_rows, init_ks = init.nonzero(as_tuple=True)
+            init_ks = init_ks.to(device)
+            index = (rows_[init_rows.to(device)], init_ks, (offsets[init_rows] % CT).to(device))
+            state.cache[index] = state.initial[0, init_ks, 0]
+            state.provided[index] = True
 
-        return _LMGenState(cache, provided, initial, graphed_main, graphed_embeddings, graphed_depth)
-    
     @torch.no_grad()
     def prepare_step_input(self,
                            input_tokens: torch.Tensor=None,
@@ -738,78 +1016,81 @@ class LMGen(StreamingModule[_LMGenState]):
 
         # audio_tokens_per_stream = lm_model.dep_q//2
         needed_tokens = lm_model.num_codebooks - AUDIO_TOKENS_PER_STREAM - 1
-        CT = state.cache.shape[2]
-
-        ####
-        # Fill Cache with provided tokens at state.offset (target) + delays
+        B, K, CT = state.cache.shape
+        device = state.cache.device
 
+        # Only the slots in the exec mask are advanced, `rows` are their indices.
+        rows = state.exec_mask.nonzero()[:, 0]
+        if len(rows) == 0:
+            return None
+        offsets = state.offsets[rows]
+        if input_tokens is not None and moshi_tokens is not None and text_token is not None:
+            state.forced_steps[rows] += 1
+        else:
+            state.forced_steps[rows] = 0
         if input_tokens is not None:
-            assert input_tokens.dim() == 3, "Shape should be [B, K, T]."
-            B, Ki, S = input_tokens.shape
-            assert S == 1, "Only support being given steps one by one."
-            assert (
-                Ki == needed_tokens
-            ), f"We expect {needed_tokens} tokens from the user stream, got {Ki}."
-
-            for q_other in range(input_tokens.shape[1]):
-                k = AUDIO_TOKENS_PER_STREAM + 1 + q_other
-                delay = lm_model.delays[k]
-                write_position = (state.offset + delay) % CT
-                state.cache[:, k, write_position : write_position + 1] = input_tokens[:, q_other]
-                state.provided[:, k, write_position : write_position + 1] = True
+            state.user_steps[rows] += 1
+        else:
+            state.user_steps[rows] = 0
 
-        if moshi_tokens is not None:
-            assert moshi_tokens.dim() == 3, "Shape should be [B, K, T]."
-            B, Ki, S = moshi_tokens.shape
-            assert S == 1, "Only support being given steps one by one."
-            assert (
-                Ki == needed_tokens
-            ), f"We expect {needed_tokens} tokens from the moshi stream, got {Ki}."
-
-            for q_moshi in range(moshi_tokens.shape[1]):
-                k = 1 + q_moshi
-                delay = lm_model.delays[k]
-                write_position = (state.offset + delay) % CT
-                state.cache[:, k, write_position : write_position + 1] = moshi_tokens[:, q_moshi]
-                state.provided[:, k, write_position : write_position + 1] = True
+        for name, tokens in (("user", input_tokens), ("moshi", moshi_tokens)):
+            if tokens is not None:
+                assert tokens.dim() == 3, "Shape should be [B, K, T]."
+                _, Ki, S = tokens.shape
+                assert S == 1, "Only support being given steps one by one."
+                assert (
+                    Ki == needed_tokens
+                ), f"We expect {needed_tokens} tokens from the {name} stream, got {Ki}."
 
-        if text_token is not None:
-            write_position = (state.offset + lm_model.delays[0]) % CT
-            state.cache[:, 0, write_position] = text_token
-            state.provided[:, 0, write_position] = True
-
-        for k, delay in enumerate(lm_model.delays):
-            # Only for the very beginning, we extend the initial token for the acoustic
-            # token that are delayed, and thus have no good value to take.
-            if state.offset <= delay:
-                state.cache[:, k, state.offset % CT] = state.initial[:, k, 0]
-                state.provided[:, k, state.offset % CT] = True
+        ####
+        # Fill Cache with provided tokens at state.offset (target) + delays
+        self._write_step_tokens(rows, offsets, input_tokens, moshi_tokens, text_token)
 
         ####
         # Perform inference at state.offset - 1 (model_input); forcing with tokens at state.offset (target) when provided
 
-        if state.offset == 0:
+        first = offsets == 0
+        if first.any():
             # We can't report loss or force depth tranformer tokens until we're at step 2
             # And we need to initialize the delay-0 cache where it's not provided for step 2
-            state.cache[:, :, 0] = state.initial[:, :, 0] # torch.where(state.provided[:, :, 0], state.cache[:, :, 0], state.initial[:, :, 0])
-            state.offset += 1
-            return None
+            first_rows = rows[first]
+            state.cache[first_rows.to(device), :, 0] = state.initial[0, :, 0]
+            state.offsets[first_rows] += 1
+            rows = rows[~first]
+            if len(rows) == 0:
+                return None
 
-        model_input_position = (state.offset-1) % CT
-        target_position = state.offset % CT
-        input_ = state.cache[:, :, model_input_position : model_input_position + 1]
-        target_ = state.cache[:, :, target_position : target_position + 1]
-        provided_ = state.provided[:, :, target_position : target_position + 1]
+        # Slots actually running through the model for this step.
+        run_mask = torch.zeros(B, dtype=torch.bool)
+        run_mask[rows] = True
+        self._set_model_exec_mask(run_mask)
+        # The target tokens of codebook k were written `delays[k]` steps ago, or set to the
+        # initial token at the very beginning, so they are all provided if all the streams
+        # were given for the last `max_delay + 1` steps, or since the first step.
+        run_offsets = state.offsets[rows]
+        forced = bool((state.forced_steps[rows] > run_offsets.clamp(max=self.max_delay)).all())
+
+        model_input_position = ((state.offsets - 1) % CT).to(device)
+        target_position = (state.offsets % CT).to(device)
+        input_index = model_input_position.view(B, 1, 1).expand(B, K, 1)
+        target_index = target_position.view(B, 1, 1).expand(B, K, 1)
+        input_ = state.cache.gather(2, input_index)
+        target_ = state.cache.gather(2, target_index)
+        provided_ = state.provided.gather(2, target_index)
+        run_mask_ = run_mask.to(device)
+        if not run_mask.all():
+            # Idle slots must still feed valid tokens to the model.
+            input_ = torch.where(run_mask_.view(B, 1, 1), input_, state.initial)
 
         if self.check:
             # Check that we are not feeding in any value that is not generated yet.
             assert not (input_ == lm_model.ungenerated_token_id).any(), (
-                state.offset,
+                state.offsets,
                 input_,
             )
             assert (input_[:, lm_model.audio_offset :] <= lm_model.card).all(), input_
             assert (input_[:, :1] <= lm_model.text_card).all()
-        return input_, provided_, target_, model_input_position, target_position
+        return input_, provided_, target_, model_input_position, target_position, run_mask, forced
 
     @torch.no_grad()
     def step(self, input_tokens: torch.Tensor=None, moshi_tokens:torch.Tensor=None, text_token:torch.Tensor=None,
@@ -824,11 +1105,11 @@ class LMGen(StreamingModule[_LMGenState]):
         # print("MOSHI:", None if moshi_tokens is None else moshi_tokens.squeeze().cpu().tolist()) # DEBUG
         if prepared_inputs is None:
             return (None, None) if self.report_loss or self.return_logits else None
-        input_, provided_, target_, model_input_position, target_position = prepared_inputs
+        input_, provided_, target_, model_input_position, target_position, run_mask, forced = prepared_inputs
         if self.check:
             # Check that we are not feeding in any value that is not generated yet.
             assert not (input_ == lm_model.ungenerated_token_id).any(), (
-                state.offset,
+                state.offsets,
                 input_,
             )
             assert (input_[:, lm_model.audio_offset :] <= lm_model.card).all(), input_
@@ -836,6 +1117,13 @@ class LMGen(StreamingModule[_LMGenState]):
         embeddings = None
         if return_embeddings:
             embeddings = self.lm_model.embed_codes(input_)
+        if forced and self.skip_forced_steps:
+            # All the tokens are known, only the main transformer state needs to move forward.
+            state.graphed_advance(input_)
+            output = self._finish_step(model_input_position, run_mask)
+            if return_embeddings:
+                return output, embeddings
+            return output
         transformer_out, text_logits = state.graphed_main(input_)
         output = self.process_transformer_output(
             transformer_out,
@@ -844,6 +1132,7 @@ class LMGen(StreamingModule[_LMGenState]):
             target_,
             model_input_position,
             target_position,
+            run_mask,
         )
         if return_embeddings:
             return output, embeddings
@@ -861,7 +1150,11 @@ class LMGen(StreamingModule[_LMGenState]):
             )
             if prepared_inputs is not None:
                 break
-        _, provided_, target_, model_input_position, target_position = prepared_inputs
+        _, provided_, target_, model_input_position, target_position, run_mask, forced = prepared_inputs
+        embeddings = self._expand_batch(embeddings, state.cache.shape[0])
+        if forced and self.skip_forced_steps:
+            state.graphed_advance_embeddings(embeddings)
+            return self._finish_step(model_input_position, run_mask)
         transformer_out, text_logits = state.graphed_embeddings(embeddings)
         return self.process_transformer_output(
             transformer_out,
@@ -870,12 +1163,16 @@ class LMGen(StreamingModule[_LMGenState]):
             target_,
             model_input_position,
             target_position,
+            run_mask,
         )
 
     @torch.no_grad()
-    def process_transformer_output(self, transformer_out, text_logits, provided_, target_, model_input_position, target_position):
+    def process_transformer_output(self, transformer_out, text_logits, provided_, target_,
+                                   model_input_position, target_position, run_mask):
         state = self._streaming_state
         lm_model = self.lm_model
+        B, K, CT = state.cache.shape
+        run_mask_ = run_mask.to(state.cache.device).view(B, 1, 1)
 
         # Shape of text_logits should be [B, K_text=1, T=1, Card_text]
         sampled_text_token = sample_token(
@@ -891,24 +1188,34 @@ class LMGen(StreamingModule[_LMGenState]):
 
         next_text_token = torch.where(provided_[:, 0, 0], target_[:, 0, 0], sampled_text_token)
 
+        # Same as for `forced` in `prepare_step_input`, but only for the user stream.
+        run_offsets = state.offsets[run_mask]
+        user_given = bool((state.user_steps[run_mask] > run_offsets.clamp(max=self.max_delay)).all())
+        graphed_depth = state.graphed_depth_user_given if user_given else state.graphed_depth
         if self.return_logits:
-            sampled_audio_tokens, audio_logits = state.graphed_depth(next_text_token, transformer_out, target_[:,lm_model.audio_offset:,0], provided_[:,lm_model.audio_offset:,0]) # [B, K_audio, Card_audio]
+            sampled_audio_tokens, audio_logits = graphed_depth(  # [B, K_audio, Card_audio]
+                next_text_token,
+                transformer_out,
+                target_[:, lm_model.audio_offset:, 0],
+                provided_[:, lm_model.audio_offset:, 0],
+            )
         else:
-            sampled_audio_tokens = state.graphed_depth(next_text_token, transformer_out, target_[:,lm_model.audio_offset:,0], provided_[:,lm_model.audio_offset:,0])
+            sampled_audio_tokens = graphed_depth(
+                next_text_token,
+                transformer_out,
+                target_[:, lm_model.audio_offset:, 0],
+                provided_[:, lm_model.audio_offset:, 0],
+            )
 
-        state.provided[:, :, model_input_position] = False
         ####
         # Fill cache with generated tokens at state.offset (where not provided)
 
-        state.cache[:, 0, target_position] = torch.where(
-            ~state.provided[:, 0, target_position],
-            sampled_text_token,
-            state.cache[:, 0, target_position],
-        )
-        state.cache[:, 1 : lm_model.dep_q + 1, target_position] = torch.where(
-            ~state.provided[:, 1 : lm_model.dep_q + 1, target_position],
-            sampled_audio_tokens,
-            state.cache[:, 1 : lm_model.dep_q + 1, target_position],
+        Kg = lm_model.dep_q + 1
+        sampled_tokens = torch.cat([sampled_text_token[:, None], sampled_audio_tokens], dim=1)[..., None]
+        state.cache.scatter_(
+            2,
+            target_position.view(B, 1, 1).expand(B, Kg, 1),
+            torch.where(~provided_[:, :Kg] & run_mask_, sampled_tokens, target_[:, :Kg]),
         )
 
         ####
@@ -927,29 +1234,15 @@ class LMGen(StreamingModule[_LMGenState]):
                 target_position=target_position,
             )
 
-        ####
-        # Collect outputs for state.offset - max_delay
-
-        if state.offset <= self.max_delay:
-            state.offset += 1
+        out = self._finish_step(model_input_position, run_mask)
+        if out is None:
             if self.report_loss:
                 return None, report
             if self.return_logits:
                 return None, None
             else:
                 return None
-        
-        B = state.cache.shape[0]
-        CT = state.cache.shape[2]
-        gen_delays_cuda = self.delays_cuda[: lm_model.dep_q + 1]
-        index = (
-            ((state.offset - self.max_delay + gen_delays_cuda) % CT)
-            .view(1, -1, 1)
-            .expand(B, -1, 1)
-        )
-        out = state.cache.gather(dim=2, index=index)
 
-        state.offset += 1
         if self.report_loss:
             return out, report
         elif self.return_logits and not self.report_loss:
@@ -957,6 +1250,177 @@ class LMGen(StreamingModule[_LMGenState]):
         else:
             return out
 
+    def _finish_step(self, model_input_position: torch.Tensor, run_mask: torch.Tensor) -> Optional[torch.Tensor]:
+        """Release the input position, move the offsets forward, and collect the tokens
+        at `state.offset - max_delay`, or None if no slot has reached it yet."""
+        state = self._streaming_state
+        B, K, CT = state.cache.shape
+        run_mask_ = run_mask.to(state.cache.device).view(B, 1, 1)
+        input_index = model_input_position.view(B, 1, 1).expand(B, K, 1)
+        state.provided.scatter_(2, input_index, state.provided.gather(2, input_index) & ~run_mask_)
+
+        ####
+        # Collect outputs for state.offset - max_delay
+
+        ready = (state.offsets[run_mask] > self.max_delay).any()
+        offsets = state.offsets.to(state.cache.device, copy=True)
+        state.offsets[run_mask] += 1
+        if not ready:
+            return None
+
+        gen_delays_cuda = self.delays_cuda[: self.lm_model.dep_q + 1]
+        index = (
+            ((offsets.view(B, 1) - self.max_delay + gen_delays_cuda.view(1, -1)) % CT)
+            .view(B, -1, 1)
+        )
+        return state.cache.gather(dim=2, index=index)
+
+    @torch.no_grad()
+    def _prefill_core(self,
+                      num_steps: int,
+                      prepare: Callable[[int], Optional[tuple]],
+                      embed: Callable[[int, torch.Tensor], torch.Tensor],
+                      chunk_size: Optional[int] = None,
+                      ) -> Iterator[None]:
+        """Shared core of `prefill` and `prefill_embeddings`, yielding before each chunk.
+
+        The bookkeeping (cache, provided, offsets) is done step by step as in `step`, but the
+        inputs of the fully forced steps are queued and pushed through the main transformer
+        `chunk_size` steps at a time. Past the first `context - 1` steps, chunks are of a single
+        step, as the ring KV cache is full and the later keys of a chunk would replace, or mask,
+        keys that its first steps still attend to.
+        """
+        state = self._streaming_state
+        if state is None:
+            raise RuntimeError(
+                "You should wrap those calls with a `with lm_gen.streaming(): ...`."
+            )
+        rows = state.exec_mask.nonzero()[:, 0]
+        if num_steps == 0 or len(rows) == 0:
+            return
+        assert (state.offsets[rows] == state.offsets[rows[0]]).all(), \
+            "Slots prefilled together must be at the same offset."
+        chunk_size = chunk_size or self.prefill_chunk_size
+        context = self.lm_model.context
+        pending: list[torch.Tensor] = []
+
+        def _flush():
+            if pending:
+                self.lm_model.advance_embeddings(torch.cat(pending, dim=1))
+                pending.clear()
+
+        yield
+        for step in range(num_steps):
+            # The main transformer starts at the second step, so this step goes at `offset - 1`.
+            offset = int(state.offsets[rows[0]])
+            if pending and (len(pending) >= chunk_size or (context is not None and offset >= context)):
+                _flush()
+                yield
+            prepared = prepare(step)
+            if prepared is None:
+                continue
+            input_, provided_, target_, model_input_position, target_position, run_mask, forced = prepared
+            embeddings = embed(step, input_)
+            if forced and self.skip_forced_steps:
+                pending.append(embeddings)
+                self._finish_step(model_input_position, run_mask)
+            else:
+                # Some tokens are still to be sampled, e.g. right after live steps.
+                _flush()
+                transformer_out, text_logits = state.graphed_embeddings(embeddings)
+                self.process_transformer_output(
+                    transformer_out,
+                    text_logits,
+                    provided_,
+                    target_,
+                    model_input_position,
+                    target_position,
+                    run_mask,
+                )
+        _flush()
+
+    def _iter_prefill(self,
+                      moshi_tokens: torch.Tensor,
+                      text_tokens: Union[torch.Tensor, List[int]],
+                      input_tokens: torch.Tensor,
+                      chunk_size: Optional[int] = None,
+                      saved_embeddings: Optional[list[torch.Tensor]] = None,
+                      ) -> Iterator[None]:
+        device = self.lm_model.device
+        if not isinstance(text_tokens, torch.Tensor):
+            text_tokens = torch.tensor(text_tokens, dtype=torch.long)
+        if text_tokens.dim() == 1:
+            text_tokens = text_tokens[None]
+        text_tokens = text_tokens.to(device)
+        num_steps = moshi_tokens.shape[-1]
+        assert input_tokens.shape[-1] == num_steps and text_tokens.shape[-1] == num_steps, \
+            "All the streams must have the same number of steps."
+
+        def _prepare(step: int):
+            return self.prepare_step_input(
+                input_tokens=input_tokens[:, :, step: step + 1],
+                moshi_tokens=moshi_tokens[:, :, step: step + 1],
+                text_token=text_tokens[:, step],
+            )
+
+        def _embed(step: int, input_: torch.Tensor) -> torch.Tensor:
+            embeddings = self.lm_model.embed_codes(input_)
+            if saved_embeddings is not None:
+                saved_embeddings.append(embeddings)
+            return embeddings
+
+        yield from self._prefill_core(num_steps, _prepare, _embed, chunk_size)
+
+    def _iter_prefill_embeddings(self, embeddings: torch.Tensor,
+                                 chunk_size: Optional[int] = None) -> Iterator[None]:
+        lm_model = self.lm_model
+        needed_input_tokens = lm_model.num_codebooks - AUDIO_TOKENS_PER_STREAM - 1
+        _dummy_audio_token = lm_model._get_initial_token()
+        B = self._streaming_state.cache.shape[0]
+
+        def _prepare(step: int):
+            # Same as `step_embeddings`, the very first step doesn't consume an embedding.
+            while True:
+                prepared = self.prepare_step_input(
+                    input_tokens=_dummy_audio_token[:, 1:1+needed_input_tokens],
+                    moshi_tokens=_dummy_audio_token[:, 1+needed_input_tokens:],
+                    text_token=self.zero_text_code,
+                )
+                if prepared is not None:
+                    return prepared
+
+        def _embed(step: int, input_: torch.Tensor) -> torch.Tensor:
+            return self._expand_batch(embeddings[step], B)
+
+        yield from self._prefill_core(len(embeddings), _prepare, _embed, chunk_size)
+
+    @torch.no_grad()
+    def prefill(self,
+                moshi_tokens: torch.Tensor,
+                text_tokens: Union[torch.Tensor, List[int]],
+                input_tokens: torch.Tensor,
+                chunk_size: Optional[int] = None):
+        """Run a whole forced sequence, e.g. a system prompt, for the slots in the exec mask.
+
+        This leaves the streaming state exactly as calling `step` on each time step would,
+        but runs the main transformer on chunks of steps rather than one step at a time.
+
+        Args:
+            moshi_tokens (torch.Tensor): Tokens of the moshi stream, shape `[B, 8, S]`.
+            text_tokens (torch.Tensor or list of int): Text tokens, shape `[S]` or `[B, S]`.
+            input_tokens (torch.Tensor): Tokens of the user stream, shape `[B, 8, S]`.
+            chunk_size (int, optional): Steps per chunk, defaults to `prefill_chunk_size`.
+        """
+        for _ in self._iter_prefill(moshi_tokens, text_tokens, input_tokens, chunk_size):
+            pass
+
+    @torch.no_grad()
+    def prefill_embeddings(self, embeddings: torch.Tensor, chunk_size: Optional[int] = None):
+        """Same as `prefill`, but replaying the input embeddings of each step, shape `[S, B, 1, D]`,
+        as `step_embeddings` does."""
+        for _ in self._iter_prefill_embeddings(embeddings, chunk_size):
+            pass
+
     def load_voice_prompt(self, voice_prompt: str):
         self.voice_prompt = voice_prompt
         raw_audio = load_audio(
@@ -1007,46 +1471,35 @@ class LMGen(StreamingModule[_LMGenState]):
             max_batch=1,
         )
 
-    def _step_voice_prompt_frame(self,
-                                 voice_prompt_frame_tokens: torch.Tensor,
-                                 saved_embeddings: Optional[list[torch.Tensor]]=None,
-                                 ):
-        # Always use zero_text_code during voice prompt
-        out = self.step(
-            moshi_tokens=voice_prompt_frame_tokens,
-            text_token=self.zero_text_code,
-            input_tokens=self._encode_sine_frame(),
-            return_embeddings=self.save_voice_prompt_embeddings,
-        )
-        if out is not None and self.save_voice_prompt_embeddings:
-            _, embeddings = out
-            saved_embeddings.append(embeddings)
-
     def _step_voice_prompt_core(self, mimi) -> Iterator[None]:
         """Shared core for stepping through the voice prompt.
 
-        This generator yields at each *checkpoint* where the async wrapper may want to
-        consult `is_alive`. The core itself is intentionally unaware of connection state.
+        This generator yields before each step, so that the caller can interleave other work
+        or stop early, see `iter_system_prompts`. The core itself is unaware of connection state.
         """
         if self.voice_prompt_embeddings is not None:
             # Replay stored voice prompt embeddings
-            for next_embed in self.voice_prompt_embeddings:
-                yield
-                self.step_embeddings(next_embed)
+            yield from self._iter_prefill_embeddings(self.voice_prompt_embeddings)
 
             state = self._streaming_state
-            state.cache.copy_(self.voice_prompt_cache)
+            rows = state.exec_mask.to(state.cache.device)
+            state.cache[rows] = self.voice_prompt_cache.to(state.cache.dtype)
             return
 
         elif self.voice_prompt_audio is not None:
-            saved_embeddings = []
+            frames = []
             for voice_prompt_frame_tokens in self._encode_voice_prompt_frames(mimi):
                 yield
-                self._step_voice_prompt_frame(
-                    voice_prompt_frame_tokens,
-                    saved_embeddings
-                )
-            # One last checkpoint before any optional save (nice-to-have for async disconnect)
+                frames.append(voice_prompt_frame_tokens)
+            saved_embeddings = [] if self.save_voice_prompt_embeddings else None
+            # Always use zero_text_code during voice prompt
+            yield from self._iter_prefill(
+                moshi_tokens=torch.cat(frames, dim=-1),
+                text_tokens=[self.zero_text_code] * len(frames),
+                input_tokens=self._encode_sine_frame().expand(-1, -1, len(frames)),
+                saved_embeddings=saved_embeddings,
+            )
+            # One last yield before any optional save, the caller may stop here
             yield
 
             if self.save_voice_prompt_embeddings:
@@ -1062,106 +1515,110 @@ class LMGen(StreamingModule[_LMGenState]):
         print('Done loading voice prompt.')
 
     def _step_voice_prompt(self, mimi):
-        # Sync path intentionally does not support `is_alive` / disconnect checks.
         for _ in self._step_voice_prompt_core(mimi):
             pass
 
-    async def _step_voice_prompt_async(self, mimi, is_alive: Optional[Callable]=None):
-        for _ in self._step_voice_prompt_core(mimi):
-            if is_alive is not None and not await is_alive():
-                break
-
     def _step_audio_silence_core(self) -> Iterator[None]:
         # For slots of silence (default 0.5s) after voice/text prompts
         # (agent text, user audio, agent audio) : (PADs, silence, sine)
-        for _ in range(self.audio_silence_frame_cnt):
-            yield
-            self.step(
-                moshi_tokens=self._encode_zero_frame(),
-                text_token=self.zero_text_code,
-                input_tokens=self._encode_sine_frame(),
-            )
+        count = self.audio_silence_frame_cnt
+        yield from self._iter_prefill(
+            moshi_tokens=self._encode_zero_frame().expand(-1, -1, count),
+            text_tokens=[self.zero_text_code] * count,
+            input_tokens=self._encode_sine_frame().expand(-1, -1, count),
+        )
         print('Done loading audio silence.')
 
     def _step_audio_silence(self):
-        # Sync path intentionally does not support `is_alive` / disconnect checks.
         for _ in self._step_audio_silence_core():
             pass
 
-    async def _step_audio_silence_async(self, is_alive: Optional[Callable]=None):
-        for _ in self._step_audio_silence_core():
-            if is_alive is not None and not await is_alive():
-                break
-
     def _step_text_prompt_core(self) -> Iterator[None]:
-        for text_prompt_token in self.text_prompt_tokens:
-            yield
-            self.step(
-                moshi_tokens=self._encode_zero_frame(),
-                text_token=text_prompt_token,
-                input_tokens=self._encode_sine_frame(),
-            )
+        text_prompt_tokens = list(self.text_prompt_tokens or [])
+        yield from self._iter_prefill(
+            moshi_tokens=self._encode_zero_frame().expand(-1, -1, len(text_prompt_tokens)),
+            text_tokens=text_prompt_tokens,
+            input_tokens=self._encode_sine_frame().expand(-1, -1, len(text_prompt_tokens)),
+        )
         print('Done loading text prompt.')
 
 
     def _step_text_prompt(self):
-        # Sync path intentionally does not support `is_alive` / disconnect checks.
         for _ in self._step_text_prompt_core():
             pass
 
-    async def _step_text_prompt_async(self, is_alive: Optional[Callable]=None):
-        for _ in self._step_text_prompt_core():
-            if is_alive is not None and not await is_alive():
-                break
-
-    async def step_system_prompts_async(self, mimi, is_alive: Optional[Callable]=None):
-        await self._step_voice_prompt_async(mimi, is_alive)
-        await self._step_audio_silence_async(is_alive)
-        await self._step_text_prompt_async(is_alive)
-        await self._step_audio_silence_async(is_alive)
-
     def step_system_prompts(self, mimi):
         self._step_voice_prompt(mimi)
         self._step_audio_silence()
         self._step_text_prompt()
         self._step_audio_silence()
 
+    def iter_system_prompts(self, mimi) -> Iterator[None]:
+        """Step through the system prompts, yielding before each step.
+
+        This lets the caller interleave other work with the prefill, e.g. the live steps
+        of the other slots when running batched, see `set_exec_mask`.
+        """
+        yield from self._step_voice_prompt_core(mimi)
+        yield from self._step_audio_silence_core()
+        yield from self._step_text_prompt_core()
+        yield from self._step_audio_silence_core()
+
     def depformer_step(
         self,
         text_token: torch.Tensor,
         transformer_out: torch.Tensor,
         audio_tokens: torch.Tensor,
-        audio_provided: torch.Tensor
+        audio_provided: torch.Tensor,
+        user_given: bool = False,
     ) -> torch.Tensor:
+        """Run the depformer over the audio codebooks of one frame, returning the sampled tokens.
+
+        Args:
+            text_token (torch.Tensor): Text token of the frame, shape `[B]`.
+            transformer_out (torch.Tensor): Output of the main transformer, shape `[B, 1, D]`.
+            audio_tokens (torch.Tensor): Provided audio tokens, shape `[B, dep_q]`.
+            audio_provided (torch.Tensor): Mask of the provided audio tokens, shape `[B, dep_q]`.
+            user_given (bool): If True, the codebooks of the user stream are provided for all
+                the batch entries, so that the depformer can stop after the agent codebooks.
+                The tokens returned for the skipped codebooks are `zero_token_id`.
+        """
         (B,) = text_token.shape
         prev_token = text_token
         lm_model = self.lm_model
         depformer_tokens: list[torch.Tensor] = []
         depformer_logits: list[torch.Tensor] = []
-        assert not lm_model.depformer.is_streaming
-        with lm_model.depformer.streaming(B):
-            for cb_index in range(lm_model.dep_q):
-                input_ = prev_token[:, None, None]
-                logits = lm_model.forward_depformer(cb_index, input_, transformer_out)
-                if self.return_logits:
-                    assert logits.shape == (B, 1, 1, lm_model.card), logits.shape
-                    ret_logits = logits.squeeze(dim=1).squeeze(dim=1)
-                    assert ret_logits.shape == (B, lm_model.card), ret_logits.shape
-                    depformer_logits.append(ret_logits.float())
-                next_token = sample_token(
-                    logits.float(),
-                    self.use_sampling,
-                    self.temp,
-                    self.top_k,
-                )
-                assert next_token.shape == (B, 1, 1)
-                next_token = next_token[:, 0, 0]  # shape is B
-                prev_token = torch.where(
-                    audio_provided[:, cb_index],
-                    audio_tokens[:, cb_index],
-                    next_token,
-                )
-                depformer_tokens.append(next_token)
+        # The depformer state is allocated once with the one of LMGen, see `_init_streaming_state`,
+        # and only reset in place here, as each frame is a new sequence for the depformer.
+        lm_model.depformer.reset_streaming()
+        num_steps = lm_model.dep_q
+        if (user_given or not self.predict_user_stream) and not self.return_logits:
+            # The user stream codebooks come after the agent ones, so they can't change them.
+            num_steps = min(num_steps, AUDIO_TOKENS_PER_STREAM)
+        for cb_index in range(num_steps):
+            input_ = prev_token[:, None, None]
+            logits = lm_model.forward_depformer(cb_index, input_, transformer_out)
+            if self.return_logits:
+                assert logits.shape == (B, 1, 1, lm_model.card), logits.shape
+                ret_logits = logits.squeeze(dim=1).squeeze(dim=1)
+                assert ret_logits.shape == (B, lm_model.card), ret_logits.shape
+                depformer_logits.append(ret_logits.float())
+            next_token = sample_token(
+                logits.float(),
+                self.use_sampling,
+                self.temp,
+                self.top_k,
+            )
+            assert next_token.shape == (B, 1, 1)
+            next_token = next_token[:, 0, 0]  # shape is B
+            prev_token = torch.where(
+                audio_provided[:, cb_index],
+                audio_tokens[:, cb_index],
+                next_token,
+            )
+            depformer_tokens.append(next_token)
+        for cb_index in range(num_steps, lm_model.dep_q):
+            depformer_tokens.append(torch.full_like(text_token, lm_model.zero_token_id))
 
         assert len(depformer_tokens) == lm_model.dep_q, (
             len(depformer_tokens),
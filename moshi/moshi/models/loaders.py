@@ -23,6 +23,7 @@
 # This source code is licensed under the license found in the
 # LICENSE file in the root directory of this source tree.
 """Retrieves the pretrained models for Moshi and Mimi."""
+import copy
 from pathlib import Path
 import logging
 
@@ -163,6 +164,13 @@ def get_mimi(filename: str | Path,
     return model
 
 
+def share_mimi(mimi: MimiModel) -> MimiModel:
+    """Return a Mimi model using the same weights as `mimi`, with its own streaming state."""
+    memo: dict = {id(tensor): tensor for tensor in mimi.parameters()}
+    memo.update({id(tensor): tensor for tensor in mimi.buffers()})
+    return copy.deepcopy(mimi, memo)
+
+
 def get_moshi_lm(
     filename: str | Path | None,
     copy_missing_weights: bool = True,
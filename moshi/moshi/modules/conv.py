@@ -181,9 +181,18 @@ class NormConvTranspose1d(nn.Module):
 class _StreamingConv1dState:
     padding_to_add: int
     original_padding_to_add: int
-
-    def reset(self):
-        self.padding_to_add = self.original_padding_to_add
+    # Entries reset in the middle of a batched stream, that still need their left padding.
+    pending_reset: torch.Tensor | None = None
+
+    def reset(self, reset_mask: tp.Optional[torch.Tensor] = None):
+        if reset_mask is None:
+            self.padding_to_add = self.original_padding_to_add
+            self.pending_reset = None
+        elif self.padding_to_add == 0:
+            if self.pending_reset is None:
+                self.pending_reset = reset_mask.clone()
+            else:
+                self.pending_reset = self.pending_reset | reset_mask.to(self.pending_reset.device)
 
 
 class StreamingConv1d(StreamingModule[_StreamingConv1dState]):
@@ -272,14 +281,29 @@ class StreamingConv1d(StreamingModule[_StreamingConv1dState]):
             if state.padding_to_add > 0 and x.shape[-1] > 0:
                 x = pad1d(x, (state.padding_to_add, 0), mode=self.pad_mode)
                 state.padding_to_add = 0
+            elif state.pending_reset is not None and x.shape[-1] > 0:
+                self._apply_pending_reset(x)
         return self.conv(x)
 
+    def _apply_pending_reset(self, x: torch.Tensor):
+        # The raw conv already zeroed the history of the reset entries, which matches the
+        # "constant" padding. For "replicate", we fill it with the first sample we get.
+        state = self._streaming_state
+        raw_state = self.conv.conv._streaming_state
+        pending = state.pending_reset.to(x.device)
+        exec_mask = raw_state.exec_mask
+        previous = raw_state.previous
+        if self.pad_mode == "replicate" and previous is not None:
+            fill = x[..., :1].expand_as(previous)
+            raw_state.previous = torch.where((pending & exec_mask).view(-1, 1, 1), fill, previous)
+        state.pending_reset = pending & ~exec_mask
+
 
 @dataclass
 class _StreamingConvTr1dState:
     pass
 
-    def reset(self):
+    def reset(self, reset_mask: tp.Optional[torch.Tensor] = None):
         pass
 
 
@@ -23,6 +23,8 @@
 # This source code is licensed under the license found in the
 # LICENSE file in the root directory of this source tree.
 
+import math
+
 import torch
 from torch import nn
 from torch.nn import functional as F
@@ -42,6 +44,30 @@ def gating_forward_kernel(
     return x
 
 
+@torch_compile_lazy
+def multi_gating_forward_kernel(
+    weight_in: torch.Tensor, weight_out: torch.Tensor, activation, x: torch.Tensor
+):
+    # One matmul per time step, batched with the time first: weight_in is [T, 2 * h, d],
+    # weight_out is [T, d, h] and x is [B, T, d].
+    x = torch.bmm(x.transpose(0, 1), weight_in.transpose(1, 2))
+    T, B, _ = x.shape
+    x = x.view(T, B, 2, -1)
+    x = activation(x[..., 0, :]) * x[..., 1, :]
+    x = torch.bmm(x, weight_out.transpose(1, 2))
+    return x.transpose(0, 1)
+
+
+def _gating_hidden_dim(dim: int, dim_feedforward: int) -> int:
+    # We should have 8 d^2 param, instead we will have
+    # 2 * h * d + h * d = 3 h * d = 8 d^2
+    # so h = 8 d / 3 but following Hervé's advice we use 21 / 8 as an approx.
+    if dim_feedforward == 4 * dim:
+        return (21 * dim) // 8
+    else:
+        return (2 * dim_feedforward) // 3
+
+
 class ActivationGating(nn.Module):
     """
     Gating FFN layer, using the given activation.
@@ -55,13 +81,7 @@ class ActivationGating(nn.Module):
 
     def __init__(self, dim: int, dim_feedforward: int, activation, **factory_kwargs):
         super().__init__()
-        # We should have 8 d^2 param, instead we will have
-        # 2 * h * d + h * d = 3 h * d = 8 d^2
-        # so h = 8 d / 3 but following Hervé's advice we use 21 / 8 as an approx.
-        if dim_feedforward == 4 * dim:
-            hidden = (21 * dim) // 8
-        else:
-            hidden = (2 * dim_feedforward) // 3
+        hidden = _gating_hidden_dim(dim, dim_feedforward)
         self.linear_in = nn.Linear(dim, 2 * hidden, bias=False, **factory_kwargs)
         self.linear_out = nn.Linear(hidden, dim, bias=False, **factory_kwargs)
         self.activation = activation
@@ -72,6 +92,64 @@ class ActivationGating(nn.Module):
         )
 
 
+class MultiActivationGating(nn.Module):
+    """
+    Gating FFN layers with a different set of weights for each time step, like a list of
+    `ActivationGating`, whose weights are stacked so that all the steps of a call are
+    applied with batched matmuls. The state dict keeps the keys of the list of
+    `ActivationGating`, e.g. `0.linear_in.weight`, so that checkpoints load either way.
+    Args:
+        num_steps (int): number of possible time steps, and so of sets of weights.
+        dim (int): dimension of the input and output of the transformer.
+        dim_feedforward (int): dimension of the feedforward of each step.
+        activation (any callable Tensor to Tensor): activation function to use.
+        **factory_kwargs: other kwargs passed to the weights, in particular device and dtype.
+    """
+
+    _fsdp_final = True
+
+    def __init__(self, num_steps: int, dim: int, dim_feedforward: int, activation, **factory_kwargs):
+        super().__init__()
+        hidden = _gating_hidden_dim(dim, dim_feedforward)
+        self.num_steps = num_steps
+        self.linear_in_weight = nn.Parameter(torch.empty(num_steps, 2 * hidden, dim, **factory_kwargs))
+        self.linear_out_weight = nn.Parameter(torch.empty(num_steps, dim, hidden, **factory_kwargs))
+        self.activation = activation
+        # Same init as the nn.Linear of each step.
+        for weight in [self.linear_in_weight, self.linear_out_weight]:
+            bound = 1 / math.sqrt(weight.shape[-1])
+            nn.init.uniform_(weight, -bound, bound)
+        self._register_state_dict_hook(MultiActivationGating._state_dict_hook)
+
+    @staticmethod
+    def _state_dict_hook(module, state_dict, prefix, local_metadata):
+        for name in ["linear_in", "linear_out"]:
+            weight = state_dict.pop(f"{prefix}{name}_weight")
+            for step in range(module.num_steps):
+                state_dict[f"{prefix}{step}.{name}.weight"] = weight[step]
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        for name in ["linear_in", "linear_out"]:
+            keys = [f"{prefix}{step}.{name}.weight" for step in range(self.num_steps)]
+            if all(key in state_dict for key in keys):
+                state_dict[f"{prefix}{name}_weight"] = torch.stack([state_dict.pop(key) for key in keys])
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+    def forward(self, x: torch.Tensor, offset: int):
+        """Apply the weights of the steps `offset` to `offset + T` to x, with shape `[B, T, dim]`."""
+        T = x.shape[1]
+        if T == 1:
+            return gating_forward_kernel(
+                self.linear_in_weight[offset], self.linear_out_weight[offset], self.activation, x
+            )
+        return multi_gating_forward_kernel(
+            self.linear_in_weight[offset : offset + T],
+            self.linear_out_weight[offset : offset + T],
+            self.activation,
+            x,
+        )
+
+
 def _get_activation(name: str):
     if name in ["sigmoid", "tanh", "relu"]:
         return getattr(torch, name)
@@ -101,3 +179,17 @@ def make_gating(
         params <= max_params
     ), f"{name} gating has {params} params, max is {max_params}"
     return gating
+
+
+def make_multi_gating(
+    name: str, num_steps: int, dim: int, dim_feedforward: int, **factory_kwargs
+) -> nn.Module:
+    gating = MultiActivationGating(
+        num_steps, dim, dim_feedforward, _get_activation(name), **factory_kwargs
+    )
+    max_params = 2 * dim * dim_feedforward * num_steps
+    params = sum(p.numel() for p in gating.parameters())
+    assert (
+        params <= max_params
+    ), f"{name} gating has {params} params, max is {max_params}"
+    return gating
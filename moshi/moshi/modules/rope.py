@@ -26,10 +26,47 @@
 from torch import nn
 import math
 import torch
-from ..utils.compile import torch_compile_lazy
 
 
-@torch_compile_lazy
+# The rotations exp(i * freqs * t) of the positions t below ROTATION_TABLE_SIZE are tabulated,
+# and those of its multiples: any position up to ROTATION_TABLE_SIZE ** 2 (15 days of frames at
+# 12.5 Hz) is the product of one of each. This keeps the tables fixed for a whole stream, which
+# CUDA graphs rely on, whatever the offset reached.
+ROTATION_TABLE_SIZE = 4096
+
+
+def rotation_tables(freqs: torch.Tensor, device: torch.device) -> tuple[torch.Tensor, torch.Tensor]:
+    """Tables of the rotations exp(i * freqs * t), for t below `ROTATION_TABLE_SIZE` and for its
+    multiples, as complex64 `[ROTATION_TABLE_SIZE, F]` tensors on `device`, from the float64
+    frequencies `freqs` (shape `[F]`, on the CPU)."""
+    steps = torch.arange(ROTATION_TABLE_SIZE, dtype=torch.float64)
+    angles = torch.stack([steps, steps * ROTATION_TABLE_SIZE])[..., None] * freqs
+    low, high = torch.polar(torch.ones_like(angles), angles).to(device=device, dtype=torch.complex64)
+    return low, high
+
+
+def lookup_rotations(tables: tuple[torch.Tensor, torch.Tensor], positions: torch.Tensor) -> torch.Tensor:
+    """Rotations of the LongTensor `positions` (below `ROTATION_TABLE_SIZE ** 2`) from `rotation_tables`,
+    with shape `[*positions.shape, F]`."""
+    low, high = tables
+    flat = positions.reshape(-1)
+    high_positions = torch.div(flat, ROTATION_TABLE_SIZE, rounding_mode="floor")
+    rot = low.index_select(0, flat % ROTATION_TABLE_SIZE) * high.index_select(0, high_positions)
+    return rot.view(*positions.shape, low.shape[-1])
+
+
+_rope_tables: dict[tuple, tuple[torch.Tensor, torch.Tensor]] = {}
+
+
+def rope_tables(dim: int, max_period: float, device: torch.device) -> tuple[torch.Tensor, torch.Tensor]:
+    """Rotation tables of RoPE over `dim` channels, computed once per device."""
+    key = (dim, max_period, device)
+    if key not in _rope_tables:
+        ds = torch.arange(dim // 2, dtype=torch.float64)
+        _rope_tables[key] = rotation_tables(torch.exp(ds * (-math.log(max_period) * 2 / dim)), device)
+    return _rope_tables[key]
+
+
 def apply_rope(
     q: torch.Tensor,
     k: torch.Tensor,
@@ -41,7 +78,7 @@ def apply_rope(
     Args:
         q (torch.Tensor): queries, shape `[B, T, H, D]`.
         k (torch.Tensor): keys, shape `[B, T, H, D]`.
-        offset (int): current offset, e.g. when streaming.
+        offset (torch.Tensor): current offset, e.g. when streaming, with shape `[B]` or `[1]`.
         max_period (float): maximum period for the cos and sin.
         time_before_heads (bool):  if True, expected [B, T, H, D], else [B, H, T ,D]
     """
@@ -55,38 +92,21 @@ def apply_rope(
     assert D % 2 == 0
     assert max_period > 0
 
-    ds = torch.arange(D // 2, device=q.device, dtype=torch.float32)
-    freqs = torch.exp(ds * (-math.log(max_period) * 2 / D))
-    ts = offset.float() + torch.arange(T, device=q.device, dtype=torch.float32)
+    positions = offset.view(-1, 1) + torch.arange(T, device=q.device, dtype=torch.long)
+    rot = lookup_rotations(rope_tables(D, max_period, q.device), positions)
     if time_before_heads:
-        ts = ts.view(-1, 1, 1)
+        rot = rot.view(-1, T, 1, D // 2)
     else:
-        ts = ts.view(1, -1, 1)
-
-    dims = q.shape[:-1]
-    q = q.view(*dims, D // 2, 2)
-    k = k.view(*dims, D // 2, 2)
-
-    # convention is `r` suffix is real part, `i` is imaginary.
-    qr = q[..., 0].float()
-    qi = q[..., 1].float()
-
-    kr = k[..., 0].float()
-    ki = k[..., 1].float()
-
-    rotr = torch.cos(freqs * ts)
-    roti = torch.sin(freqs * ts)
-    qor = qr * rotr - qi * roti
-    qoi = qr * roti + qi * rotr
-
-    kor = kr * rotr - ki * roti
-    koi = kr * roti + ki * rotr
+        rot = rot.view(-1, 1, T, D // 2)
 
-    dtype = q.dtype
-    qo = torch.stack([qor.to(dtype), qoi.to(dtype)], dim=-1)
-    ko = torch.stack([kor.to(dtype), koi.to(dtype)], dim=-1)
+    # Pairs of channels are the real and imaginary parts, rotated with a complex product in
+    # float32, in place when the upcast already made a copy.
+    def _rotate(x: torch.Tensor) -> torch.Tensor:
+        xc = torch.view_as_complex(x.float().view(*x.shape[:-1], D // 2, 2))
+        xc = xc * rot if x.dtype == torch.float32 else xc.mul_(rot)
+        return torch.view_as_real(xc).view(x.shape).to(x.dtype)
 
-    return qo.view(*dims, D), ko.view(*dims, D)
+    return _rotate(q), _rotate(k)
 
 
 class RotaryEmbedding(nn.Module):
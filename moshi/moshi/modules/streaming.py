@@ -45,7 +45,7 @@ from safetensors.torch import save_file, load_file
 
 
 class Resetable(Protocol):
-    def reset(self) -> None:
+    def reset(self, reset_mask: Optional[torch.Tensor] = None) -> None:
         pass
 
 
@@ -259,6 +259,69 @@ def load_streaming_state(path: str,
     return state_dict
 
 
+def _state_items(streaming_state: Any) -> list[tuple[str, Any]]:
+    if is_dataclass_instance(streaming_state):
+        return [(field.name, getattr(streaming_state, field.name)) for field in fields(streaming_state)]
+    elif hasattr(streaming_state, "asdict"):
+        return list(streaming_state.asdict().items())
+    return []
+
+
+def _get_streaming_state_rows(streaming_state: Any,
+                              rows: torch.Tensor,
+                              prefix: str,
+                              state_dict: StreamingStateDict,
+                              ):
+    """Copy the batch entries selected by `rows` of a streaming state into `state_dict`.
+
+    Parameters
+    ----------
+    streaming_state : Any
+        Specific streaming state object to read from.
+    rows : torch.Tensor
+        Boolean tensor of shape `[B]` selecting the batch entries.
+    prefix : str
+        Prefix to add to each key in `state_dict`.
+    state_dict : StreamingStateDict
+        Flattened state dict receiving the copies.
+    """
+    if hasattr(streaming_state, "get_rows"):
+        for key, value in streaming_state.get_rows(rows).items():
+            state_dict[f"{prefix}.{key}"] = value
+        return
+    for key, value in _state_items(streaming_state):
+        full_key = f"{prefix}.{key}"
+        if isinstance(value, torch.Tensor):
+            # Tensors without a batch dimension, and non tensor values, are shared by the batch.
+            if value.dim() > 0 and value.shape[0] == rows.shape[0]:
+                state_dict[full_key] = value[rows.to(value.device)].clone()
+        else:
+            _get_streaming_state_rows(value, rows, full_key, state_dict)
+
+
+def _set_streaming_state_rows(streaming_state: Any,
+                              rows: torch.Tensor,
+                              prefix: str,
+                              state_dict: StreamingStateDict,
+                              ):
+    """Set in-place the batch entries selected by `rows` of a streaming state,
+    consuming the values of `state_dict`, see `_get_streaming_state_rows`.
+    """
+    if hasattr(streaming_state, "set_rows"):
+        values = {key: state_dict.pop(f"{prefix}.{key}") for key, _ in _state_items(streaming_state)}
+        streaming_state.set_rows(rows, values)
+        return
+    for key, value in _state_items(streaming_state):
+        full_key = f"{prefix}.{key}"
+        if isinstance(value, torch.Tensor):
+            if value.dim() > 0 and value.shape[0] == rows.shape[0]:
+                if full_key not in state_dict:
+                    raise KeyError(f"Expected to find a streaming state for {full_key}.")
+                value[rows.to(value.device)] = state_dict.pop(full_key).to(value.device)
+        else:
+            _set_streaming_state_rows(value, rows, full_key, state_dict)
+
+
 class StreamingModule(abc.ABC, torch.nn.Module, Generic[State]):
     """Common API for streaming components.
 
@@ -341,8 +404,15 @@ class StreamingModule(abc.ABC, torch.nn.Module, Generic[State]):
         finally:
             self._stop_streaming()
 
-    def reset_streaming(self):
-        """Reset the streaming state."""
+    def reset_streaming(self, reset_mask: Optional[torch.Tensor] = None):
+        """Reset the streaming state.
+
+        Parameters
+        ----------
+        reset_mask : Optional[torch.Tensor], optional
+            Boolean tensor of shape `[B]` selecting the batch entries to reset, the
+            other entries are left untouched. By default None, which resets everything.
+        """
 
         def _reset(name: str, module: StreamingModule):
             state = module._streaming_state
@@ -350,10 +420,36 @@ class StreamingModule(abc.ABC, torch.nn.Module, Generic[State]):
                 raise ValueError(
                     f"Trying to reset streaming, but {name} wasn't streaming."
                 )
-            state.reset()
+            state.reset(reset_mask)
 
         self._apply_named_streaming(_reset)
 
+    def set_exec_mask(self, exec_mask: torch.Tensor):
+        """Select the batch entries that are advanced by the next streaming calls.
+
+        Entries with a False value still go through the computation, but their streaming
+        state is left untouched and their outputs should be ignored. The mask is copied
+        in-place, so that it is compatible with CUDA Graphs. A full reset
+        (`reset_streaming()` without a mask) marks all the entries as executed again.
+
+        Parameters
+        ----------
+        exec_mask : torch.Tensor
+            Boolean tensor of shape `[B]`.
+        """
+
+        def _set(name: str, module: StreamingModule):
+            state = module._streaming_state
+            if state is None:
+                raise ValueError(
+                    f"Trying to set the exec mask, but {name} wasn't streaming."
+                )
+            mask = getattr(state, "exec_mask", None)
+            if mask is not None:
+                mask.copy_(exec_mask)
+
+        self._apply_named_streaming(_set)
+
     def get_streaming_state(self) -> dict[str, Any]:
         """Return the complete streaming state, including that of sub-modules."""
         state: dict[str, Any] = {}
@@ -402,6 +498,51 @@ class StreamingModule(abc.ABC, torch.nn.Module, Generic[State]):
         if state:
             raise RuntimeError(f"Some states were not consumed: {list(state.keys())}")
 
+    def get_streaming_state_rows(self, rows: torch.Tensor) -> StreamingStateDict:
+        """Return a copy of the streaming state of some batch entries, including that of
+        sub-modules, as a flattened state dict. The copy stays on the device of the state,
+        so that it can be restored quickly with `set_streaming_state_rows`.
+
+        Parameters
+        ----------
+        rows : torch.Tensor
+            Boolean tensor of shape `[B]` selecting the batch entries to copy.
+
+        Returns
+        -------
+        StreamingStateDict
+            The selected entries of each batched tensor of the streaming state.
+        """
+        state_dict: StreamingStateDict = {}
+
+        def _get(name: str, module: StreamingModule):
+            _get_streaming_state_rows(module._streaming_state, rows, name, state_dict)
+
+        self._apply_named_streaming(_get)
+        return state_dict
+
+    def set_streaming_state_rows(self, state: StreamingStateDict, rows: torch.Tensor):
+        """Set in-place the streaming state of some batch entries, including that of
+        sub-modules, from a state dict returned by `get_streaming_state_rows`.
+        The other batch entries are left untouched.
+
+        Parameters
+        ----------
+        state : StreamingStateDict
+            Flattened state dict, as returned by `get_streaming_state_rows`.
+        rows : torch.Tensor
+            Boolean tensor of shape `[B]` selecting the batch entries to set, with as
+            many selected entries as when the state was copied.
+        """
+        state = dict(state)
+
+        def _set(name: str, module: StreamingModule):
+            _set_streaming_state_rows(module._streaming_state, rows, name, state)
+
+        self._apply_named_streaming(_set)
+        if state:
+            raise RuntimeError(f"Some states were not consumed: {list(state.keys())}")
+
     def set_streaming_state(self, state: dict[str, Any]):
         """Set the streaming state, including that of sub-modules."""
         state = dict(state)
@@ -422,7 +563,7 @@ class StreamingModule(abc.ABC, torch.nn.Module, Generic[State]):
 class _NullState:
     pass
 
-    def reset(self) -> None:
+    def reset(self, reset_mask: Optional[torch.Tensor] = None) -> None:
         pass
 
 
@@ -431,14 +572,25 @@ class StreamingContainer(StreamingModule[_NullState]):
         return _NullState()
 
 
+def _zero_rows(x: torch.Tensor, mask: torch.Tensor) -> torch.Tensor:
+    # Zero the batch entries of `x` ([B, C, T]) selected by `mask` ([B]).
+    return x.masked_fill(mask.to(x.device).view(-1, 1, 1), 0)
+
+
 @dataclass
 class _StreamingAddState:
     previous_x: torch.Tensor | None = None
     previous_y: torch.Tensor | None = None
 
-    def reset(self):
-        self.previous_x = None
-        self.previous_y = None
+    def reset(self, reset_mask: Optional[torch.Tensor] = None):
+        if reset_mask is None:
+            self.previous_x = None
+            self.previous_y = None
+        else:
+            if self.previous_x is not None:
+                self.previous_x = _zero_rows(self.previous_x, reset_mask)
+            if self.previous_y is not None:
+                self.previous_y = _zero_rows(self.previous_y, reset_mask)
 
 
 class StreamingAdd(StreamingModule[_StreamingAddState]):
@@ -463,10 +615,17 @@ class StreamingAdd(StreamingModule[_StreamingAddState]):
 
 @dataclass
 class _StreamingConvState:
+    exec_mask: torch.Tensor
     previous: torch.Tensor | None = None
 
-    def reset(self):
-        self.previous = None
+    def reset(self, reset_mask: Optional[torch.Tensor] = None):
+        if reset_mask is None:
+            self.previous = None
+            self.exec_mask.fill_(True)
+        elif self.previous is not None:
+            # In steady state, `previous` holds exactly the left padding a fresh
+            # stream would get, so zeroing it is equivalent to a restart with zero padding.
+            self.previous = _zero_rows(self.previous, reset_mask)
 
 
 class RawStreamingConv1d(torch.nn.Conv1d, StreamingModule[_StreamingConvState]):
@@ -478,7 +637,8 @@ class RawStreamingConv1d(torch.nn.Conv1d, StreamingModule[_StreamingConvState]):
         ), "stride must be less than kernel_size."
 
     def _init_streaming_state(self, batch_size: int) -> _StreamingConvState:
-        return _StreamingConvState()
+        exec_mask = torch.ones(batch_size, dtype=torch.bool, device=self.weight.device)
+        return _StreamingConvState(exec_mask)
 
     def forward(self, input: torch.Tensor) -> torch.Tensor:
         stride = self.stride[0]
@@ -499,7 +659,13 @@ class RawStreamingConv1d(torch.nn.Conv1d, StreamingModule[_StreamingConvState]):
             # We will compute `num_frames` outputs, and we are advancing by `stride`
             # for each of the frame, so we know the data before `stride * num_frames`
             # will never be used again.
-            self._streaming_state.previous = input[..., offset:]
+            new_previous = input[..., offset:]
+            if previous is not None and previous.shape == new_previous.shape:
+                # Batch entries that are not executed keep their previous state.
+                new_previous = torch.where(
+                    self._streaming_state.exec_mask.view(-1, 1, 1), new_previous, previous
+                )
+            self._streaming_state.previous = new_previous
             if num_frames > 0:
                 input_length = (num_frames - 1) * stride + kernel
                 out = super().forward(input[..., :input_length])
@@ -513,10 +679,22 @@ class RawStreamingConv1d(torch.nn.Conv1d, StreamingModule[_StreamingConvState]):
 
 @dataclass
 class _StreamingConvTrState:
+    exec_mask: torch.Tensor
     partial: torch.Tensor | None = None
-
-    def reset(self):
-        self.partial = None
+    # Entries reset since their last execution, their `partial` must not contribute.
+    pending_reset: torch.Tensor | None = None
+
+    def reset(self, reset_mask: Optional[torch.Tensor] = None):
+        if reset_mask is None:
+            self.partial = None
+            self.pending_reset = None
+            self.exec_mask.fill_(True)
+        elif self.partial is not None:
+            reset_mask = reset_mask.to(self.exec_mask.device)
+            if self.pending_reset is None:
+                self.pending_reset = reset_mask.clone()
+            else:
+                self.pending_reset |= reset_mask
 
 
 class RawStreamingConvTranspose1d(
@@ -532,7 +710,8 @@ class RawStreamingConvTranspose1d(
         assert self.output_padding[0] == 0, "Output padding not supported."
 
     def _init_streaming_state(self, batch_size: int) -> _StreamingConvTrState:
-        return _StreamingConvTrState()
+        exec_mask = torch.ones(batch_size, dtype=torch.bool, device=self.weight.device)
+        return _StreamingConvTrState(exec_mask)
 
     def forward(self, x: torch.Tensor) -> torch.Tensor:  # type: ignore
         B, C, T = x.shape
@@ -547,7 +726,15 @@ class RawStreamingConvTranspose1d(
                 )
             out = super().forward(x)
             OT = out.shape[-1]
-            partial = self._streaming_state.partial
+            state = self._streaming_state
+            partial = state.partial
+            previous_partial = partial
+            if partial is not None and state.pending_reset is not None:
+                # Freshly reset entries start without any overlap, which is what a bias-only
+                # partial gives below.
+                bias = 0 if self.bias is None else self.bias[:, None]
+                partial = torch.where(state.pending_reset.view(-1, 1, 1), bias, partial)
+                state.pending_reset = state.pending_reset & ~state.exec_mask
             if partial is not None:
                 # Due to the potential overlap, the rightmost output of the conv transpose is not
                 # ready to be output, as it will receive contributions from the next input frames.
@@ -566,7 +753,10 @@ class RawStreamingConvTranspose1d(
             invalid_steps = kernel - stride
             partial = out[..., OT - invalid_steps :]
             out = out[..., : OT - invalid_steps]
-            self._streaming_state.partial = partial
+            if previous_partial is not None and previous_partial.shape == partial.shape:
+                # Batch entries that are not executed keep their previous state.
+                partial = torch.where(state.exec_mask.view(-1, 1, 1), partial, previous_partial)
+            state.partial = partial
             return out
 
 
@@ -40,7 +40,7 @@ import torch.nn as nn
 from torch.nn import functional as F
 
 from ..utils.compile import no_compile
-from .gating import make_gating
+from .gating import MultiActivationGating, make_gating, make_multi_gating
 from .rope import RotaryEmbedding
 from .streaming import StreamingModule, StreamingContainer
 
@@ -145,6 +145,9 @@ def create_norm_fn(norm_type: str, dim: int, **kwargs) -> nn.Module:
         raise ValueError(f"Unknown norm type: {norm_type}")
 
 
+_sin_freqs: dict[tuple, torch.Tensor] = {}
+
+
 def create_sin_embedding(
     positions: torch.Tensor,
     dim: int,
@@ -154,7 +157,7 @@ def create_sin_embedding(
     """Create sinusoidal positional embedding, with shape `[B, T, C]`.
 
     Args:
-        positions (torch.Tensor): LongTensor of positions.
+        positions (torch.Tensor): LongTensor of positions, with shape `[B, T, 1]`.
         dim (int): Dimension of the embedding.
         max_period (float): Maximum period of the cosine/sine functions.
         dtype (torch.dtype or str): dtype to use to generate the embedding.
@@ -164,13 +167,16 @@ def create_sin_embedding(
     # We aim for BTC format
     assert dim % 2 == 0
     half_dim = dim // 2
-    positions = positions.to(dtype)
-    adim = torch.arange(half_dim, device=positions.device, dtype=dtype).view(1, 1, -1)
-    max_period_tensor = torch.full(
-        [], max_period, device=positions.device, dtype=dtype
-    )  # avoid sync point
-    phase = positions / (max_period_tensor ** (adim / (half_dim - 1)))
-    return torch.cat([torch.cos(phase), torch.sin(phase)], dim=-1)
+    # The frequencies are computed once per device, in float64 (built on the CPU, MPS has none).
+    key = (dim, max_period, positions.device, dtype)
+    if key not in _sin_freqs:
+        adim = torch.arange(half_dim, dtype=torch.float64)
+        _sin_freqs[key] = (max_period ** (-adim / (half_dim - 1))).to(positions.device, dtype)
+    phase = positions.to(dtype) * _sin_freqs[key]
+    emb = torch.empty(*phase.shape[:-1], dim, device=phase.device, dtype=dtype)
+    torch.cos(phase, out=emb[..., :half_dim])
+    torch.sin(phase, out=emb[..., half_dim:])
+    return emb
 
 
 def multi_linear(
@@ -190,14 +196,12 @@ def multi_linear(
             time steps provided one by one.
     """
     B, T, C = x.shape
-    ys = []
-    chout, chin = weight.shape
-    weight = weight.view(num_linear, -1, chin)
-    for t in range(T):
-        y = F.linear(x[:, t], weight[t + offset])
-        ys.append(y)
-    out = torch.stack(ys, 1)
-    return out
+    chout = weight.shape[0] // num_linear
+    if T == 1:
+        return F.linear(x, weight[offset * chout : (offset + 1) * chout])
+    # One matmul per time step, batched with the time first.
+    weight = weight.view(num_linear, chout, C)[offset : offset + T]
+    return torch.bmm(x.transpose(0, 1), weight.transpose(1, 2)).transpose(0, 1)
 
 
 def set_attention_context(model: nn.Module, context: tp.Optional[int] = None) -> None:
@@ -225,12 +229,18 @@ class KVCacheResult(tp.NamedTuple):
     def from_kv(keys: torch.Tensor, values: torch.Tensor) -> "KVCacheResult":
         B, H, T, D = keys.shape
         assert tuple(values.shape[:-1]) == (B, H, T)
-        positions = torch.arange(T, device=keys.device, dtype=torch.long)
+        positions = torch.arange(T, device=keys.device, dtype=torch.long).view(1, -1)
         return KVCacheResult(keys, values, positions)
 
 
 class RingKVCache:
     """Efficient streaming KVCache to be compatible with Cuda Graph.
+    Each batch entry keeps its own end offset, so that entries can be reset
+    or skipped independently.
+
+    The positions of the keys in the ring, and the attention mask of a single
+    time step, are kept up to date by each call to `complete`, which only
+    updates the slots it writes to.
 
     Args:
         batch_size (int): Batch size.
@@ -255,51 +265,100 @@ class RingKVCache:
             device=device,
             dtype=dtype,
         )
-        self.end_offset = torch.zeros(1, device=device, dtype=torch.long)
-
-    def reset(self):
-        self.end_offset.zero_()
-
-    def complete(self, k: torch.Tensor, v: torch.Tensor) -> KVCacheResult:
+        self.end_offset = torch.zeros(batch_size, device=device, dtype=torch.long)
+        # Position of the keys in each slot, -1 if not written since the last reset.
+        self.positions = torch.full((batch_size, capacity), -1, device=device, dtype=torch.long)
+        # Slots attended by a single time step at the end offset before the last call to `complete`.
+        self.mask = torch.zeros((batch_size, capacity), device=device, dtype=torch.bool)
+
+    def reset(self, reset_mask: tp.Optional[torch.Tensor] = None):
+        if reset_mask is None:
+            self.end_offset.zero_()
+            self.positions.fill_(-1)
+            self.mask.fill_(False)
+        else:
+            reset_mask = reset_mask.to(self.end_offset.device)
+            self.end_offset.masked_fill_(reset_mask, 0)
+            self.positions.masked_fill_(reset_mask.view(-1, 1), -1)
+            self.mask.masked_fill_(reset_mask.view(-1, 1), False)
+
+    def complete(
+        self, k: torch.Tensor, v: torch.Tensor, exec_mask: tp.Optional[torch.Tensor] = None
+    ) -> KVCacheResult:
         assert k.shape[:-1] == v.shape[:-1], (k.shape, v.shape)
         B, H, T, D = k.shape
-        indexes = torch.arange(T, device=self.end_offset.device, dtype=self.end_offset.dtype) + self.end_offset
-        indexes = indexes % self.capacity
-        self.cache[0].index_copy_(2, indexes, k)
-        self.cache[1].index_copy_(2, indexes, v)
-        self.end_offset.add_(T)
-
-        keys = self.cache[0]
-        values = self.cache[1]
+        positions = torch.arange(T, device=self.end_offset.device, dtype=self.end_offset.dtype)
+        positions = positions + self.end_offset.view(-1, 1)
+        slots = positions % self.capacity
+        # Entries that are not executed still go through the scatter, but write back the
+        # current values, so that their state is left untouched.
+        indexes = slots.view(1, B, 1, T, 1).expand(2, -1, H, -1, D)
+        kv = torch.stack([k, v])
+        if exec_mask is not None:
+            kv = torch.where(exec_mask.view(1, B, 1, 1, 1), kv, self.cache.gather(3, indexes))
+        self.cache.scatter_(3, indexes, kv)
+        if exec_mask is None:
+            self.end_offset.add_(T)
+            self.positions.scatter_(1, slots, positions)
+        else:
+            self.end_offset.copy_(
+                torch.where(exec_mask, self.end_offset + T, self.end_offset)
+            )
+            self.positions.scatter_(
+                1, slots, torch.where(exec_mask.view(-1, 1), positions, self.positions.gather(1, slots))
+            )
 
-        indexes = torch.arange(
-            self.capacity, device=self.end_offset.device, dtype=torch.long
-        )
-        invalid = indexes >= self.end_offset
-
-        end_index = self.end_offset % self.capacity
-        delta = indexes - end_index
-
-        # If last key is for step S, and capacity is C, last key was written at index S % C.
-        # then end_offset = S + 1, and end_index = (S + 1) % C.
-        # Then for index = (S % C), delta = -1, and the next code gives us:
-        # position(index) = (S + 1) - 1 = S, all good.
-        # Now the time step at end_offset is actually the oldest in the KVCache, e.g., its
-        # position should be (S - self.capacity + 1).
-        # The following code gives us:
-        # position(index + 1) = S + 1 + 0 - self.capacity.
-
-        positions = torch.where(
-            delta <= 0,
-            self.end_offset + delta,
-            self.end_offset + delta - self.capacity,
-        )
-        positions = torch.where(invalid, torch.full_like(positions, -1), positions)
+        # If last key is for step S, and capacity is C, last key was written at index S % C,
+        # and end_offset = S + 1. The next index, end_offset % C, holds the oldest key,
+        # for step S + 1 - C, which is given the position S + 1 of the step that will
+        # overwrite it, so that it is not attended anymore.
+        end_offset = self.end_offset.view(-1, 1)
+        next_slot = end_offset % self.capacity
+        self.positions.scatter_(1, next_slot, torch.where(end_offset >= self.capacity, end_offset, -1))
+
+        if T == 1:
+            # Only the written and next slots changed, the query is at the former end offset.
+            touched = torch.cat([slots, next_slot], dim=1)
+            touched_positions = self.positions.gather(1, touched)
+            touched_mask = (touched_positions >= 0) & (touched_positions <= positions)
+            if exec_mask is not None:
+                touched_mask = torch.where(exec_mask.view(-1, 1), touched_mask, self.mask.gather(1, touched))
+            self.mask.scatter_(1, touched, touched_mask)
+        else:
+            # As after a single step of each entry, which the next single step completes.
+            torch.logical_and(self.positions >= 0, self.positions < end_offset, out=self.mask)
 
-        return KVCacheResult(keys, values, positions)
+        return KVCacheResult(self.cache[0], self.cache[1], self.positions)
 
     def asdict(self):
-        return {"cache": self.cache, "end_offset": self.end_offset}
+        return {
+            "cache": self.cache,
+            "end_offset": self.end_offset,
+            "positions": self.positions,
+            "mask": self.mask,
+        }
+
+    def get_rows(self, rows: torch.Tensor) -> dict[str, torch.Tensor]:
+        """Copy the cache of the batch entries selected by `rows`, only keeping the
+        part of the ring that was written to, see `StreamingModule.get_streaming_state_rows`."""
+        rows = rows.to(self.end_offset.device)
+        end_offset = self.end_offset[rows]
+        length = min(int(end_offset.max().item()) if end_offset.numel() else 0, self.capacity)
+        return {
+            "cache": self.cache[:, rows, :, :length].clone(),
+            "end_offset": end_offset.clone(),
+            "positions": self.positions[rows].clone(),
+            "mask": self.mask[rows].clone(),
+        }
+
+    def set_rows(self, rows: torch.Tensor, values: dict[str, torch.Tensor]):
+        rows = rows.to(self.end_offset.device)
+        cache = values["cache"]
+        # Positions after the end offset are masked, so the rest of the ring can keep stale values.
+        self.cache[:, rows, :, : cache.shape[3]] = cache.to(self.cache)
+        self.end_offset[rows] = values["end_offset"].to(self.end_offset)
+        self.positions[rows] = values["positions"].to(self.positions)
+        self.mask[rows] = values["mask"].to(self.mask)
 
 
 @dataclass
@@ -307,11 +366,18 @@ class _MHAState:
     kv_cache: RingKVCache
     offset: torch.Tensor
     offset_cpu: int
-
-    def reset(self):
-        self.kv_cache.reset()
-        self.offset.zero_()
-        self.offset_cpu = 0
+    exec_mask: torch.Tensor
+
+    def reset(self, reset_mask: tp.Optional[torch.Tensor] = None):
+        self.kv_cache.reset(reset_mask)
+        if reset_mask is None:
+            self.offset.zero_()
+            self.offset_cpu = 0
+            self.exec_mask.fill_(True)
+        else:
+            # `offset_cpu` is shared by the batch, it only matters with `weights_per_step`,
+            # whose streaming state is always fully reset.
+            self.offset.masked_fill_(reset_mask.to(self.offset.device), 0)
 
 
 class StreamingMultiheadAttention(StreamingModule[_MHAState]):
@@ -386,8 +452,9 @@ class StreamingMultiheadAttention(StreamingModule[_MHAState]):
         )
         return _MHAState(
             kv_cache,
-            offset=torch.zeros(1, device=device, dtype=torch.long),
+            offset=torch.zeros(batch_size, device=device, dtype=torch.long),
             offset_cpu=0,
+            exec_mask=torch.ones(batch_size, device=device, dtype=torch.bool),
         )
 
     def _complete_kv(self, k, v) -> KVCacheResult:
@@ -395,7 +462,7 @@ class StreamingMultiheadAttention(StreamingModule[_MHAState]):
         if state is None:
             return KVCacheResult.from_kv(k, v)
         else:
-            return state.kv_cache.complete(k, v)
+            return state.kv_cache.complete(k, v, state.exec_mask)
 
     def forward(self, query: torch.Tensor, key: torch.Tensor, value: torch.Tensor):
         state = self._streaming_state
@@ -423,15 +490,26 @@ class StreamingMultiheadAttention(StreamingModule[_MHAState]):
             q, k = self.rope(q, k, offset, time_before_heads=False)
 
         k, v, pos_k = self._complete_kv(k, v)
-        if self.causal:
-            pos_k = pos_k.view(1, -1)
-            pos_q = offset + torch.arange(T, device=q.device, dtype=torch.long).view(
-                -1, 1
+        if (
+            self.causal
+            and state is not None
+            and T == 1
+            and (self.context is None or self.context >= state.kv_cache.capacity)
+        ):
+            # The ring keeps the mask of a single step up to date, no key is out of the context.
+            attn_bias = state.kv_cache.mask[:, None, None]
+        elif self.causal:
+            # pos_k is [B, K] (or [1, K]) and offset is [B] (or [1]), with one offset per batch entry.
+            pos_k = pos_k[:, None]
+            pos_q = offset.view(-1, 1, 1) + torch.arange(T, device=q.device, dtype=torch.long).view(
+                1, -1, 1
             )
             delta = pos_q - pos_k
             attn_bias = (pos_k >= 0) & (delta >= 0)
             if self.context is not None:
                 attn_bias = attn_bias & (delta < self.context)
+            # Broadcasting over the heads.
+            attn_bias = attn_bias[:, None]
         else:
             attn_bias = None
         x = F.scaled_dot_product_attention(q, k, v, attn_bias, dropout_p=0.0)
@@ -442,7 +520,7 @@ class StreamingMultiheadAttention(StreamingModule[_MHAState]):
         else:
             x = self.out_proj(x)
         if state is not None:
-            state.offset.add_(T)
+            state.offset.copy_(torch.where(state.exec_mask, state.offset + T, state.offset))
             state.offset_cpu += T
         return x
 
@@ -451,8 +529,9 @@ class StreamingMultiheadAttention(StreamingModule[_MHAState]):
 class _LayerState:
     offset_cpu: int
 
-    def reset(self):
-        self.offset_cpu = 0
+    def reset(self, reset_mask: tp.Optional[torch.Tensor] = None):
+        if reset_mask is None:
+            self.offset_cpu = 0
 
 
 class StreamingTransformerLayer(StreamingModule[_LayerState]):
@@ -547,12 +626,18 @@ class StreamingTransformerLayer(StreamingModule[_LayerState]):
                 if isinstance(dim_feedforward, int):
                     dim_feedforward = [dim_feedforward] * weights_per_step
                 assert isinstance(dim_feedforward, list), dim_feedforward
-                self.gating = nn.ModuleList(
-                    [
-                        make_gating(gating, d_model, dim, **factory_kwargs)
-                        for dim in dim_feedforward
-                    ]
-                )
+                if len(set(dim_feedforward)) == 1:
+                    self.gating = make_multi_gating(
+                        gating, weights_per_step, d_model, dim_feedforward[0], **factory_kwargs
+                    )
+                else:
+                    # The weights of different sizes cannot be stacked, one gating per step.
+                    self.gating = nn.ModuleList(
+                        [
+                            make_gating(gating, d_model, dim, **factory_kwargs)
+                            for dim in dim_feedforward
+                        ]
+                    )
             else:
                 assert isinstance(dim_feedforward, int)
                 self.gating = make_gating(
@@ -584,7 +669,9 @@ class StreamingTransformerLayer(StreamingModule[_LayerState]):
             assert self.linear2 is not None
             update = self.linear2(self.activation(self.linear1(x)))
         else:
-            if self.weights_per_step:
+            if isinstance(self.gating, MultiActivationGating):
+                update = self.gating(x, offset)
+            elif self.weights_per_step:
                 assert isinstance(self.gating, nn.ModuleList)
                 B, T, D = x.shape
                 ys = []
@@ -619,9 +706,14 @@ class StreamingTransformerLayer(StreamingModule[_LayerState]):
 @dataclass
 class _TransformerState:
     offset: torch.Tensor
+    exec_mask: torch.Tensor
 
-    def reset(self):
-        self.offset.zero_()
+    def reset(self, reset_mask: tp.Optional[torch.Tensor] = None):
+        if reset_mask is None:
+            self.offset.zero_()
+            self.exec_mask.fill_(True)
+        else:
+            self.offset.masked_fill_(reset_mask.to(self.offset.device), 0)
 
 
 class StreamingTransformer(StreamingModule[_TransformerState]):
@@ -693,7 +785,10 @@ class StreamingTransformer(StreamingModule[_TransformerState]):
 
     def _init_streaming_state(self, batch_size: int) -> _TransformerState:
         device = next(self.parameters()).device
-        return _TransformerState(offset=torch.zeros(1, device=device, dtype=torch.long))
+        return _TransformerState(
+            offset=torch.zeros(batch_size, device=device, dtype=torch.long),
+            exec_mask=torch.ones(batch_size, device=device, dtype=torch.bool),
+        )
 
     def forward(self, x: torch.Tensor, *args, **kwargs):
         B, T, C = x.shape
@@ -716,7 +811,7 @@ class StreamingTransformer(StreamingModule[_TransformerState]):
             x = layer(x, *args, **kwargs)
 
         if state is not None:
-            state.offset.add_(T)
+            state.offset.copy_(torch.where(state.exec_mask, state.offset + T, state.offset))
         return x
 
 
@@ -26,7 +26,9 @@
 
 import argparse
 import asyncio
-from dataclasses import dataclass
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 import random
 import os
 from pathlib import Path
@@ -34,7 +36,7 @@ import tarfile
 import time
 import secrets
 import sys
-from typing import Literal, Optional
+from typing import Iterator, Literal, Optional
 
 import aiohttp
 from aiohttp import web
@@ -49,6 +51,7 @@ from .client_utils import make_log, colorize
 from .models import loaders, MimiModel, LMModel, LMGen
 from .utils.connection import create_ssl_context, get_lan_ip
 from .utils.logging import setup_logger, ColorizedLog
+from .utils.prefix_cache import PrefixCache
 
 
 logger = setup_logger(__name__)
@@ -86,17 +89,59 @@ def wrap_with_system_tags(text: str) -> str:
     return f"<system> {cleaned} <system>"
 
 
+@dataclass
+class _Slot:
+    """A chat session owning one batch slot of the engine."""
+    index: int
+    clog: ColorizedLog
+    voice_prompt_path: Optional[str]
+    text_prompt_tokens: Optional[list[int]]
+    seed: Optional[int]
+    # Set to True (success) or False (aborted) once the system prompts went through.
+    prefilled: asyncio.Future
+    # Key of the system prompts in the prefix cache, set when the prefill starts.
+    prefix_key: Optional[tuple] = None
+    # Input PCM frames of `frame_size` samples, waiting for the next tick.
+    frames: deque = field(default_factory=deque)
+    # Time at which the oldest pending frame was queued.
+    oldest_frame_time: float = 0.0
+    # (pcm, text_token) outputs for each generated frame, None once the slot failed.
+    outputs: asyncio.Queue = field(default_factory=asyncio.Queue)
+    live: bool = False
+    closed: bool = False
+
+
+class _SlotCodec:
+    """Routes the single stream encode calls of the voice prompt to one slot of the batched codec."""
+
+    def __init__(self, state: "ServerState", slot: _Slot):
+        self.state = state
+        self.slot = slot
+
+    def parameters(self):
+        return self.state.mimi.parameters()
+
+    def encode(self, x: torch.Tensor) -> torch.Tensor:
+        state = self.state
+        state._set_exec_mask(state.mimi, state._slot_mask(self.slot))
+        batch = x.new_zeros(state.batch_size, *x.shape[1:])
+        batch[self.slot.index] = x[0]
+        return state.mimi.encode(batch)[self.slot.index: self.slot.index + 1]
+
+
 @dataclass
 class ServerState:
     mimi: MimiModel
-    other_mimi: MimiModel
+    other_mimi: Optional[MimiModel]
     text_tokenizer: sentencepiece.SentencePieceProcessor
     lm_gen: LMGen
-    lock: asyncio.Lock
+    batch_size: int
 
-    def __init__(self, mimi: MimiModel, other_mimi: MimiModel, text_tokenizer: sentencepiece.SentencePieceProcessor,
+    def __init__(self, mimi: MimiModel, other_mimi: Optional[MimiModel],
+                 text_tokenizer: sentencepiece.SentencePieceProcessor,
                  lm: LMModel, device: str | torch.device, voice_prompt_dir: str | None = None,
-                 save_voice_prompt_embeddings: bool = False):
+                 save_voice_prompt_embeddings: bool = False, batch_size: int = 1,
+                 prefix_cache_bytes: int = 0):
         self.mimi = mimi
         self.other_mimi = other_mimi
         self.text_tokenizer = text_tokenizer
@@ -110,27 +155,285 @@ class ServerState:
                             frame_rate=self.mimi.frame_rate,
                             save_voice_prompt_embeddings=save_voice_prompt_embeddings,
         )
-        
-        self.lock = asyncio.Lock()
-        self.mimi.streaming_forever(1)
-        self.other_mimi.streaming_forever(1)
-        self.lm_gen.streaming_forever(1)
-    
+
+        # Continuous batching: every session owns one of the `batch_size` slots, and a single
+        # loop steps all the live slots together, interleaving the prefill of joining sessions.
+        self.batch_size = batch_size
+        # Once one slot has a frame ready, how long to wait for the other live slots
+        # before stepping without them.
+        self.batch_wait = 0.5 / self.mimi.frame_rate
+        self._slots: list[Optional[_Slot]] = [None] * batch_size
+        self._free_slots: asyncio.Queue = asyncio.Queue()
+        for index in range(batch_size):
+            self._free_slots.put_nowait(index)
+        self._waiting_sessions = 0
+        self._prefill_queue: deque[_Slot] = deque()
+        self._prefilling: Optional[_Slot] = None
+        self._prefill_iter: Optional[Iterator[None]] = None
+        self._wakeup = asyncio.Event()
+        self._batch_task: Optional[asyncio.Task] = None
+        # All the model calls go through this single thread, so that they never block the
+        # event loop. Grad mode is per thread, hence the initializer.
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="inference",
+            initializer=torch.set_grad_enabled, initargs=(False,))
+        self._exec_masks: dict[int, torch.Tensor] = {}
+        # Snapshots of the LM state right after the system prompts, keyed by persona.
+        self.prefix_cache = PrefixCache(prefix_cache_bytes)
+
+        self.mimi.streaming_forever(batch_size)
+        if self.other_mimi is not None:
+            self.other_mimi.streaming_forever(batch_size)
+        self.lm_gen.streaming_forever(batch_size)
+
     def warmup(self):
+        # Run on the inference thread, where the model will be used.
+        self._executor.submit(self._warmup).result()
+
+    def _warmup(self):
         for _ in range(4):
-            chunk = torch.zeros(1, 1, self.frame_size, dtype=torch.float32, device=self.device)
+            chunk = torch.zeros(self.batch_size, 1, self.frame_size, dtype=torch.float32, device=self.device)
             codes = self.mimi.encode(chunk)
-            _ = self.other_mimi.encode(chunk)
+            if self.other_mimi is not None:
+                _ = self.other_mimi.encode(chunk)
             for c in range(codes.shape[-1]):
                 tokens = self.lm_gen.step(codes[:, :, c: c + 1])
                 if tokens is None:
                     continue
                 _ = self.mimi.decode(tokens[:, 1:9])
-                _ = self.other_mimi.decode(tokens[:, 1:9])
+                if self.other_mimi is not None:
+                    _ = self.other_mimi.decode(tokens[:, 1:9])
 
         if self.device.type == 'cuda':
             torch.cuda.synchronize()
 
+    def _slot_mask(self, *slots: _Slot) -> torch.Tensor:
+        mask = torch.zeros(self.batch_size, dtype=torch.bool)
+        for slot in slots:
+            mask[slot.index] = True
+        return mask
+
+    def _set_exec_mask(self, module, mask: torch.Tensor):
+        # Updating the mask touches every streaming module, only do it when it changes.
+        previous = self._exec_masks.get(id(module))
+        if previous is None or not torch.equal(previous, mask):
+            module.set_exec_mask(mask)
+            self._exec_masks[id(module)] = mask.clone()
+
+    async def _acquire_slot(self, clog: ColorizedLog, voice_prompt_path: Optional[str],
+                            text_prompt_tokens: Optional[list[int]], seed: Optional[int]) -> _Slot:
+        self._waiting_sessions += 1
+        try:
+            index = await self._free_slots.get()
+        finally:
+            self._waiting_sessions -= 1
+        slot = _Slot(index, clog, voice_prompt_path, text_prompt_tokens, seed,
+                     prefilled=asyncio.get_running_loop().create_future())
+        self._slots[index] = slot
+        self._prefill_queue.append(slot)
+        if self._batch_task is None or self._batch_task.done():
+            self._batch_task = asyncio.create_task(self._batch_loop())
+        self._wakeup.set()
+        return slot
+
+    def _release_slot(self, slot: _Slot):
+        slot.closed = True
+        slot.live = False
+        slot.frames.clear()
+        if self._slots[slot.index] is slot:
+            self._slots[slot.index] = None
+            self._free_slots.put_nowait(slot.index)
+        self._wakeup.set()
+
+    def _push_frame(self, slot: _Slot, frame: np.ndarray):
+        if slot.closed:
+            return
+        if not slot.frames:
+            slot.oldest_frame_time = time.time()
+        slot.frames.append(frame)
+        self._wakeup.set()
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while True:
+                try:
+                    progressed = await self._batch_step(loop)
+                except Exception:
+                    logger.exception("batch step failed, closing the active sessions")
+                    await self._fail_slots(loop)
+                    progressed = False
+                if not progressed:
+                    break
+
+    async def _fail_slots(self, loop: asyncio.AbstractEventLoop):
+        """Close all the sessions after a failed step, and free their slots."""
+        slots = [slot for slot in self._slots if slot is not None]
+        self._prefilling = self._prefill_iter = None
+        self._prefill_queue.clear()
+        try:
+            # The failed step may have left the rows half updated, clear them before they are reused.
+            await loop.run_in_executor(self._executor, self._reset_rows, self._slot_mask(*slots))
+        except Exception:
+            logger.exception("resetting the failed slots failed")
+        for slot in slots:
+            if not slot.prefilled.done():
+                slot.prefilled.set_result(False)
+            # Wakes up the output loop of the session, which then closes it.
+            slot.outputs.put_nowait(None)
+            self._release_slot(slot)
+
+    def _reset_rows(self, mask: torch.Tensor):
+        self.mimi.reset_streaming(mask)
+        if self.other_mimi is not None:
+            self.other_mimi.reset_streaming(mask)
+        self.lm_gen.reset_streaming(mask)
+
+    async def _batch_step(self, loop: asyncio.AbstractEventLoop) -> bool:
+        """Run one unit of work, live slots first. Returns False when there is nothing to do."""
+        live = [slot for slot in self._slots if slot is not None and slot.live]
+        ready = [slot for slot in live if slot.frames]
+        if ready:
+            waited = time.time() - min(slot.oldest_frame_time for slot in ready)
+            if len(ready) == len(live) or waited >= self.batch_wait:
+                frames = []
+                for slot in ready:
+                    frames.append(slot.frames.popleft())
+                    if slot.frames:
+                        slot.oldest_frame_time = time.time()
+                outputs = await loop.run_in_executor(self._executor, self._tick, ready, frames)
+                for slot, output in zip(ready, outputs):
+                    if output is not None and not slot.closed:
+                        slot.outputs.put_nowait(output)
+                return True
+        if await self._prefill_next(loop):
+            return True
+        if ready:
+            # Waiting for the other live slots to get their frame.
+            loop.call_later(self.batch_wait - waited, self._wakeup.set)
+        return False
+
+    async def _prefill_next(self, loop: asyncio.AbstractEventLoop) -> bool:
+        slot = self._prefilling
+        if slot is None:
+            while self._prefill_queue and self._prefill_queue[0].closed:
+                self._prefill_queue.popleft()
+            if not self._prefill_queue:
+                return False
+            slot = self._prefilling = self._prefill_queue.popleft()
+            try:
+                await loop.run_in_executor(self._executor, self._start_prefill, slot)
+            except Exception as exc:
+                slot.clog.log("error", f"failed to load the system prompts: {exc}")
+                slot.closed = True
+        # `closed` is set by the session task reading the socket, checking it is free.
+        if slot.closed:
+            self._prefilling = self._prefill_iter = None
+            if not slot.prefilled.done():
+                slot.prefilled.set_result(False)
+            return True
+        if await loop.run_in_executor(self._executor, self._prefill_step, slot):
+            self._prefilling = self._prefill_iter = None
+            slot.live = True
+            slot.prefilled.set_result(True)
+        return True
+
+    def _prefill_step(self, slot: _Slot) -> bool:
+        """Run one step of the system prompts of `slot`, returns True once they are done."""
+        mask = self._slot_mask(slot)
+        self.lm_gen.set_exec_mask(mask)
+        try:
+            next(self._prefill_iter)
+        except StopIteration:
+            if slot.prefix_key not in self.prefix_cache:
+                self._store_prefix(slot, mask)
+            # Reuse mimi for encoding voice prompt and then reset it before conversation starts
+            self.mimi.reset_streaming(mask)
+            return True
+        return False
+
+    def _start_prefill(self, slot: _Slot):
+        if slot.seed is not None and slot.seed != -1:
+            # Sampling is shared by the whole batch, so this is only reproducible with one slot.
+            seed_all(slot.seed)
+        if slot.voice_prompt_path is not None and self.lm_gen.voice_prompt != slot.voice_prompt_path:
+            if slot.voice_prompt_path.endswith('.pt'):
+                # Load pre-saved voice prompt embeddings
+                self.lm_gen.load_voice_prompt_embeddings(slot.voice_prompt_path)
+            else:
+                self.lm_gen.load_voice_prompt(slot.voice_prompt_path)
+        self.lm_gen.text_prompt_tokens = slot.text_prompt_tokens
+        mask = self._slot_mask(slot)
+        self._reset_rows(mask)
+        slot.prefix_key = (self.lm_gen.voice_prompt, tuple(slot.text_prompt_tokens or ()))
+        snapshot = self.prefix_cache.get(slot.prefix_key)
+        if snapshot is None:
+            self._prefill_iter = self.lm_gen.iter_system_prompts(_SlotCodec(self, slot))
+        else:
+            # Same persona as a previous session, the system prompts are restored in one copy.
+            self.lm_gen.set_streaming_state_rows(snapshot, mask)
+            self._prefill_iter = iter(())
+            slot.clog.log("info", "restored system prompts from the prefix cache")
+
+    def _store_prefix(self, slot: _Slot, mask: torch.Tensor):
+        if self.prefix_cache.max_bytes <= 0:
+            return
+        evictions = self.prefix_cache.evictions
+        if not self.prefix_cache.put(slot.prefix_key, self.lm_gen.get_streaming_state_rows(mask)):
+            slot.clog.log("warning", "system prompts state is larger than the prefix cache budget")
+        elif self.prefix_cache.evictions > evictions:
+            logger.info(f"prefix cache evicted {self.prefix_cache.evictions - evictions} entries, "
+                        f"stats: {self.prefix_cache.stats()}")
+
+    def _tick(self, slots: list[_Slot], frames: list[np.ndarray]) -> list[Optional[tuple[np.ndarray, int]]]:
+        """Step the given live slots on one input frame each, returns for each of them
+        the `(pcm, text_token)` output, or None while in the initial delay."""
+        mask = self._slot_mask(*slots)
+        chunk = torch.zeros(self.batch_size, 1, self.frame_size, dtype=torch.float32)
+        for slot, frame in zip(slots, frames):
+            chunk[slot.index, 0] = torch.from_numpy(frame)
+        chunk = chunk.to(device=self.device)
+        outputs: list[Optional[tuple[np.ndarray, int]]] = [None] * len(slots)
+        self._set_exec_mask(self.mimi, mask)
+        if self.other_mimi is not None:
+            self._set_exec_mask(self.other_mimi, mask)
+        self.lm_gen.set_exec_mask(mask)
+        ready = self.lm_gen.output_ready()
+        codes = self.mimi.encode(chunk)
+        if self.other_mimi is not None:
+            _ = self.other_mimi.encode(chunk)
+        for c in range(codes.shape[-1]):
+            tokens = self.lm_gen.step(codes[:, :, c: c + 1])
+            if tokens is None:
+                continue
+            assert tokens.shape[1] == self.lm_gen.lm_model.dep_q + 1
+            self._set_exec_mask(self.mimi, ready)
+            if self.other_mimi is not None:
+                self._set_exec_mask(self.other_mimi, ready)
+            # Slots still in their initial delay have no valid tokens yet.
+            audio_tokens = torch.where(ready.to(tokens.device).view(-1, 1, 1), tokens[:, 1:9], 0)
+            main_pcm = self.mimi.decode(audio_tokens)
+            if self.other_mimi is not None:
+                _ = self.other_mimi.decode(audio_tokens)
+            main_pcm = main_pcm.cpu()
+            text_tokens = tokens[:, 0, 0].cpu()
+            for i, slot in enumerate(slots):
+                if ready[slot.index]:
+                    outputs[i] = (main_pcm[slot.index, 0].numpy(), text_tokens[slot.index].item())
+        return outputs
+
+
+    async def handle_status(self, request):
+        """Session capacity of the engine, for the clients balancing calls across engines."""
+        free_slots = self._free_slots.qsize()
+        return web.json_response({
+            "batch_size": self.batch_size,
+            "free_slots": free_slots,
+            "active_sessions": self.batch_size - free_slots,
+            "waiting_sessions": self._waiting_sessions,
+        })
 
     async def handle_chat(self, request):
         ws = web.WebSocketResponse()
@@ -160,14 +463,9 @@ class ServerState:
                 )
             else:
                 voice_prompt_path = requested_voice_prompt_path
-                
-        if self.lm_gen.voice_prompt != voice_prompt_path:
-            if voice_prompt_path.endswith('.pt'):
-                # Load pre-saved voice prompt embeddings
-                self.lm_gen.load_voice_prompt_embeddings(voice_prompt_path)
-            else:
-                self.lm_gen.load_voice_prompt(voice_prompt_path)
-        self.lm_gen.text_prompt_tokens = self.text_tokenizer.encode(wrap_with_system_tags(request.query["text_prompt"])) if len(request.query["text_prompt"]) > 0 else None
+
+        # The prompts are loaded by the batch loop when this session's prefill starts.
+        text_prompt_tokens = self.text_tokenizer.encode(wrap_with_system_tags(request.query["text_prompt"])) if len(request.query["text_prompt"]) > 0 else None
         seed = int(request["seed"]) if "seed" in request.query else None
 
         async def recv_loop():
@@ -195,10 +493,13 @@ class ServerState:
                     if kind == 1:  # audio
                         payload = message[1:]
                         opus_reader.append_bytes(payload)
+                        opus_in_event.set()
                     else:
                         clog.log("warning", f"unknown message kind {kind}")
             finally:
                 close = True
+                if slot is not None:
+                    slot.closed = True
                 clog.log("info", "connection closed")
 
         async def opus_loop():
@@ -207,7 +508,8 @@ class ServerState:
             while True:
                 if close:
                     return
-                await asyncio.sleep(0.001)
+                await opus_in_event.wait()
+                opus_in_event.clear()
                 pcm = opus_reader.read_pcm()
                 if pcm.shape[-1] == 0:
                     continue
@@ -216,30 +518,29 @@ class ServerState:
                 else:
                     all_pcm_data = np.concatenate((all_pcm_data, pcm))
                 while all_pcm_data.shape[-1] >= self.frame_size:
-                    be = time.time()
                     chunk = all_pcm_data[: self.frame_size]
                     all_pcm_data = all_pcm_data[self.frame_size:]
-                    chunk = torch.from_numpy(chunk)
-                    chunk = chunk.to(device=self.device)[None, None]
-                    codes = self.mimi.encode(chunk)
-                    _ = self.other_mimi.encode(chunk)
-                    for c in range(codes.shape[-1]):
-                        tokens = self.lm_gen.step(codes[:, :, c: c + 1])
-                        if tokens is None:
-                            continue
-                        assert tokens.shape[1] == self.lm_gen.lm_model.dep_q + 1
-                        main_pcm = self.mimi.decode(tokens[:, 1:9])
-                        _ = self.other_mimi.decode(tokens[:, 1:9])
-                        main_pcm = main_pcm.cpu()
-                        opus_writer.append_pcm(main_pcm[0, 0].numpy())
-                        text_token = tokens[0, 0, 0].item()
-                        if text_token not in (0, 3):
-                            _text = self.text_tokenizer.id_to_piece(text_token)  # type: ignore
-                            _text = _text.replace("▁", " ")
-                            msg = b"\x02" + bytes(_text, encoding="utf8")
-                            await ws.send_bytes(msg)
-                        else:
-                            text_token_map = ['EPAD', 'BOS', 'EOS', 'PAD']
+                    # The batch loop steps this frame together with the other live slots.
+                    self._push_frame(slot, chunk)
+
+        async def output_loop():
+            while True:
+                if close:
+                    return
+                output = await slot.outputs.get()
+                if output is None:
+                    clog.log("error", "batch step failed, closing the session")
+                    return
+                main_pcm, text_token = output
+                opus_writer.append_pcm(main_pcm)
+                opus_out_event.set()
+                if text_token not in (0, 3):
+                    _text = self.text_tokenizer.id_to_piece(text_token)  # type: ignore
+                    _text = _text.replace("▁", " ")
+                    msg = b"\x02" + bytes(_text, encoding="utf8")
+                    await ws.send_bytes(msg)
+                else:
+                    text_token_map = ['EPAD', 'BOS', 'EOS', 'PAD']
 
         def extract_ogg_pages(buffer: bytearray) -> tuple[list[bytes], bytearray]:
             """
@@ -323,7 +624,8 @@ class ServerState:
             while True:
                 if close:
                     return
-                await asyncio.sleep(0.001)
+                await opus_out_event.wait()
+                opus_out_event.clear()
                 msg = opus_writer.read_bytes()
                 if len(msg) > 0:
                     bytes_in_this_second += len(msg)
@@ -383,55 +685,59 @@ class ServerState:
         if len(request.query["voice_prompt"]) > 0:
             clog.log("info", f"voice prompt: {voice_prompt_path} (requested: {requested_voice_prompt_path})")
         close = False
-        async with self.lock:
-            if seed is not None and seed != -1:
-                seed_all(seed)
-
-            opus_writer = sphn.OpusStreamWriter(self.mimi.sample_rate)
-            opus_reader = sphn.OpusStreamReader(self.mimi.sample_rate)
-            self.mimi.reset_streaming()
-            self.other_mimi.reset_streaming()
-            self.lm_gen.reset_streaming()
-            async def is_alive():
-                if close or ws.closed:
-                    return False
+        slot = None
+        opus_writer = sphn.OpusStreamWriter(self.mimi.sample_rate)
+        opus_reader = sphn.OpusStreamReader(self.mimi.sample_rate)
+        # Set when bytes are appended to the reader or pcm to the writer, so that the
+        # loops below only wake up when they have something to do.
+        opus_in_event = asyncio.Event()
+        opus_out_event = asyncio.Event()
+        # Watching the socket from the start, so that a disconnect aborts the prefill.
+        recv_task = asyncio.create_task(recv_loop())
+        try:
+            slot_task = asyncio.create_task(
+                self._acquire_slot(clog, voice_prompt_path, text_prompt_tokens, seed))
+            await asyncio.wait([slot_task, recv_task], return_when=asyncio.FIRST_COMPLETED)
+            if not slot_task.done():
+                slot_task.cancel()
+            else:
+                slot = slot_task.result()
+                clog.log("info", f"using batch slot {slot.index}")
+                if close:
+                    slot.closed = True
+                prefilled = await slot.prefilled
+                clog.log("info", "done with system prompts")
+                # Send the handshake.
+                if prefilled and not close and not ws.closed:
+                    await ws.send_bytes(b"\x00")
+                    clog.log("info", "sent handshake bytes")
+                    # Clean cancellation manager
+                    tasks = [
+                        recv_task,
+                        asyncio.create_task(opus_loop()),
+                        asyncio.create_task(output_loop()),
+                        asyncio.create_task(send_loop()),
+                    ]
+
+                    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                    # Force-kill remaining tasks
+                    for task in pending:
+                        task.cancel()
+                        try:
+                            await task
+                        except asyncio.CancelledError:
+                            pass
+                    await ws.close()
+                    clog.log("info", "session closed")
+        finally:
+            if slot is not None:
+                self._release_slot(slot)
+            if not recv_task.done():
+                recv_task.cancel()
                 try:
-                    # Check for disconnect without waiting too long
-                    msg = await asyncio.wait_for(ws.receive(), timeout=0.01)
-                    if msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
-                        return False
-                except asyncio.TimeoutError:
-                    # No messages → client probably still alive
-                    return True
-                except aiohttp.ClientConnectionError:
-                    return False
-                return True
-            # Reuse mimi for encoding voice prompt and then reset it before conversation starts
-            await self.lm_gen.step_system_prompts_async(self.mimi, is_alive=is_alive)
-            self.mimi.reset_streaming()
-            clog.log("info", "done with system prompts")
-            # Send the handshake.
-            if await is_alive():
-                await ws.send_bytes(b"\x00")
-                clog.log("info", "sent handshake bytes")
-                # Clean cancellation manager
-                tasks = [
-                    asyncio.create_task(recv_loop()),
-                    asyncio.create_task(opus_loop()),
-                    asyncio.create_task(send_loop()),
-                ]
-
-                done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
-                # Force-kill remaining tasks
-                for task in pending:
-                    task.cancel()
-                    try:
-                        await task
-                    except asyncio.CancelledError:
-                        pass
-                await ws.close()
-                clog.log("info", "session closed")
-                # await asyncio.gather(opus_loop(), recv_loop(), send_loop())
+                    await recv_task
+                except asyncio.CancelledError:
+                    pass
         clog.log("info", "done with connection")
         return ws
 
@@ -500,6 +806,9 @@ def main():
     parser.add_argument("--cpu-offload", action="store_true",
                         help="Offload LM model layers to CPU when GPU memory is insufficient. "
                              "Requires 'accelerate' package.")
+    parser.add_argument("--shadow-mimi", action="store_true",
+                        help="Also run the second Mimi codec, whose outputs are discarded, on every frame. "
+                             "It shares the weights of the main codec. Generated tokens are the same without it.")
     parser.add_argument(
         "--voice-prompt-dir",
         type=str,
@@ -509,6 +818,27 @@ def main():
             "Voice prompt filenames from client requests will be joined with this directory path."
         )
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help=(
+            "Number of chat sessions served concurrently. Each session owns one slot "
+            "of the batch, and all the live slots are stepped together."
+        )
+    )
+    parser.add_argument(
+        "--prefix-cache-mb",
+        type=int,
+        default=1024,
+        help=(
+            "Host memory budget in MB for the snapshots of the model state after the system prompts, "
+            "reused by sessions with the same voice and text prompts. 0 disables the cache. "
+            "The snapshots are kept in pinned host memory, not on the GPU. With the 7B model "
+            "a snapshot takes about 0.5 MB per prompt frame, e.g. 90 MB for a 10 s voice prompt "
+            "and a short text prompt."
+        )
+    )
     parser.add_argument(
         "--ssl",
         type=str,
@@ -559,7 +889,9 @@ def main():
     if args.mimi_weight is None:
         args.mimi_weight = hf_hub_download(args.hf_repo, loaders.MIMI_NAME)
     mimi = loaders.get_mimi(args.mimi_weight, args.device)
-    other_mimi = loaders.get_mimi(args.mimi_weight, args.device)
+    # The second codec's outputs are unused, it only runs to keep the compute profile of
+    # the reference implementation, and then shares the weights of the first one.
+    other_mimi = loaders.share_mimi(mimi) if args.shadow_mimi else None
     logger.info("mimi loaded")
 
     if args.tokenizer is None:
@@ -580,11 +912,14 @@ def main():
         device=args.device,
         voice_prompt_dir=args.voice_prompt_dir,
         save_voice_prompt_embeddings=False,
+        batch_size=args.batch_size,
+        prefix_cache_bytes=args.prefix_cache_mb * 1024 * 1024,
     )
     logger.info("warming up the model")
     state.warmup()
     app = web.Application()
     app.router.add_get("/api/chat", state.handle_chat)
+    app.router.add_get("/api/status", state.handle_status)
     if static_path is not None:
         async def handle_root(_):
             return web.FileResponse(os.path.join(static_path, "index.html"))
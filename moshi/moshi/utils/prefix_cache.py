@@ -0,0 +1,111 @@
+# SPDX-FileCopyrightText: Copyright (c) 2026 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: MIT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+"""LRU cache of the streaming state reached after the system prompts."""
+
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+import torch
+
+from ..modules.streaming import StreamingStateDict
+
+
+def state_nbytes(state: StreamingStateDict) -> int:
+    return sum(value.numel() * value.element_size()
+               for value in state.values() if isinstance(value, torch.Tensor))
+
+
+def _to_host(value):
+    if not isinstance(value, torch.Tensor) or value.device.type == "cpu":
+        return value
+    # Pinned, so that restoring the snapshot is a direct copy to the device.
+    host = torch.empty(value.shape, dtype=value.dtype, pin_memory=value.device.type == "cuda")
+    return host.copy_(value)
+
+
+class PrefixCache:
+    """Keeps the streaming state snapshots of the most recently used personas, so that a
+    session reusing the same voice and text prompts can skip their prefill.
+
+    The snapshots are kept in host memory, and copied back to the device of the model
+    when restored, so that the cache doesn't take device memory from the KV caches.
+
+    Args:
+        max_bytes (int): Budget for the snapshots in host memory, the least recently used
+            ones are evicted to stay under it. A snapshot larger than the budget is not stored.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[Hashable, tuple[StreamingStateDict, int]] = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable) -> Optional[StreamingStateDict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: Hashable, state: StreamingStateDict) -> bool:
+        """Store a snapshot, returns False if it doesn't fit in the budget."""
+        nbytes = state_nbytes(state)
+        if nbytes > self.max_bytes:
+            return False
+        state = {name: _to_host(value) for name, value in state.items()}
+        self.pop(key)
+        while self._entries and self.nbytes + nbytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.nbytes -= evicted
+            self.evictions += 1
+            self.evicted_bytes += evicted
+        self._entries[key] = (state, nbytes)
+        self.nbytes += nbytes
+        return True
+
+    def pop(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[1]
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "evicted_bytes": self.evicted_bytes,
+        }
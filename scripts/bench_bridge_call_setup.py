@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark the call setup latency seen by the caller through the Exotel bridge.
+
+Places calls one after the other on a running bridge, like Exotel does: the
+connection, a start event, then 20ms media frames in real time. The latency is
+measured from the connection to the first media frame sent back by the bridge, so
+it includes the engine connection and handshake (system prompts prefill) unless the
+bridge attaches a pooled session (BRIDGE_ENGINE_POOL_SIZE). Run it against the
+bridge with and without the pool to compare.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import statistics
+import sys
+import time
+
+try:
+    import numpy as np
+    import websockets
+except ImportError:
+    print("ERROR: Missing dependencies. Install: pip install -r requirements.txt")
+    sys.exit(1)
+
+FRAME_SAMPLES = 160  # 20ms @ 8kHz
+
+
+async def place_call(url: str, timeout: float) -> float:
+    """Return the seconds between the connection and the first audio frame received."""
+    t = np.arange(FRAME_SAMPLES) / 8000
+    frame = base64.b64encode((8000 * np.sin(2 * np.pi * 440 * t)).astype(np.int16).tobytes()).decode("ascii")
+    media = json.dumps({"event": "media", "media": {"payload": frame}})
+    start = time.perf_counter()
+    async with websockets.connect(url, open_timeout=10) as ws:
+        await ws.send(json.dumps({"event": "start"}))
+
+        async def send_audio():
+            next_ts = time.perf_counter()
+            while True:
+                await ws.send(media)
+                next_ts += 0.02
+                await asyncio.sleep(max(0.0, next_ts - time.perf_counter()))
+
+        sender = asyncio.create_task(send_audio())
+        try:
+            while True:
+                remaining = timeout - (time.perf_counter() - start)
+                msg = await asyncio.wait_for(ws.recv(), timeout=max(0.0, remaining))
+                if isinstance(msg, str) and json.loads(msg).get("event") == "media":
+                    return time.perf_counter() - start
+        finally:
+            sender.cancel()
+
+
+async def run(args) -> int:
+    print("=" * 60)
+    print("Bridge Call Setup Benchmark")
+    print("=" * 60)
+    print(f"Bridge: {args.url}, {args.calls} calls, {args.pause}s apart")
+    latencies = []
+    for index in range(args.calls):
+        try:
+            latency = await place_call(args.url, args.timeout)
+        except Exception as e:
+            print(f"✗ Call {index} failed: {e!r}")
+            return 1
+        latencies.append(latency)
+        print(f"  call {index}: first audio after {latency * 1000:.1f} ms")
+        await asyncio.sleep(args.pause)
+
+    print("\n" + "=" * 60)
+    print("RESULTS")
+    print("=" * 60)
+    print(f"first audio: median {statistics.median(latencies) * 1000:.1f} ms, "
+          f"min {min(latencies) * 1000:.1f} ms, max {max(latencies) * 1000:.1f} ms")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="ws://localhost:5050")
+    parser.add_argument("--calls", type=int, default=5)
+    parser.add_argument("--pause", type=float, default=5.0,
+                        help="Seconds between calls, leaving time for the bridge to refill its pool.")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    return asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
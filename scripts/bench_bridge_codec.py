@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark the Opus codec paths of the Exotel bridge, in calls per CPU core.
+
+Runs the audio of a call through the encoder (PCM24k sent to the engine) and the
+decoder (Ogg Opus received from the engine) of the bridge, with the in-process
+sphn codec and with the FFmpeg subprocesses (BRIDGE_FFMPEG_CODEC=1), fed the way
+the bridge feeds them. The CPU time of the bridge process and of the FFmpeg
+children is measured, and since a call runs in real time, the number of calls a
+core can sustain is the audio duration divided by the CPU time.
+"""
+import argparse
+import asyncio
+import os
+import resource
+import shutil
+import sys
+import time
+from pathlib import Path
+
+try:
+    import numpy as np
+    import sphn
+    os.environ.setdefault("BRIDGE_LOG_LEVEL", "WARNING")
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from exotel_bridge import (FfmpegOggDecoder, FfmpegOpusEncoder, SphnOpusDecoder,
+                               SphnOpusEncoder, float32_to_int16_bytes)
+except ImportError:
+    print("ERROR: Missing dependencies. Install: pip install -r requirements.txt")
+    sys.exit(1)
+
+SAMPLE_RATE = 24000
+FRAME_SAMPLES = 480  # 20ms, sent by the bridge
+ENGINE_FRAME_SAMPLES = 1920  # 80ms, one engine step
+
+
+def make_audio(seconds: float) -> np.ndarray:
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    rng = np.random.default_rng(0)
+    return (0.3 * np.sin(2 * np.pi * 220 * t) + 0.05 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+def make_engine_packets(pcm: np.ndarray) -> list[bytes]:
+    """Ogg Opus packets as sent by the engine, one per 80ms step."""
+    writer = sphn.OpusStreamWriter(SAMPLE_RATE)
+    packets = []
+    for start in range(0, len(pcm) - ENGINE_FRAME_SAMPLES + 1, ENGINE_FRAME_SAMPLES):
+        writer.append_pcm(pcm[start: start + ENGINE_FRAME_SAMPLES])
+        packets.append(writer.read_bytes())
+    return packets
+
+
+async def run_call(use_ffmpeg: bool, pcm_frames: list[bytes], packets: list[bytes]) -> tuple[int, int]:
+    """Encodes and decodes the audio of one call, returns the encoded and decoded byte counts."""
+    if use_ffmpeg:
+        encoder, decoder = FfmpegOpusEncoder(SAMPLE_RATE), FfmpegOggDecoder()
+        batch_frames = 10  # The bridge batches 200ms before writing to FFmpeg
+    else:
+        encoder, decoder = SphnOpusEncoder(SAMPLE_RATE), SphnOpusDecoder(SAMPLE_RATE)
+        batch_frames = 1
+    encoder.start()
+    decoder.start()
+    encoded = decoded = 0
+    try:
+        for start in range(0, len(pcm_frames), batch_frames):
+            encoder.write(b"".join(pcm_frames[start: start + batch_frames]))
+            encoded += len(await encoder.read(4096, timeout=0.01) or b"")
+        for packet in packets:
+            decoder.write(packet)
+            decoded += len(await decoder.read(8192, timeout=0.01) or b"")
+        if use_ffmpeg:
+            encoder.proc.stdin.close()
+            decoder.proc.stdin.close()
+        # Drain what is left
+        while data := await encoder.read(4096, timeout=0.5):
+            encoded += len(data)
+        while data := await decoder.read(8192, timeout=0.5):
+            decoded += len(data)
+    finally:
+        encoder.stop()
+        decoder.stop()
+    return encoded, decoded
+
+
+def cpu_seconds() -> float:
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=20.0, help="Audio duration of the call.")
+    parser.add_argument("--rounds", type=int, default=3, help="Calls per codec, the best one is kept.")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Bridge Opus Codec Benchmark")
+    print("=" * 60)
+    pcm = make_audio(args.seconds)
+    pcm_bytes = float32_to_int16_bytes(pcm)
+    pcm_frames = [pcm_bytes[i: i + 2 * FRAME_SAMPLES] for i in range(0, len(pcm_bytes), 2 * FRAME_SAMPLES)]
+    packets = make_engine_packets(pcm)
+    codecs = {"in-process (sphn)": False}
+    if shutil.which("ffmpeg"):
+        codecs["ffmpeg subprocesses"] = True
+    else:
+        print("ffmpeg not found, only the in-process codec is measured")
+
+    results = {}
+    for name, use_ffmpeg in codecs.items():
+        best = float("inf")
+        for _ in range(args.rounds):
+            start = cpu_seconds()
+            encoded, decoded = asyncio.run(run_call(use_ffmpeg, pcm_frames, packets))
+            best = min(best, cpu_seconds() - start)
+        if encoded == 0 or decoded == 0:
+            print(f"✗ {name}: no output (encoded={encoded}b, decoded={decoded}b)")
+            return 1
+        results[name] = best
+        print(f"✓ {name}: encoded {encoded}b, decoded {decoded}b")
+
+    print("\n" + "=" * 60)
+    print("RESULTS")
+    print("=" * 60)
+    for name, cpu in results.items():
+        print(f"  {name:>20}: {1000 * cpu / args.seconds:7.2f} ms CPU per call second, "
+              f"{args.seconds / cpu:7.1f} calls per core")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark the cost of the per-frame [LIVE] tracing of the Exotel bridge.
+
+Times the trace points of one audio frame going through the bridge in both
+directions (11 events), as they used to be (an unconditional print per event),
+with BRIDGE_TRACE on (FrameTracer ring buffer, flushed once per second of frames),
+and with tracing off, writing to a line buffered /dev/null. Also checks the ring
+buffer sampling and overflow handling.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+try:
+    os.environ.setdefault("BRIDGE_LOG_LEVEL", "WARNING")
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    import exotel_bridge
+    from exotel_bridge import TRACE_EVENTS, FrameTracer
+except ImportError:
+    print("ERROR: Missing dependencies. Install: pip install -r requirements.txt")
+    sys.exit(1)
+
+FRAMES_PER_FLUSH = 50  # The heartbeat flushes every second, 50 frames of 20ms
+
+
+def frame_print(nbytes: int, qsize: int):
+    # Former behaviour: one formatted print per trace point.
+    for _, tag, q1_name, q2_name in TRACE_EVENTS:
+        line = f"[LIVE][{tag}] bytes={nbytes}"
+        if q1_name:
+            line += f" {q1_name}={qsize}"
+        if q2_name:
+            line += f" {q2_name}={qsize}"
+        print(f"{line} t={time.time()}")
+
+
+def frame_traced(tracer: FrameTracer, nbytes: int, qsize: int):
+    for event in range(len(TRACE_EVENTS)):
+        if exotel_bridge.BRIDGE_TRACE:
+            tracer.record(event, nbytes, qsize, qsize)
+
+
+def run(frame, frames: int, flush=None) -> float:
+    # Line buffered like the bridge stdout used to be, written to /dev/null
+    with open(os.devnull, "w", buffering=1) as sink, redirect_stdout(sink):
+        start = time.perf_counter()
+        for i in range(frames):
+            frame(320, 3)
+            if flush and i % FRAMES_PER_FLUSH == FRAMES_PER_FLUSH - 1:
+                flush(sink)
+        return (time.perf_counter() - start) / frames
+
+
+def check_tracer() -> bool:
+    tracer = FrameTracer("test", capacity=8, sample="ENGINE_RECV=4")
+    for _ in range(8):
+        tracer.record(exotel_bridge.TRACE_ENGINE_RECV, 100)
+    sink = io.StringIO()
+    tracer.flush(sink)
+    lines = sink.getvalue().splitlines()
+    if len(lines) != 2 or not lines[0].startswith("[LIVE][ENGINE_RECV] bytes=100 t="):
+        print(f"✗ Sampling: expected 2 ENGINE_RECV lines, got {lines}")
+        return False
+    for i in range(12):
+        tracer.record(exotel_bridge.TRACE_EXOTEL_OUT, i, 5)
+    sink = io.StringIO()
+    tracer.flush(sink)
+    lines = sink.getvalue().splitlines()
+    if len(lines) != 9 or "q_pcm_out=5" not in lines[0] or "dropped=4" not in lines[-1]:
+        print(f"✗ Ring overflow: expected the last 8 events and 4 dropped, got {lines}")
+        return False
+    print("✓ Sampling and ring overflow")
+    return True
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--frames", type=int, default=5000, help="Frames per timing round.")
+    parser.add_argument("--rounds", type=int, default=5, help="Timing rounds, the best one is kept.")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Bridge Tracing Benchmark")
+    print("=" * 60)
+    if not check_tracer():
+        return 1
+
+    tracer = FrameTracer("bench", capacity=FRAMES_PER_FLUSH * len(TRACE_EVENTS))
+
+    def traced_on(nbytes, qsize):
+        exotel_bridge.BRIDGE_TRACE = True
+        frame_traced(tracer, nbytes, qsize)
+
+    def traced_off(nbytes, qsize):
+        exotel_bridge.BRIDGE_TRACE = False
+        frame_traced(tracer, nbytes, qsize)
+
+    modes = {
+        "print per event": (frame_print, None),
+        "BRIDGE_TRACE=1": (traced_on, tracer.flush),
+        "BRIDGE_TRACE=0": (traced_off, None),
+    }
+    results = {name: float("inf") for name in modes}
+    for _ in range(args.rounds):
+        for name, (frame, flush) in modes.items():
+            results[name] = min(results[name], run(frame, args.frames, flush))
+
+    print("\n" + "=" * 60)
+    print("RESULTS")
+    print("=" * 60)
+    base = results["print per event"]
+    for name, frame_time in results.items():
+        print(f"  {name:>16}: {1e6 * frame_time:7.2f} us per frame ({100 * (base - frame_time) / base:+.1f}% saved)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
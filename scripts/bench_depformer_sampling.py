@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark the depformer step of LMGen on CPU when the user stream is given.
+
+Runs `LMGen.depformer_step` on random inputs in three modes, and reports the step
+time per frame:
+- all codebooks: the depformer samples every codebook, as it used to,
+- user given: the codebooks of the user stream are provided, so they are neither
+  run nor sampled, which is what happens when serving,
+- agent only: `predict_user_stream=False`, stopping after the agent codebooks
+  even though the user stream is not provided.
+"""
+import argparse
+import sys
+import time
+
+try:
+    import torch
+    from moshi.models import loaders, LMModel, LMGen
+except ImportError:
+    print("ERROR: Missing dependencies. Install: pip install moshi/.")
+    sys.exit(1)
+
+
+def build_lm(args) -> LMModel:
+    lm_kwargs = dict(loaders._lm_kwargs, dim=64, text_card=100, num_heads=4, num_layers=1,
+                     dep_q=16, depformer_dim=args.depformer_dim,
+                     depformer_dim_feedforward=int(4.125 * args.depformer_dim),
+                     depformer_num_heads=args.depformer_heads)
+    lm = LMModel(device="cpu", dtype=torch.float32, **lm_kwargs)
+    lm.eval()
+    return lm
+
+
+def run(step, frames: int) -> float:
+    start = time.perf_counter()
+    for _ in range(frames):
+        step()
+    return (time.perf_counter() - start) / frames
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--depformer-dim", type=int, default=128)
+    parser.add_argument("--depformer-heads", type=int, default=4)
+    parser.add_argument("--greedy", action="store_true", help="Use greedy decoding rather than sampling.")
+    parser.add_argument("--frames", type=int, default=20, help="Frames per timing round.")
+    parser.add_argument("--rounds", type=int, default=5,
+                        help="Timing rounds, alternating between the modes, the best one is kept.")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Depformer Sampling Benchmark")
+    print("=" * 60)
+    torch.manual_seed(0)
+    lm = build_lm(args)
+    lm_gen = LMGen(lm, device="cpu", use_sampling=not args.greedy)
+    agent_only = LMGen(lm, device="cpu", use_sampling=not args.greedy, predict_user_stream=False)
+    lm_gen.streaming_forever(args.batch_size)
+    agent_only.streaming_forever(args.batch_size)
+    B = args.batch_size
+    text_token = torch.randint(lm.text_card, (B,))
+    transformer_out = torch.randn(B, 1, lm.dim)
+    audio_tokens = torch.randint(lm.card, (B, lm.dep_q))
+    # The user stream codebooks, after the agent ones, are provided.
+    user_provided = torch.zeros(B, lm.dep_q, dtype=torch.bool)
+    user_provided[:, lm.dep_q // 2:] = True
+    not_provided = torch.zeros_like(user_provided)
+    print(f"depformer: {lm.dep_q} steps, {len(lm.depformer.layers)} layers, dim {args.depformer_dim}, "
+          f"batch size {B}, {'greedy' if args.greedy else 'sampling'}")
+
+    modes = {
+        "all codebooks": lambda: lm_gen.depformer_step(
+            text_token, transformer_out, audio_tokens, user_provided),
+        "user given": lambda: lm_gen.depformer_step(
+            text_token, transformer_out, audio_tokens, user_provided, True),
+        "agent only": lambda: agent_only.depformer_step(
+            text_token, transformer_out, audio_tokens, not_provided),
+    }
+    results = {}
+    with torch.no_grad():
+        # The agent tokens must not depend on the user stream being run or not.
+        torch.manual_seed(1)
+        ref = modes["all codebooks"]()
+        torch.manual_seed(1)
+        fast = modes["user given"]()
+        if not torch.equal(ref[:, :lm.dep_q // 2], fast[:, :lm.dep_q // 2]):
+            print("✗ Agent tokens differ when skipping the user stream")
+            return 1
+        print("✓ Agent tokens identical when skipping the user stream")
+
+        for name, step in modes.items():
+            run(step, 5)  # warmup
+            results[name] = float("inf")
+        for _ in range(args.rounds):
+            for name, step in modes.items():
+                results[name] = min(results[name], run(step, args.frames))
+
+    print("\n" + "=" * 60)
+    print("RESULTS")
+    print("=" * 60)
+    base = results["all codebooks"]
+    for name, step_time in results.items():
+        print(f"  {name:>14}: {1000 * step_time:.3f} ms per frame ({100 * (base - step_time) / base:+.1f}% saved)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
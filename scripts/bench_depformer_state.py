@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark the depformer streaming state handling of LMGen on CPU.
+
+Runs `LMGen.depformer_step` on random inputs, once with the persistent depformer
+state (reset in place at each frame), and once allocating a new state for each
+frame as it used to be done, and reports the tensor allocations and the step time
+per frame. The depformer follows the shape of the released model, with a smaller
+width by default so that it runs anywhere.
+"""
+import argparse
+import sys
+import time
+
+try:
+    import torch
+    from torch.profiler import profile, ProfilerActivity
+    from moshi.models import loaders, LMModel, LMGen
+except ImportError:
+    print("ERROR: Missing dependencies. Install: pip install moshi/.")
+    sys.exit(1)
+
+ALLOC_OPS = ("aten::empty", "aten::empty_strided", "aten::zeros", "aten::ones", "aten::full")
+
+
+def build_lm_gen(args) -> LMGen:
+    lm_kwargs = dict(loaders._lm_kwargs, dim=64, text_card=100, num_heads=4, num_layers=1,
+                     dep_q=16, depformer_dim=args.depformer_dim,
+                     depformer_dim_feedforward=int(4.125 * args.depformer_dim),
+                     depformer_num_heads=args.depformer_heads)
+    lm = LMModel(device="cpu", dtype=torch.float32, **lm_kwargs)
+    lm.eval()
+    lm_gen = LMGen(lm, device="cpu", use_sampling=True)
+    lm_gen.streaming_forever(args.batch_size)
+    return lm_gen
+
+
+def per_frame_state(lm_gen: LMGen, *inputs):
+    # Former behaviour: a new depformer streaming state for each frame.
+    depformer = lm_gen.lm_model.depformer
+    saved = depformer.get_streaming_state()
+    depformer._stop_streaming()
+    try:
+        with depformer.streaming(inputs[0].shape[0]):
+            return lm_gen.depformer_step(*inputs)
+    finally:
+        depformer.set_streaming_state(saved)
+
+
+def run(lm_gen: LMGen, step, inputs, frames: int) -> float:
+    start = time.perf_counter()
+    for _ in range(frames):
+        step(*inputs)
+    return (time.perf_counter() - start) / frames
+
+
+def count_allocations(lm_gen: LMGen, step, inputs, frames: int) -> float:
+    with profile(activities=[ProfilerActivity.CPU]) as prof:
+        for _ in range(frames):
+            step(*inputs)
+    count = sum(event.count for event in prof.key_averages() if event.key in ALLOC_OPS)
+    return count / frames
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--depformer-dim", type=int, default=128)
+    parser.add_argument("--depformer-heads", type=int, default=4)
+    parser.add_argument("--frames", type=int, default=20, help="Frames per timing round.")
+    parser.add_argument("--rounds", type=int, default=5,
+                        help="Timing rounds, alternating between the two modes, the best one is kept.")
+    parser.add_argument("--profile-frames", type=int, default=20,
+                        help="Frames run under the profiler to count the allocations.")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Depformer State Benchmark")
+    print("=" * 60)
+    torch.manual_seed(0)
+    lm_gen = build_lm_gen(args)
+    lm = lm_gen.lm_model
+    B = args.batch_size
+    inputs = (
+        torch.randint(lm.text_card, (B,)),
+        torch.randn(B, 1, lm.dim),
+        torch.randint(lm.card, (B, lm.dep_q)),
+        torch.zeros(B, lm.dep_q, dtype=torch.bool),
+    )
+    print(f"depformer: {lm.dep_q} steps, {len(lm.depformer.layers)} layers, dim {args.depformer_dim}, "
+          f"batch size {B}")
+
+    modes = {
+        "per-frame state": lambda *x: per_frame_state(lm_gen, *x),
+        "persistent state": lm_gen.depformer_step,
+    }
+    results = {}
+    with torch.no_grad():
+        for name, step in modes.items():
+            run(lm_gen, step, inputs, 5)  # warmup
+            results[name] = [count_allocations(lm_gen, step, inputs, args.profile_frames), float("inf")]
+        for _ in range(args.rounds):
+            for name, step in modes.items():
+                results[name][1] = min(results[name][1], run(lm_gen, step, inputs, args.frames))
+    for name, (allocations, step_time) in results.items():
+        print(f"  {name:>16}: {allocations:6.1f} allocations, {1000 * step_time:.3f} ms per frame")
+
+    before, after = results["per-frame state"], results["persistent state"]
+    print("\n" + "=" * 60)
+    print("RESULTS")
+    print("=" * 60)
+    print(f"allocations per frame: {before[0]:.1f} -> {after[0]:.1f}")
+    print(f"step time per frame:   {1000 * before[1]:.3f} ms -> {1000 * after[1]:.3f} ms "
+          f"({100 * (before[1] - after[1]) / before[1]:+.1f}% saved)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
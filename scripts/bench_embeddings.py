@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Benchmark the codebook embeddings of the LM on CPU.
+
+Runs `LMModel.embed_codes` and the depformer token embedding as they used to be (one
+`ScaledEmbedding` per codebook, each masking its zero_idx tokens, summed with Python
+`+`) and with `MultiEmbedding` (one table for all the codebooks, looked up and summed
+with `embedding_bag`, the zero_idx tokens weighted by 0, and a single codebook masked
+in place). The embeddings must match for random codes with zero_idx and ungenerated
+tokens, and the model must save and load the keys of the former per-codebook
+embeddings, as checkpoints have them. Reports the torch dispatches and the CPU time
+per frame, at the sizes of the main model and depformer.
+"""
+import argparse
+import sys
+import time
+
+try:
+    import torch
+    from torch import nn
+    from torch.utils._python_dispatch import TorchDispatchMode
+    from moshi.models import loaders, LMModel
+    from moshi.models.lm import MultiEmbedding, ScaledEmbedding
+except ImportError:
+    print("ERROR: Missing dependencies. Install: pip install moshi/.")
+    sys.exit(1)
+
+ZERO_IDX = -1
+
+
+class CountDispatches(TorchDispatchMode):
+    """Counts the aten operators dispatched."""
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def __torch_dispatch__(self, func, types, args=(), kwargs=None):
+        self.count += 1
+        return func(*args, **(kwargs or {}))
+
+
+def former_embeddings(table: MultiEmbedding) -> nn.ModuleList:
+    """One ScaledEmbedding per codebook, with the weights of the table."""
+    embeddings = nn.ModuleList([
+        ScaledEmbedding(n, table.embedding_dim, zero_idx=ZERO_IDX, dtype=table.weight.dtype)
+        for n in table.num_embeddings
+    ])
+    for embedding, weight in zip(embeddings, table.split(table.weight.detach())):
+        embedding.weight.data.copy_(weight)
+    return embeddings
+
+
+def former_embed_codes(embeddings: nn.ModuleList, sequence: torch.Tensor) -> torch.Tensor:
+    # LMModel.embed_codes before MultiEmbedding, embeddings[0] being the text one.
+    input_ = None
+    for cb_index in range(1, len(embeddings)):
+        audio_emb = embeddings[cb_index](sequence[:, cb_index])
+        input_ = audio_emb if input_ is None else input_ + audio_emb
+    text_emb = embeddings[0](sequence[:, 0])
+    return text_emb if input_ is None else input_ + text_emb
+
+
+def random_codes(table: MultiEmbedding, B: int, S: int, gen: torch.Generator) -> torch.Tensor:
+    codes = torch.stack([torch.randint(n, (B, S), generator=gen) for n in table.num_embeddings], 1)
+    # Some zero_idx tokens (no input), and ungenerated ones (-2, looked up as token 0)
+    special = torch.rand(codes.shape, generator=gen)
+    codes[special < 0.2] = ZERO_IDX
+    codes[special > 0.9] = -2
+    return codes
+
+
+def check_outputs(B: int) -> bool:
+    gen = torch.Generator().manual_seed(0)
+    table = MultiEmbedding([101] + [33] * 16, 64, zero_idx=ZERO_IDX)
+    embeddings = former_embeddings(table)
+    for S in (1, 7):
+        codes = random_codes(table, B, S, gen)
+        error = (table(codes) - former_embed_codes(embeddings, codes)).abs().max().item()
+        if error > 1e-5:
+            print(f"✗ Sum over the codebooks (S={S}): max error {error:.1e}")
+            return False
+        for k in range(len(embeddings)):
+            if not torch.equal(table.lookup(k, codes[:, k]), embeddings[k](codes[:, k])):
+                print(f"✗ Lookup of codebook {k} (S={S}) differs from its ScaledEmbedding")
+                return False
+    all_zero = torch.full((B, 17, 1), ZERO_IDX)
+    if table(all_zero).abs().max() != 0:
+        print("✗ Codes all zero_idx: embedding not exactly 0")
+        return False
+    print(f"✓ Sum over the codebooks same as the former one to {error:.1e}, single codebooks identical")
+    return True
+
+
+def check_checkpoint_keys() -> bool:
+    lm_kwargs = dict(loaders._lm_kwargs, dim=64, text_card=100, num_heads=4, num_layers=1,
+                     dep_q=16, depformer_dim=64, depformer_dim_feedforward=256, depformer_num_heads=4)
+    lm = LMModel(device="cpu", dtype=torch.float32, **lm_kwargs)
+    state_dict = lm.state_dict()
+    expected = {"text_emb.weight", "emb.15.weight", "depformer_text_emb.weight", "depformer_emb.14.weight"}
+    if not expected <= set(state_dict) or any("codes_emb" in key for key in state_dict) \
+            or state_dict["emb.3.weight"].shape != (lm.card + 1, 64):
+        print("✗ Checkpoint keys: the tables are not saved as one embedding per codebook")
+        return False
+    # As the loaders do: on the meta device, then the weights assigned.
+    loaded = LMModel(device="meta", dtype=torch.float32, **lm_kwargs)
+    result = loaded.load_state_dict(dict(state_dict), strict=False, assign=True)
+    if result.missing_keys or result.unexpected_keys \
+            or not all(torch.equal(a, b) for a, b in zip(loaded.parameters(), lm.parameters())):
+        print(f"✗ Checkpoint keys: missing {result.missing_keys}, unexpected {result.unexpected_keys}")
+        return False
+    normed = LMModel(device="cpu", dtype=torch.float32, norm_emb=True, **lm_kwargs)
+    if normed.codes_emb is not None or "emb.0.norm.weight" not in normed.state_dict():
+        print("✗ Normalized embeddings: not kept per codebook")
+        return False
+    print("✓ Checkpoint keys: saved and loaded as one embedding per codebook, on the meta device too")
+    return True
+
+
+def timed(fn, steps: int, rounds: int) -> float:
+    """Best CPU seconds per call over rounds."""
+    fn()
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.process_time()
+        for _ in range(steps):
+            fn()
+        best = min(best, (time.process_time() - start) / steps)
+    return best
+
+
+def dispatches(fn) -> int:
+    counter = CountDispatches()
+    with counter:
+        fn()
+    return counter.count
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--steps", type=int, default=500, help="Calls per timing round.")
+    parser.add_argument("--rounds", type=int, default=5, help="Timing rounds, the best one is kept.")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Codebook Embeddings Benchmark")
+    print("=" * 60)
+    with torch.no_grad():
+        if not (check_outputs(args.batch_size) & check_checkpoint_keys()):
+            return 1
+        B = args.batch_size
+        gen = torch.Generator().manual_seed(1)
+        # The size of the text vocabulary does not change the lookups, a smaller one keeps the tables small.
+        main_table = MultiEmbedding([4001] + [2049] * 16, 4096, zero_idx=ZERO_IDX)
+        dep_table = MultiEmbedding([4001] + [2049] * 15, 1024, zero_idx=ZERO_IDX)
+        main_former, dep_former = former_embeddings(main_table), former_embeddings(dep_table)
+        codes = random_codes(main_table, B, 1, gen)
+        cases = {
+            "embed_codes, 17 codebooks": (lambda: former_embed_codes(main_former, codes), lambda: main_table(codes)),
+            "depformer step": (lambda: dep_former[5](codes[:, 5]), lambda: dep_table.lookup(5, codes[:, 5])),
+        }
+        print("\n" + "=" * 60)
+        print(f"RESULTS (batch size {B}, per frame or depformer step)")
+        print("=" * 60)
+        for name, (before_fn, after_fn) in cases.items():
+            before, after = timed(before_fn, args.steps, args.rounds), timed(after_fn, args.steps, args.rounds)
+            print(f"  {name:>25}: dispatches {dispatches(before_fn):3d} -> {dispatches(after_fn):3d}, "
+                  f"CPU time {1e6 * before:6.1f} us -> {1e6 * after:6.1f} us ({before / after:.2f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
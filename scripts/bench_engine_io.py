@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Benchmark PersonaPlex engine session I/O overhead.
+
+Phase 1 keeps idle sessions open after their handshake and reports the CPU
+used by the engine process per idle session (needs --server-pid, Linux only).
+Phase 2 streams audio in real time on one session and reports the frame latency,
+i.e. the time from sending an 80 ms frame to receiving the next audio message.
+"""
+import argparse
+import asyncio
+import os
+import ssl
+import sys
+import time
+from urllib.parse import quote
+
+try:
+    import numpy as np
+    import sphn
+    import websockets
+except ImportError:
+    print("ERROR: Missing dependencies. Install: pip install websockets numpy sphn")
+    sys.exit(1)
+
+SAMPLE_RATE = 24000
+FRAME_SIZE = 1920  # 80 ms @ 24kHz
+
+
+def process_cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat", "rt") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    # utime and stime, fields 14 and 15 of /proc/<pid>/stat.
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def open_session(url: str, ssl_ctx, timeout: float):
+    ws = await websockets.connect(url, ssl=ssl_ctx, open_timeout=10)
+    while True:
+        msg = await asyncio.wait_for(ws.recv(), timeout=timeout)
+        if isinstance(msg, bytes) and len(msg) > 0 and msg[0] == 0x00:
+            return ws
+
+
+async def idle_phase(args, url: str, ssl_ctx) -> int:
+    print("\n" + "=" * 60)
+    print(f"PHASE 1: {args.sessions} idle sessions for {args.idle_seconds:.0f}s")
+    print("=" * 60)
+    sessions = []
+    try:
+        for _ in range(args.sessions):
+            sessions.append(await open_session(url, ssl_ctx, args.timeout))
+        print(f"✓ {len(sessions)} sessions open")
+        # Let the sessions settle after their handshake.
+        await asyncio.sleep(1.0)
+        start_cpu = process_cpu_seconds(args.server_pid)
+        start = time.perf_counter()
+        await asyncio.sleep(args.idle_seconds)
+        cpu = process_cpu_seconds(args.server_pid) - start_cpu
+        elapsed = time.perf_counter() - start
+    finally:
+        for ws in sessions:
+            await ws.close()
+    print(f"engine CPU: {100 * cpu / elapsed:.1f}% of a core "
+          f"({100 * cpu / elapsed / max(1, len(sessions)):.2f}% per idle session)")
+    return 0
+
+
+async def stream_phase(args, url: str, ssl_ctx) -> int:
+    print("\n" + "=" * 60)
+    print(f"PHASE 2: streaming {args.frames} frames in real time")
+    print("=" * 60)
+    ws = await open_session(url, ssl_ctx, args.timeout)
+    send_times: list[float] = []
+    latencies: list[float] = []
+    done = asyncio.Event()
+
+    async def sender():
+        opus_writer = sphn.OpusStreamWriter(SAMPLE_RATE)
+        rng = np.random.default_rng(0)
+        next_time = time.perf_counter()
+        for _ in range(args.frames):
+            pcm = (0.05 * rng.standard_normal(FRAME_SIZE)).astype(np.float32)
+            opus_writer.append_pcm(pcm)
+            opus_bytes = opus_writer.read_bytes()
+            if opus_bytes:
+                await ws.send(b"\x01" + opus_bytes)
+            send_times.append(time.perf_counter())
+            next_time += FRAME_SIZE / SAMPLE_RATE
+            await asyncio.sleep(max(0.0, next_time - time.perf_counter()))
+        # Leave time for the last frames to come back.
+        await asyncio.sleep(1.0)
+        done.set()
+
+    async def receiver():
+        answered = 0
+        while not done.is_set():
+            try:
+                msg = await asyncio.wait_for(ws.recv(), timeout=0.1)
+            except asyncio.TimeoutError:
+                continue
+            if not isinstance(msg, bytes) or len(msg) == 0 or msg[0] != 0x01:
+                continue
+            now = time.perf_counter()
+            # Each sent frame is answered by the first audio message received after it.
+            if answered < len(send_times):
+                answered = len(send_times)
+                if answered > args.skip_frames:
+                    latencies.append(now - send_times[-1])
+
+    try:
+        await asyncio.gather(sender(), receiver())
+    finally:
+        await ws.close()
+    if not latencies:
+        print("✗ No audio received from the engine")
+        return 1
+    latencies_ms = np.array(latencies) * 1000
+    print(f"frames answered: {len(latencies)}")
+    print(f"p50: {np.percentile(latencies_ms, 50):.1f} ms")
+    print(f"p90: {np.percentile(latencies_ms, 90):.1f} ms")
+    print(f"p99: {np.percentile(latencies_ms, 99):.1f} ms")
+    print(f"max: {latencies_ms.max():.1f} ms")
+    return 0
+
+
+async def run(args) -> int:
+    url = (f"{args.url}?voice_prompt={quote(args.voice_prompt)}"
+           f"&text_prompt={quote(args.text_prompt)}")
+    ssl_ctx = None
+    if url.startswith("wss://"):
+        ssl_ctx = ssl.create_default_context()
+        ssl_ctx.check_hostname = False
+        ssl_ctx.verify_mode = ssl.CERT_NONE
+
+    print("=" * 60)
+    print("Engine I/O Benchmark")
+    print("=" * 60)
+    print(f"Connecting to: {url}")
+    if args.server_pid is not None:
+        exit_code = await idle_phase(args, url, ssl_ctx)
+        if exit_code != 0:
+            return exit_code
+    else:
+        print("Skipping the idle CPU phase, pass --server-pid to run it.")
+    return await stream_phase(args, url, ssl_ctx)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="wss://localhost:8998/api/chat")
+    parser.add_argument("--voice-prompt", default="NATF0.pt")
+    parser.add_argument("--text-prompt", default="You enjoy having a good conversation.")
+    parser.add_argument("--server-pid", type=int, help="PID of the engine process, for the idle CPU phase.")
+    parser.add_argument("--sessions", type=int, default=1, help="Idle sessions to open.")
+    parser.add_argument("--idle-seconds", type=float, default=10.0)
+    parser.add_argument("--frames", type=int, default=250, help="Frames to stream (80 ms each).")
+    parser.add_argument("--skip-frames", type=int, default=10,
+                        help="First frames left out of the latency results.")
+    parser.add_argument("--timeout", type=float, default=60.0,
+                        help="Seconds to wait for the handshake.")
+    args = parser.parse_args()
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
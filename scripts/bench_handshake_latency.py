@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark PersonaPlex engine handshake latency.
+
+Opens sessions one after the other, and measures the time from the WebSocket
+connection to the handshake byte (0x00), i.e. the system prompts prefill.
+Run it against two engine builds to compare them.
+"""
+import argparse
+import asyncio
+import ssl
+import statistics
+import sys
+import time
+from urllib.parse import quote
+
+try:
+    import websockets
+except ImportError:
+    print("ERROR: websockets not installed. Run: pip install websockets")
+    sys.exit(1)
+
+
+async def measure_handshake(url: str, ssl_ctx, timeout: float) -> float:
+    """Return the seconds between opening the connection and receiving the handshake."""
+    start = time.perf_counter()
+    async with websockets.connect(url, ssl=ssl_ctx, open_timeout=10) as ws:
+        while True:
+            msg = await asyncio.wait_for(ws.recv(), timeout=timeout)
+            if isinstance(msg, bytes) and len(msg) > 0 and msg[0] == 0x00:
+                return time.perf_counter() - start
+
+
+async def run(args) -> int:
+    url = (f"{args.url}?voice_prompt={quote(args.voice_prompt)}"
+           f"&text_prompt={quote(args.text_prompt)}")
+    ssl_ctx = None
+    if url.startswith("wss://"):
+        ssl_ctx = ssl.create_default_context()
+        ssl_ctx.check_hostname = False
+        ssl_ctx.verify_mode = ssl.CERT_NONE
+
+    print("=" * 60)
+    print("Handshake Latency Benchmark")
+    print("=" * 60)
+    print(f"Connecting to: {url}")
+    print(f"Sessions: {args.sessions} (+{args.warmup} warmup)")
+
+    latencies = []
+    for index in range(args.warmup + args.sessions):
+        try:
+            latency = await measure_handshake(url, ssl_ctx, args.timeout)
+        except Exception as e:
+            print(f"✗ Session {index} failed: {e}")
+            return 1
+        if index >= args.warmup:
+            latencies.append(latency)
+            print(f"  session {index - args.warmup}: {latency * 1000:.1f} ms")
+
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+    print("\n" + "=" * 60)
+    print("RESULTS")
+    print("=" * 60)
+    print(f"mean: {statistics.mean(latencies) * 1000:.1f} ms")
+    print(f"p50:  {statistics.median(latencies) * 1000:.1f} ms")
+    print(f"p95:  {p95 * 1000:.1f} ms")
+    print(f"min:  {latencies[0] * 1000:.1f} ms")
+    print(f"max:  {latencies[-1] * 1000:.1f} ms")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="wss://localhost:8998/api/chat")
+    parser.add_argument("--voice-prompt", default="NATF0.pt")
+    parser.add_argument("--text-prompt", default="You enjoy having a good conversation.")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=1,
+                        help="Sessions run first and left out of the results.")
+    parser.add_argument("--timeout", type=float, default=60.0,
+                        help="Seconds to wait for the handshake.")
+    args = parser.parse_args()
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Benchmark the position and mask bookkeeping of the streaming KV cache on CPU.
+
+Runs `RingKVCache.complete` and the causal attention mask of
+`StreamingMultiheadAttention` as they used to be (the positions of the whole ring
+recomputed from the end offsets, then a `[T, capacity]` mask built from them at each
+call) and with the positions and single step mask kept up to date by the cache. The
+positions and masks must be identical for every batch entry over random steps, with
+entries skipped by the exec mask, reset, or restored from a copy, and prefill chunks.
+Reports the torch dispatches and the CPU time per attention call, for the ring of the
+main transformer (capacity 3000) and of the depformer.
+"""
+import argparse
+import sys
+import time
+
+try:
+    import torch
+    from torch.utils._python_dispatch import TorchDispatchMode
+    from moshi.modules.transformer import RingKVCache
+except ImportError:
+    print("ERROR: Missing dependencies. Install: pip install moshi/.")
+    sys.exit(1)
+
+
+class CountDispatches(TorchDispatchMode):
+    """Counts the aten operators dispatched."""
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def __torch_dispatch__(self, func, types, args=(), kwargs=None):
+        self.count += 1
+        return func(*args, **(kwargs or {}))
+
+
+class FormerRingKVCache(RingKVCache):
+    """`RingKVCache.complete` before the positions and mask were kept up to date."""
+
+    def complete(self, k, v, exec_mask=None):
+        B, H, T, D = k.shape
+        indexes = torch.arange(T, device=self.end_offset.device, dtype=self.end_offset.dtype)
+        indexes = (indexes + self.end_offset.view(-1, 1)) % self.capacity
+        indexes = indexes.view(B, 1, T, 1).expand(-1, H, -1, D)
+        if exec_mask is not None:
+            keep = ~exec_mask.view(B, 1, 1, 1)
+            k = torch.where(keep, self.cache[0].gather(2, indexes), k)
+            v = torch.where(keep, self.cache[1].gather(2, indexes), v)
+        self.cache[0].scatter_(2, indexes, k)
+        self.cache[1].scatter_(2, indexes, v)
+        if exec_mask is None:
+            self.end_offset.add_(T)
+        else:
+            self.end_offset.copy_(torch.where(exec_mask, self.end_offset + T, self.end_offset))
+        indexes = torch.arange(self.capacity, device=self.end_offset.device, dtype=torch.long)
+        end_offset = self.end_offset.view(-1, 1)
+        invalid = indexes >= end_offset
+        end_index = end_offset % self.capacity
+        delta = indexes - end_index
+        positions = torch.where(delta <= 0, end_offset + delta, end_offset + delta - self.capacity)
+        positions = torch.where(invalid, torch.full_like(positions, -1), positions)
+        return self.cache[0], self.cache[1], positions
+
+
+def former_attn_bias(pos_k, offset, T: int, context):
+    # Causal mask of StreamingMultiheadAttention.forward, built from the positions.
+    pos_k = pos_k[:, None]
+    pos_q = offset.view(-1, 1, 1) + torch.arange(T, device=offset.device, dtype=torch.long).view(1, -1, 1)
+    delta = pos_q - pos_k
+    attn_bias = (pos_k >= 0) & (delta >= 0)
+    if context is not None:
+        attn_bias = attn_bias & (delta < context)
+    return attn_bias[:, None]
+
+
+def attn_bias(cache: RingKVCache, pos_k, offset, T: int, context):
+    # Causal mask of StreamingMultiheadAttention.forward, when streaming.
+    if T == 1 and (context is None or context >= cache.capacity):
+        return cache.mask[:, None, None]
+    return former_attn_bias(pos_k, offset, T, context)
+
+
+def check(B: int, capacity: int, context, steps: int, gen: torch.Generator) -> bool:
+    H, D = 2, 4
+    former = FormerRingKVCache(B, H, D, capacity, torch.device("cpu"), torch.float32)
+    cache = RingKVCache(B, H, D, capacity, torch.device("cpu"), torch.float32)
+    offset = torch.zeros(B, dtype=torch.long)  # Offset of the attention, moved as the end offset
+    snapshot = None
+    for step in range(steps):
+        draw = float(torch.rand(1, generator=gen))
+        if draw < 0.02:
+            reset_mask = torch.rand(B, generator=gen) < 0.5
+            former.reset(reset_mask), cache.reset(reset_mask)
+            offset.masked_fill_(reset_mask, 0)
+        elif draw < 0.04:
+            rows = torch.rand(B, generator=gen) < 0.5
+            snapshot = rows, former.get_rows(rows), cache.get_rows(rows), offset[rows].clone()
+        elif draw < 0.06 and snapshot is not None:
+            rows, former_values, values, offsets = snapshot
+            former.set_rows(rows, former_values), cache.set_rows(rows, values)
+            offset[rows] = offsets
+        T = int(torch.randint(2, capacity, (1,), generator=gen)) if draw > 0.97 else 1
+        exec_mask = torch.rand(B, generator=gen) < 0.8
+        k, v = torch.randn(B, H, T, D, generator=gen), torch.randn(B, H, T, D, generator=gen)
+        _, _, former_positions = former.complete(k, v, exec_mask)
+        keys, values, positions = cache.complete(k, v, exec_mask)
+        # The attention of the skipped entries is discarded, their mask is left as is.
+        expected_bias = former_attn_bias(former_positions, offset, T, context)[exec_mask]
+        bias = attn_bias(cache, positions, offset, T, context)[exec_mask]
+        if not (torch.equal(positions, former_positions) and torch.equal(bias.expand_as(expected_bias), expected_bias)
+                and torch.equal(keys, former.cache[0]) and torch.equal(values, former.cache[1])):
+            print(f"✗ Capacity {capacity}, step {step} (T={T}): positions or mask differ from the former ones")
+            return False
+        offset = torch.where(exec_mask, offset + T, offset)
+    print(f"✓ Capacity {capacity:4d}, context {context}: keys, positions and masks identical over {steps} steps")
+    return True
+
+
+def measure(B: int, H: int, D: int, capacity: int, context, former: bool, steps: int, rounds: int):
+    """(dispatches, seconds) of the bookkeeping and mask per attention call, for single steps."""
+    cls = FormerRingKVCache if former else RingKVCache
+    cache = cls(B, H, D, capacity, torch.device("cpu"), torch.float32)
+    bias_fn = former_attn_bias if former else (lambda *a: attn_bias(cache, *a))
+    k, v = torch.randn(B, H, 1, D), torch.randn(B, H, 1, D)
+    offset = torch.full((B,), 5000)
+    exec_mask = torch.ones(B, dtype=torch.bool)
+    cache.end_offset.fill_(5000)
+
+    def run():
+        _, _, positions = cache.complete(k, v, exec_mask)
+        bias_fn(positions, offset, 1, context)
+        cache.end_offset.fill_(5000)
+
+    run()
+    counter = CountDispatches()
+    with counter:
+        run()
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.process_time()
+        for _ in range(steps):
+            run()
+        best = min(best, (time.process_time() - start) / steps)
+    return counter.count - 1, best  # Without the fill, only there to stay at the same step
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--check-steps", type=int, default=3000, help="Random steps of the equivalence check.")
+    parser.add_argument("--steps", type=int, default=500, help="Steps per timing round.")
+    parser.add_argument("--rounds", type=int, default=5, help="Timing rounds, the best one is kept.")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("KV Cache Bookkeeping Benchmark")
+    print("=" * 60)
+    gen = torch.Generator().manual_seed(0)
+    with torch.no_grad():
+        ok = check(args.batch_size, 16, None, args.check_steps, gen)
+        ok &= check(args.batch_size, 50, 50, args.check_steps, gen)
+        ok &= check(args.batch_size, 50, 20, args.check_steps, gen)  # Context reduced after the cache was made
+        if not ok:
+            return 1
+        cases = {
+            "transformer (3000)": (32, 128, 3000, 3000),
+            "depformer (16)": (16, 64, 16, None),
+        }
+        print("\n" + "=" * 60)
+        print(f"RESULTS (batch size {args.batch_size}, per attention call)")
+        print("=" * 60)
+        for name, (H, D, capacity, context) in cases.items():
+            before = measure(args.batch_size, H, D, capacity, context, True, args.steps, args.rounds)
+            after = measure(args.batch_size, H, D, capacity, context, False, args.steps, args.rounds)
+            print(f"  {name:>18}: dispatches {before[0]:3d} -> {after[0]:3d}, "
+                  f"CPU time {1e6 * before[1]:6.1f} us -> {1e6 * after[1]:6.1f} us ({before[1] / after[1]:.2f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
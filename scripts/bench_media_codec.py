@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark the Exotel media frame codec of the bridge, in frames per second per core.
+
+Times the inbound path (parse an Exotel media message and decode its PCM) and the
+outbound path (encode a 20ms PCM frame into a media message), as the bridge used to
+do them (json.loads + base64.b64decode, dict + base64.b64encode + json.dumps) and
+with exotel_media (orjson if installed, binascii, JSON template). The outputs of both
+are checked to be identical first.
+"""
+import argparse
+import base64
+import json
+import sys
+import time
+from pathlib import Path
+
+try:
+    import numpy as np
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    import exotel_media
+    from exotel_media import decode_payload, encode_media, parse_message, silence_media
+except ImportError:
+    print("ERROR: Missing dependencies. Install: pip install -r requirements.txt")
+    sys.exit(1)
+
+
+def make_message(pcm: bytes, index: int) -> str:
+    """Media message as sent by Exotel."""
+    return json.dumps({
+        "event": "media",
+        "sequence_number": str(index + 2),
+        "stream_sid": "b8a3f2c4e1d54c0a9e7f6a5b4c3d2e1f",
+        "media": {"chunk": str(index + 1), "timestamp": str(20 * index), "payload": base64.b64encode(pcm).decode("ascii")},
+    })
+
+
+def inbound_before(msg: str) -> bytes:
+    data = json.loads(msg)
+    return base64.b64decode(data.get("media", {}).get("payload"))
+
+
+def inbound_after(msg: str) -> bytes:
+    data, payload = parse_message(msg)
+    return decode_payload(payload)
+
+
+def outbound_before(pcm: bytes) -> str:
+    payload_b64 = base64.b64encode(pcm).decode("ascii")
+    return json.dumps({"event": "media", "media": {"payload": payload_b64}})
+
+
+def check(frames: list, messages: list) -> bool:
+    for pcm, msg in zip(frames, messages):
+        data, payload = parse_message(msg)
+        if data != json.loads(msg) or decode_payload(payload) != pcm or encode_media(pcm) != outbound_before(pcm):
+            print("✗ exotel_media output differs from json/base64")
+            return False
+    if silence_media(320) != outbound_before(bytes(320)):
+        print("✗ Cached silence frame differs")
+        return False
+    try:
+        parse_message('{"event": "media", "media": ')
+        print("✗ Invalid JSON accepted")
+        return False
+    except json.JSONDecodeError:
+        pass
+    print(f"✓ Same messages and PCM as json/base64 (parser: {'orjson' if exotel_media.orjson else 'json'})")
+    return True
+
+
+def timed(fn, items: list, rounds: int) -> float:
+    """Best seconds per item over rounds."""
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.process_time()
+        for item in items:
+            fn(item)
+        best = min(best, (time.process_time() - start) / len(items))
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--frames", type=int, default=20000, help="Frames per timing round.")
+    parser.add_argument("--rounds", type=int, default=5, help="Timing rounds, the best one is kept.")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Exotel Media Codec Benchmark")
+    print("=" * 60)
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(-8000, 8000, 160, dtype=np.int16).tobytes() for _ in range(args.frames)]
+    messages = [make_message(pcm, i) for i, pcm in enumerate(frames)]
+    if not check(frames, messages):
+        return 1
+
+    results = {
+        "inbound": (timed(inbound_before, messages, args.rounds), timed(inbound_after, messages, args.rounds)),
+        "outbound": (timed(outbound_before, frames, args.rounds), timed(encode_media, frames, args.rounds)),
+    }
+
+    print("\n" + "=" * 60)
+    print("RESULTS")
+    print("=" * 60)
+    for name, (before, after) in results.items():
+        print(f"  {name:>8}: json/base64 {1e6 * before:6.2f} us ({1 / before:9.0f} frames/s per core), "
+              f"exotel_media {1e6 * after:6.2f} us ({1 / after:9.0f} frames/s per core), {before / after:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Benchmark the per-step weights of the depformer layers on CPU.
+
+Runs `multi_linear` and the gating of the `weights_per_step` layers as they used to be
+(a Python loop over the time steps, one `F.linear` or `ActivationGating` per step,
+then `torch.stack` or `torch.cat`) and with the stacked weights (a weight slice for a
+single step, batched matmuls over the steps otherwise). Single steps must give the
+same outputs, several steps the same to float32 precision, and the stacked gating
+must save and load the keys of the former list of `ActivationGating`, as checkpoints
+have them. Reports the torch dispatches and the CPU time per call, for a single
+depformer step and for all the steps at once, at the depformer size.
+"""
+import argparse
+import sys
+import time
+
+try:
+    import torch
+    from torch import nn
+    from torch.nn import functional as F
+    from torch.utils._python_dispatch import TorchDispatchMode
+    from moshi.models import loaders, LMModel
+    from moshi.modules.gating import ActivationGating, MultiActivationGating, make_multi_gating
+    from moshi.modules.transformer import multi_linear
+except ImportError:
+    print("ERROR: Missing dependencies. Install: pip install moshi/.")
+    sys.exit(1)
+
+
+class CountDispatches(TorchDispatchMode):
+    """Counts the aten operators dispatched."""
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def __torch_dispatch__(self, func, types, args=(), kwargs=None):
+        self.count += 1
+        return func(*args, **(kwargs or {}))
+
+
+def former_multi_linear(num_linear, weight, x, offset):
+    # multi_linear before the batched matmul.
+    B, T, C = x.shape
+    ys = []
+    chout, chin = weight.shape
+    weight = weight.view(num_linear, -1, chin)
+    for t in range(T):
+        y = F.linear(x[:, t], weight[t + offset])
+        ys.append(y)
+    return torch.stack(ys, 1)
+
+
+def former_gating(gatings: nn.ModuleList, x, offset):
+    # _ff_block of the weights_per_step layers before the stacked gating.
+    B, T, D = x.shape
+    ys = []
+    for t in range(T):
+        y = gatings[offset + t](x[:, t : t + 1])
+        ys.append(y)
+    return torch.cat(ys, dim=1)
+
+
+def build(steps: int, dim: int, dim_feedforward: int, dtype=torch.float32):
+    """Stacked gating, and the former list of gatings loaded from its state dict."""
+    gating = make_multi_gating("silu", steps, dim, dim_feedforward, dtype=dtype)
+    gatings = nn.ModuleList([ActivationGating(dim, dim_feedforward, F.silu, dtype=dtype) for _ in range(steps)])
+    gatings.load_state_dict(gating.state_dict())
+    return gating, gatings
+
+
+def check_outputs(B: int, steps: int) -> bool:
+    gen = torch.Generator().manual_seed(0)
+    dim = 64
+    weight = torch.randn(steps * 3 * dim, dim, generator=gen)
+    gating, gatings = build(steps, dim, 4 * dim)
+    x = torch.randn(B, steps, dim, generator=gen)
+    for offset in range(steps):
+        xt = x[:, offset : offset + 1]
+        if not (torch.equal(multi_linear(steps, weight, xt, offset), former_multi_linear(steps, weight, xt, offset))
+                and torch.equal(gating(xt, offset), former_gating(gatings, xt, offset))):
+            print(f"✗ Single step {offset}: outputs differ from the former loops")
+            return False
+    for offset, T in [(0, steps), (3, 5)]:
+        xt = x[:, offset : offset + T]
+        linear_error = (multi_linear(steps, weight, xt, offset) - former_multi_linear(steps, weight, xt, offset)).abs().max()
+        gating_error = (gating(xt, offset) - former_gating(gatings, xt, offset)).abs().max()
+        if linear_error > 1e-4 or gating_error > 1e-4:
+            print(f"✗ Steps {offset} to {offset + T}: max error {linear_error:.1e} (linear), {gating_error:.1e} (gating)")
+            return False
+    print(f"✓ Single steps identical to the former loops, {steps} steps at once to {max(linear_error, gating_error):.1e}")
+    return True
+
+
+def check_checkpoint_keys() -> bool:
+    lm_kwargs = dict(loaders._lm_kwargs, dim=64, text_card=100, num_heads=4, num_layers=1,
+                     dep_q=16, depformer_dim=64, depformer_dim_feedforward=256, depformer_num_heads=4)
+    lm = LMModel(device="cpu", dtype=torch.float32, **lm_kwargs)
+    state_dict = lm.state_dict()
+    if "depformer.layers.0.gating.15.linear_out.weight" not in state_dict \
+            or any("linear_in_weight" in key for key in state_dict):
+        print("✗ Checkpoint keys: the stacked gating is not saved as a list of ActivationGating")
+        return False
+    # As the loaders do: on the meta device, then the weights assigned.
+    loaded = LMModel(device="meta", dtype=torch.float32, **lm_kwargs)
+    result = loaded.load_state_dict(dict(state_dict), strict=False, assign=True)
+    gating = loaded.depformer.layers[0].gating
+    if result.missing_keys or result.unexpected_keys or not isinstance(gating, MultiActivationGating) \
+            or not all(torch.equal(a, b) for a, b in zip(loaded.parameters(), lm.parameters())):
+        print(f"✗ Checkpoint keys: missing {result.missing_keys}, unexpected {result.unexpected_keys}")
+        return False
+    print("✓ Checkpoint keys: saved and loaded as a list of ActivationGating, on the meta device too")
+    return True
+
+
+def timed(fn, steps: int, rounds: int) -> float:
+    """Best CPU seconds per call over rounds."""
+    fn()
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.process_time()
+        for _ in range(steps):
+            fn()
+        best = min(best, (time.process_time() - start) / steps)
+    return best
+
+
+def dispatches(fn) -> int:
+    counter = CountDispatches()
+    with counter:
+        fn()
+    return counter.count
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--steps", type=int, default=50, help="Calls per timing round.")
+    parser.add_argument("--rounds", type=int, default=5, help="Timing rounds, the best one is kept.")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Per-Step Weights Benchmark")
+    print("=" * 60)
+    with torch.no_grad():
+        if not (check_outputs(args.batch_size, 16) & check_checkpoint_keys()):
+            return 1
+        # Depformer size: 16 steps of dimension 1024, feedforward 4.125 * 1024
+        B, S, dim = args.batch_size, 16, 1024
+        weight = torch.randn(S * 3 * dim, dim)
+        gating, gatings = build(S, dim, int(4.125 * dim))
+        x = torch.randn(B, S, dim)
+        cases = {
+            "in_proj, 1 step": (lambda: former_multi_linear(S, weight, x[:, 5:6], 5),
+                                lambda: multi_linear(S, weight, x[:, 5:6], 5)),
+            "gating, 1 step": (lambda: former_gating(gatings, x[:, 5:6], 5), lambda: gating(x[:, 5:6], 5)),
+            "in_proj, 16 steps": (lambda: former_multi_linear(S, weight, x, 0), lambda: multi_linear(S, weight, x, 0)),
+            "gating, 16 steps": (lambda: former_gating(gatings, x, 0), lambda: gating(x, 0)),
+        }
+        print("\n" + "=" * 60)
+        print(f"RESULTS (batch size {B}, per call)")
+        print("=" * 60)
+        for name, (before_fn, after_fn) in cases.items():
+            before, after = timed(before_fn, args.steps, args.rounds), timed(after_fn, args.steps, args.rounds)
+            print(f"  {name:>17}: dispatches {dispatches(before_fn):3d} -> {dispatches(after_fn):3d}, "
+                  f"CPU time {1e6 * before:7.1f} us -> {1e6 * after:7.1f} us ({before / after:.2f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
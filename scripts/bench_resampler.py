@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Benchmark the bridge PCM resamplers on 20 ms chunks.
+
+Times the former per-chunk `PythonResampler` (scipy.signal.resample_poly on each
+chunk) against the stateful `StreamingResampler`, in both directions of the bridge,
+and reports the time per chunk.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+try:
+    import numpy as np
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from exotel_bridge import PythonResampler, StreamingResampler
+except ImportError:
+    print("ERROR: Missing dependencies. Install: pip install -r requirements.txt")
+    sys.exit(1)
+
+
+def bench(resampler, chunks: list[bytes], rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for chunk in chunks:
+            resampler.resample(chunk)
+        best = min(best, (time.perf_counter() - start) / len(chunks))
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=10.0, help="Audio duration per round.")
+    parser.add_argument("--rounds", type=int, default=5, help="Timing rounds, the best one is kept.")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Bridge Resampler Benchmark")
+    print("=" * 60)
+    rng = np.random.default_rng(0)
+    for in_sr, out_sr in [(8000, 24000), (24000, 8000)]:
+        chunk_samples = int(in_sr * 0.02)
+        num_chunks = int(args.seconds / 0.02)
+        pcm = (3000 * rng.standard_normal(chunk_samples * num_chunks)).astype(np.int16)
+        chunks = [pcm[i * chunk_samples: (i + 1) * chunk_samples].tobytes() for i in range(num_chunks)]
+        old = bench(PythonResampler(in_sr, out_sr), chunks, args.rounds)
+        new = bench(StreamingResampler(in_sr, out_sr), chunks, args.rounds)
+        print(f"{in_sr // 1000}k->{out_sr // 1000}k, {chunk_samples} samples per chunk:")
+        print(f"  per-chunk resample_poly: {1e6 * old:8.1f} us per chunk")
+        print(f"  streaming polyphase:     {1e6 * new:8.1f} us per chunk ({old / new:.1f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
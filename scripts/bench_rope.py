@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Benchmark the RoPE and sinusoidal position embeddings on CPU.
+
+Runs `apply_rope` and `create_sin_embedding` as they used to be (the frequencies and
+the cos and sin of the phases recomputed in float32 at every call) and as they are now
+(RoPE rotations looked up in precomputed tables and applied with a complex product, sin
+frequencies cached). RoPE must match a float64 reference to float32 precision at any
+position, including offsets far beyond the context, where the float32 phases of the
+former code drift; the sin embedding must match the former one. Reports the CPU time
+per call for a streaming step (T=1) and a prefill chunk, for the main transformer and
+depformer shapes.
+"""
+import argparse
+import math
+import sys
+import time
+
+try:
+    import torch
+    from moshi.modules.rope import apply_rope, ROTATION_TABLE_SIZE
+    from moshi.modules.transformer import create_sin_embedding
+except ImportError:
+    print("ERROR: Missing dependencies. Install: pip install moshi/.")
+    sys.exit(1)
+
+
+def former_apply_rope(q, k, offset, max_period=10_000, time_before_heads=False):
+    # apply_rope before the rotation tables.
+    if time_before_heads:
+        B, T, H, D = q.shape
+    else:
+        B, H, T, D = q.shape
+    ds = torch.arange(D // 2, device=q.device, dtype=torch.float32)
+    freqs = torch.exp(ds * (-math.log(max_period) * 2 / D))
+    ts = offset.float().view(-1, 1, 1) + torch.arange(T, device=q.device, dtype=torch.float32)
+    if time_before_heads:
+        ts = ts.view(-1, T, 1, 1)
+    else:
+        ts = ts.view(-1, 1, T, 1)
+    dims = q.shape[:-1]
+    q = q.view(*dims, D // 2, 2)
+    k = k.view(*dims, D // 2, 2)
+    qr, qi = q[..., 0].float(), q[..., 1].float()
+    kr, ki = k[..., 0].float(), k[..., 1].float()
+    rotr = torch.cos(freqs * ts)
+    roti = torch.sin(freqs * ts)
+    qor = qr * rotr - qi * roti
+    qoi = qr * roti + qi * rotr
+    kor = kr * rotr - ki * roti
+    koi = kr * roti + ki * rotr
+    dtype = q.dtype
+    qo = torch.stack([qor.to(dtype), qoi.to(dtype)], dim=-1)
+    ko = torch.stack([kor.to(dtype), koi.to(dtype)], dim=-1)
+    return qo.view(*dims, D), ko.view(*dims, D)
+
+
+def former_create_sin_embedding(positions, dim, max_period=10000, dtype=torch.float32):
+    # create_sin_embedding before the rotation tables.
+    half_dim = dim // 2
+    positions = positions.to(dtype)
+    adim = torch.arange(half_dim, device=positions.device, dtype=dtype).view(1, 1, -1)
+    max_period_tensor = torch.full([], max_period, device=positions.device, dtype=dtype)
+    phase = positions / (max_period_tensor ** (adim / (half_dim - 1)))
+    return torch.cat([torch.cos(phase), torch.sin(phase)], dim=-1)
+
+
+def reference_apply_rope(q, k, offset, max_period=10_000, time_before_heads=False):
+    """float64 RoPE, with the positions kept exact."""
+    q64, k64 = q.double(), k.double()
+    if time_before_heads:
+        q64, k64 = q64.transpose(1, 2), k64.transpose(1, 2)
+    B, H, T, D = q64.shape
+    freqs = torch.exp(torch.arange(D // 2, dtype=torch.float64) * (-math.log(max_period) * 2 / D))
+    ts = (offset.view(-1, 1) + torch.arange(T)).double().view(-1, 1, T, 1)
+    rot = torch.polar(torch.ones_like(freqs * ts), freqs * ts)
+
+    def _rotate(x):
+        out = torch.view_as_real(torch.view_as_complex(x.reshape(*x.shape[:-1], D // 2, 2).contiguous()) * rot)
+        out = out.reshape(x.shape)
+        return out.transpose(1, 2) if time_before_heads else out
+
+    return _rotate(q64), _rotate(k64)
+
+
+def max_error(outputs, reference) -> float:
+    return max((a.double() - b).abs().max().item() for a, b in zip(outputs, reference))
+
+
+def check_rope() -> bool:
+    gen = torch.Generator().manual_seed(0)
+    ok = True
+    offsets = {
+        "in context": torch.tensor([0, 7, 1000, 3000]),
+        "single offset": torch.tensor([4095]),
+        "past the table": torch.tensor([4096, 5000, 100_000, 1_000_000]),
+        "15 days": torch.tensor([ROTATION_TABLE_SIZE ** 2 - 9]),
+    }
+    for name, offset in offsets.items():
+        for time_before_heads in (False, True):
+            B, H, T, D = len(offset), 8, 9, 128
+            shape = (B, T, H, D) if time_before_heads else (B, H, T, D)
+            q, k = torch.randn(shape, generator=gen), torch.randn(shape, generator=gen)
+            reference = reference_apply_rope(q, k, offset, time_before_heads=time_before_heads)
+            new = max_error(apply_rope(q, k, offset, time_before_heads=time_before_heads), reference)
+            former = max_error(former_apply_rope(q, k, offset, time_before_heads=time_before_heads), reference)
+            # Products of two rounded float32 rotations: a few float32 ulps of the inputs
+            if new > 1e-5:
+                print(f"✗ RoPE {name} (time_before_heads={time_before_heads}): error {new:.2e}")
+                ok = False
+        print(f"✓ RoPE {name:>14}: max error vs float64 {new:.1e} (former float32 phases {former:.1e})")
+    q = torch.randn(2, 8, 3, 64, generator=gen).to(torch.bfloat16)
+    k = torch.randn(2, 8, 3, 64, generator=gen).to(torch.bfloat16)
+    offset = torch.tensor([5, 200])
+    inputs = q.clone(), k.clone()
+    new, former = apply_rope(q, k, offset), former_apply_rope(q, k, offset)
+    if not (torch.equal(q, inputs[0]) and torch.equal(k, inputs[1])):
+        print("✗ RoPE bfloat16: inputs modified")
+        ok = False
+    elif new[0].dtype != torch.bfloat16 or max_error(new, [x.double() for x in former]) > 2e-2:
+        print(f"✗ RoPE bfloat16: {new[0].dtype}, differs from the former by {max_error(new, former):.2e}")
+        ok = False
+    else:
+        print("✓ RoPE bfloat16: inputs not modified, same as the former to bfloat16 precision")
+    return ok
+
+
+def check_sin_embedding() -> bool:
+    positions = torch.tensor([[0, 1, 250], [3000, 4096, 9000]]).view(2, 3, 1)
+    new = create_sin_embedding(positions, 64)
+    former = former_create_sin_embedding(positions, 64)
+    # The phases are still float32, only the frequencies differ by their rounding
+    error = (new - former).abs().max().item()
+    if new.shape != former.shape or error > 1e-3:
+        print(f"✗ Sin embedding: shape {tuple(new.shape)}, differs from the former by {error:.2e}")
+        return False
+    print(f"✓ Sin embedding: same as the former to {error:.1e}")
+    return True
+
+
+def timed(fn, args: tuple, steps: int, rounds: int) -> float:
+    """Best CPU seconds per call over rounds."""
+    fn(*args)
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.process_time()
+        for _ in range(steps):
+            fn(*args)
+        best = min(best, (time.process_time() - start) / steps)
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--steps", type=int, default=500, help="Calls per timing round.")
+    parser.add_argument("--rounds", type=int, default=5, help="Timing rounds, the best one is kept.")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("RoPE Tables Benchmark")
+    print("=" * 60)
+    with torch.no_grad():
+        if not (check_rope() & check_sin_embedding()):
+            return 1
+        B = args.batch_size
+        cases = {
+            "transformer step": (B, 32, 1, 128, torch.float32),
+            "transformer step bf16": (B, 32, 1, 128, torch.bfloat16),
+            "transformer prefill": (B, 32, 32, 128, torch.float32),
+            "depformer step": (B, 16, 1, 64, torch.float32),
+        }
+        print("\n" + "=" * 60)
+        print(f"RESULTS (batch size {B}, per attention call)")
+        print("=" * 60)
+        offset = torch.full((B,), 1234)
+        for name, (B, H, T, D, dtype) in cases.items():
+            q, k = torch.randn(B, H, T, D).to(dtype), torch.randn(B, H, T, D).to(dtype)
+            before = timed(former_apply_rope, (q, k, offset), args.steps, args.rounds)
+            after = timed(apply_rope, (q, k, offset), args.steps, args.rounds)
+            print(f"  {name:>22}: CPU time {1e6 * before:7.1f} us -> {1e6 * after:7.1f} us ({before / after:.2f}x)")
+        for T in (1, 32):
+            positions = offset.view(-1, 1, 1) + torch.arange(T).view(1, -1, 1)
+            before = timed(former_create_sin_embedding, (positions, 4096), args.steps, args.rounds)
+            after = timed(create_sin_embedding, (positions, 4096), args.steps, args.rounds)
+            label = f"sin embedding T={T}"
+            print(f"  {label:>22}: CPU time {1e6 * before:7.1f} us -> {1e6 * after:7.1f} us ({before / after:.2f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Benchmark the step input preparation of LMGen on CPU.
+
+Runs `LMGen.prepare_step_input` with the token writes done as they used to be (one
+write per given stream into the cache and one into `provided`, each building its delay
+tensor on the host, and a loop over the 17 codebooks for the initial tokens), and
+with the precomputed codebook and delay index tensors (one scatter into each for all
+the given streams). The cache and `provided` must be identical after each step, for
+random combinations of given streams and exec masks. Reports the torch dispatches and
+the CPU time per step, when serving (user stream given) and when prefilling prompts
+(all the streams given), in the first frames (initial tokens written) and after.
+"""
+import argparse
+import sys
+import time
+
+try:
+    import torch
+    from torch.utils._python_dispatch import TorchDispatchMode
+    from moshi.models import loaders, LMModel, LMGen
+    from moshi.models.lm import AUDIO_TOKENS_PER_STREAM
+except ImportError:
+    print("ERROR: Missing dependencies. Install: pip install moshi/.")
+    sys.exit(1)
+
+
+class CountDispatches(TorchDispatchMode):
+    """Counts the aten operators dispatched."""
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def __torch_dispatch__(self, func, types, args=(), kwargs=None):
+        self.count += 1
+        return func(*args, **(kwargs or {}))
+
+
+def former_write_step_tokens(lm_gen: LMGen, rows, offsets, input_tokens, moshi_tokens, text_token):
+    # Token writes of prepare_step_input before the precomputed index tensors.
+    state = lm_gen._streaming_state
+    lm_model = lm_gen.lm_model
+    B, K, CT = state.cache.shape
+    device = state.cache.device
+    rows_ = rows.to(device)
+
+    def _write_tokens(first_k: int, tokens: torch.Tensor):
+        ks = torch.arange(first_k, first_k + tokens.shape[1])
+        delays = torch.tensor([lm_model.delays[k] for k in ks.tolist()], dtype=torch.long)
+        write_positions = ((offsets[:, None] + delays[None, :]) % CT).to(device)
+        ks = ks.to(device)
+        state.cache[rows_[:, None], ks[None, :], write_positions] = tokens[rows_, :, 0]
+        state.provided[rows_[:, None], ks[None, :], write_positions] = True
+
+    if input_tokens is not None:
+        _write_tokens(AUDIO_TOKENS_PER_STREAM + 1, lm_gen._expand_batch(input_tokens, B))
+    if moshi_tokens is not None:
+        _write_tokens(1, lm_gen._expand_batch(moshi_tokens, B))
+    if text_token is not None:
+        write_positions = ((offsets + lm_model.delays[0]) % CT).to(device)
+        text_token = lm_gen._expand_batch(text_token, B)
+        if isinstance(text_token, torch.Tensor) and text_token.dim() > 0:
+            text_token = text_token.view(B)[rows_]
+        state.cache[rows_, 0, write_positions] = text_token
+        state.provided[rows_, 0, write_positions] = True
+    for k, delay in enumerate(lm_model.delays):
+        init = offsets <= delay
+        if init.any():
+            init_rows = rows_[init.to(device)]
+            init_positions = (offsets[init] % CT).to(device)
+            state.cache[init_rows, k, init_positions] = state.initial[0, k, 0]
+            state.provided[init_rows, k, init_positions] = True
+
+
+def build_lm_gen(batch_size: int) -> LMGen:
+    lm_kwargs = dict(loaders._lm_kwargs, dim=64, text_card=100, num_heads=4, num_layers=1,
+                     dep_q=16, depformer_dim=64, depformer_dim_feedforward=256, depformer_num_heads=4)
+    lm = LMModel(device="cpu", dtype=torch.float32, **lm_kwargs)
+    lm.eval()
+    lm_gen = LMGen(lm, device="cpu", use_sampling=True)
+    lm_gen.streaming_forever(batch_size)
+    return lm_gen
+
+
+def random_inputs(lm_gen: LMGen, B: int, gen: torch.Generator, streams=None):
+    lm = lm_gen.lm_model
+    needed = lm.num_codebooks - AUDIO_TOKENS_PER_STREAM - 1
+    if streams is None:
+        streams = torch.rand(3, generator=gen) < 0.5
+    user, moshi, text = (bool(x) for x in streams)
+    # Text tokens are given per slot, for a single stream, or as a constant (lm_gen.zero_text_code)
+    text_kind = int(torch.randint(3, (1,), generator=gen))
+    text_token = [torch.randint(lm.text_card, (B,), generator=gen),
+                  torch.randint(lm.text_card, (1,), generator=gen), lm_gen.zero_text_code][text_kind]
+    moshi_b = int(torch.randint(2, (1,), generator=gen)) * (B - 1) + 1  # Per slot, or a prompt for all
+    return (
+        torch.randint(lm.card, (B, needed, 1), generator=gen) if user else None,
+        torch.randint(lm.card, (moshi_b, needed, 1), generator=gen) if moshi else None,
+        text_token if text else None,
+    )
+
+
+def advance(lm_gen: LMGen, prepared):
+    # The offsets are moved on by step() after the model, which is not run here.
+    state = lm_gen._streaming_state
+    if prepared is not None:
+        rows = prepared[5].nonzero()[:, 0]
+        state.offsets[rows] += 1
+
+
+def check(B: int, steps: int) -> bool:
+    gen = torch.Generator().manual_seed(0)
+    lm_gen = build_lm_gen(B)
+    state = lm_gen._streaming_state
+    vectorized = lm_gen._write_step_tokens
+    for step in range(steps):
+        exec_mask = torch.rand(B, generator=gen) < 0.7
+        lm_gen.set_exec_mask(exec_mask)
+        inputs = random_inputs(lm_gen, B, gen)
+        saved = state.cache.clone(), state.provided.clone(), state.offsets.clone(), \
+            state.forced_steps.clone(), state.user_steps.clone()
+        lm_gen._write_step_tokens = lambda *a: former_write_step_tokens(lm_gen, *a)
+        expected = lm_gen.prepare_step_input(*inputs)
+        expected_state = state.cache.clone(), state.provided.clone()
+        state.cache.copy_(saved[0]), state.provided.copy_(saved[1]), state.offsets.copy_(saved[2])
+        state.forced_steps.copy_(saved[3]), state.user_steps.copy_(saved[4])
+        lm_gen._write_step_tokens = vectorized
+        prepared = lm_gen.prepare_step_input(*inputs)
+        if not (torch.equal(state.cache, expected_state[0]) and torch.equal(state.provided, expected_state[1])):
+            print(f"✗ Step {step}: cache differs from the former writes")
+            return False
+        if (prepared is None) != (expected is None) or (prepared is not None and not all(
+                torch.equal(a, b) if isinstance(a, torch.Tensor) else a == b for a, b in zip(prepared, expected))):
+            print(f"✗ Step {step}: step input differs from the former writes")
+            return False
+        advance(lm_gen, prepared)
+    print(f"✓ Cache, provided and step inputs identical to the former writes over {steps} random steps")
+    return True
+
+
+def measure(B: int, streams, first_frames: bool, former: bool, steps: int, rounds: int):
+    """(dispatches, seconds) per prepare_step_input call."""
+    gen = torch.Generator().manual_seed(1)
+    lm_gen = build_lm_gen(B)
+    if former:
+        lm_gen._write_step_tokens = lambda *a: former_write_step_tokens(lm_gen, *a)
+    state = lm_gen._streaming_state
+    inputs = random_inputs(lm_gen, B, gen, streams)
+    start_offset = 1 if first_frames else lm_gen.max_delay + 10
+
+    def run():
+        state.offsets.fill_(start_offset)
+        lm_gen.prepare_step_input(*inputs)  # As the offset is not moved, the same step again
+
+    run()
+    counter = CountDispatches()
+    with counter:
+        run()
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.process_time()
+        for _ in range(steps):
+            run()
+        best = min(best, (time.process_time() - start) / steps)
+    return counter.count, best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--check-steps", type=int, default=200, help="Random steps of the equivalence check.")
+    parser.add_argument("--steps", type=int, default=500, help="Steps per timing round.")
+    parser.add_argument("--rounds", type=int, default=5, help="Timing rounds, the best one is kept.")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Step Input Preparation Benchmark")
+    print("=" * 60)
+    with torch.no_grad():
+        if not check(args.batch_size, args.check_steps):
+            return 1
+        cases = {
+            "serving": (True, False, False),
+            "prompts": (True, True, True),
+        }
+        print("\n" + "=" * 60)
+        print(f"RESULTS (batch size {args.batch_size}, per prepare_step_input call)")
+        print("=" * 60)
+        for name, streams in cases.items():
+            for first_frames in (True, False):
+                before = measure(args.batch_size, streams, first_frames, True, args.steps, args.rounds)
+                after = measure(args.batch_size, streams, first_frames, False, args.steps, args.rounds)
+                label = f"{name}, {'first frames' if first_frames else 'after'}"
+                print(f"  {label:>22}: dispatches {before[0]:3d} -> {after[0]:3d}, "
+                      f"CPU time {1e6 * before[1]:6.1f} us -> {1e6 * after[1]:6.1f} us ({before[1] / after[1]:.2f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
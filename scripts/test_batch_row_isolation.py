@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Check that the rows of a batched Mimi and LMGen are independent of each other.
+
+Runs the streaming pipeline of the server (Mimi encode, greedy `LMGen.step`, Mimi
+decode, with the exec masks set as `ServerState._tick` does) on small randomly
+initialized models. Two rows stepped together must generate the same tokens as each
+row stepped alone with a batch of 1, a row left out of the exec mask must keep a
+bit-identical streaming state (conv, KV cache and offsets) and resume as if it had
+not been paused, and resetting a row must leave the other row untouched and the reset
+row as a fresh one.
+"""
+import copy
+import sys
+
+try:
+    import torch
+    from moshi.models import loaders, LMModel, LMGen, MimiModel
+    from moshi.modules import SEANetEncoder, SEANetDecoder, transformer
+    from moshi.quantization import SplitResidualVectorQuantizer
+except ImportError:
+    print("ERROR: Missing dependencies. Install: pip install moshi/.")
+    sys.exit(1)
+
+CONTEXT = 16  # Shorter than the runs, to go through the KV cache wrap around.
+NUM_FRAMES = 24
+PAUSED_STEPS = (5, 6, 20)  # Steps at which row 1 is left out of the exec mask, before and after the
+# wrap around.
+PCM_RTOL = 1e-4  # Relative to the peak of the PCM of the row stepped alone.
+
+
+def small_mimi() -> MimiModel:
+    seanet_kwargs = dict(loaders._seanet_kwargs, dimension=32, n_filters=4)
+    quantizer_kwargs = dict(loaders._quantizer_kwargs, dimension=16, input_dimension=32, output_dimension=32)
+    transformer_kwargs = dict(loaders._transformer_kwargs, d_model=32, num_heads=2, num_layers=2,
+                              dim_feedforward=64, input_dimension=32, output_dimensions=[32])
+    encoder = SEANetEncoder(**seanet_kwargs)
+    mimi = MimiModel(
+        encoder,
+        SEANetDecoder(**seanet_kwargs),
+        SplitResidualVectorQuantizer(**quantizer_kwargs),
+        channels=1,
+        sample_rate=loaders.SAMPLE_RATE,
+        frame_rate=loaders.FRAME_RATE,
+        encoder_frame_rate=loaders.SAMPLE_RATE / encoder.hop_length,
+        causal=True,
+        resample_method="conv",
+        encoder_transformer=transformer.ProjectedTransformer(**transformer_kwargs),
+        decoder_transformer=transformer.ProjectedTransformer(**transformer_kwargs),
+    )
+    # The codebooks start at zero, for which all the frames encode and decode the same. Without
+    # biases, the latents of a random encoder are spread around zero, on the scale of these codebooks.
+    for name, param in mimi.named_parameters():
+        if name.endswith("bias"):
+            param.data.zero_()
+    for name, buffer in mimi.named_buffers():
+        if name.endswith("embedding_sum"):
+            buffer.normal_(std=1e-3)
+    mimi.eval()
+    mimi.set_num_codebooks(8)
+    return mimi
+
+
+def small_lm() -> LMModel:
+    lm_kwargs = dict(loaders._lm_kwargs, dim=64, text_card=100, num_heads=4, num_layers=2, context=CONTEXT,
+                     depformer_dim=32, depformer_dim_feedforward=64, depformer_num_heads=2,
+                     depformer_num_layers=2)
+    lm = LMModel(device="cpu", dtype=torch.float32, **lm_kwargs)
+    lm.eval()
+    return lm
+
+
+class Pipeline:
+    """Streaming Mimi and LMGen with `batch_size` rows, stepped as `ServerState._tick` does."""
+
+    def __init__(self, mimi: MimiModel, lm: LMModel, batch_size: int):
+        self.mimi = mimi
+        self.batch_size = batch_size
+        self.frame_size = int(mimi.sample_rate / mimi.frame_rate)
+        self.lm_gen = LMGen(lm, device="cpu", use_sampling=False)
+        self.mimi.streaming_forever(batch_size)
+        self.lm_gen.streaming_forever(batch_size)
+
+    def step(self, frames: dict) -> dict:
+        """Step the rows given by `frames` (row -> PCM frame), returns row -> (tokens, pcm)
+        for the rows past the initial delay."""
+        mask = torch.zeros(self.batch_size, dtype=torch.bool)
+        chunk = torch.zeros(self.batch_size, 1, self.frame_size)
+        for row, frame in frames.items():
+            mask[row] = True
+            chunk[row, 0] = frame
+        self.mimi.set_exec_mask(mask)
+        self.lm_gen.set_exec_mask(mask)
+        ready = self.lm_gen.output_ready()
+        codes = self.mimi.encode(chunk)
+        outputs = {}
+        for c in range(codes.shape[-1]):
+            tokens = self.lm_gen.step(codes[:, :, c: c + 1])
+            if tokens is None:
+                continue
+            self.mimi.set_exec_mask(ready)
+            pcm = self.mimi.decode(torch.where(ready.view(-1, 1, 1), tokens[:, 1:9], 0))
+            for row in frames:
+                if ready[row]:
+                    outputs[row] = (tokens[row], pcm[row])
+        return outputs
+
+    def reset(self, rows: torch.Tensor):
+        self.mimi.reset_streaming(rows)
+        self.lm_gen.reset_streaming(rows)
+
+    def row_state(self, row: int) -> dict:
+        rows = torch.zeros(self.batch_size, dtype=torch.bool)
+        rows[row] = True
+        state = {}
+        for name, module in (("mimi", self.mimi), ("lm_gen", self.lm_gen)):
+            for key, value in module.get_streaming_state_rows(rows).items():
+                # Which rows are stepped is set before each step, it is not part of the row.
+                if not key.endswith("exec_mask"):
+                    state[f"{name}.{key}"] = value
+        return state
+
+
+def differing_keys(expected: dict, state: dict) -> list:
+    keys = []
+    for key in sorted(expected.keys() | state.keys()):
+        if key in expected and key in state:
+            if not torch.equal(expected[key], state[key]):
+                keys.append(key)
+        elif not key.endswith("pending_reset") or (expected.get(key, state.get(key))).any():
+            # The conv `pending_reset` is None until a row is reset, i.e. False for all the rows.
+            keys.append(key)
+    return keys
+
+
+def run_alone(mimi: MimiModel, lm: LMModel, frames: list) -> list:
+    pipeline = Pipeline(mimi, lm, 1)
+    outputs = []
+    for frame in frames:
+        output = pipeline.step({0: frame})
+        if 0 in output:
+            outputs.append(output[0])
+    return outputs
+
+
+def compare_outputs(name: str, outputs: list, expected: list) -> bool:
+    if len(outputs) != len(expected):
+        print(f"✗ {name}: {len(outputs)} frames generated, {len(expected)} alone")
+        return False
+    tokens = torch.stack([t for t, _ in outputs])
+    if not torch.equal(tokens, torch.stack([t for t, _ in expected])):
+        print(f"✗ {name}: tokens differ from the row stepped alone")
+        return False
+    peak = max(q.abs().max().item() for _, q in expected)
+    pcm_diff = max((p - q).abs().max().item() for (_, p), (_, q) in zip(outputs, expected)) / peak
+    if pcm_diff > PCM_RTOL:
+        print(f"✗ {name}: PCM differs from the row stepped alone by {pcm_diff:.2e} of its peak")
+        return False
+    print(f"✓ {name}: {len(outputs)} frames, same tokens as alone (PCM max diff {pcm_diff:.1e} of the peak)")
+    return True
+
+
+def main() -> int:
+    print("=" * 60)
+    print("Batch Row Isolation Test")
+    print("=" * 60)
+    torch.manual_seed(0)
+    mimi, lm = small_mimi(), small_lm()
+    rng = torch.Generator().manual_seed(1)
+    frame_size = int(mimi.sample_rate / mimi.frame_rate)
+    inputs = [[0.1 * torch.randn(frame_size, generator=rng) for _ in range(NUM_FRAMES)] for _ in range(3)]
+    ok = True
+    with torch.no_grad():
+        alone = [run_alone(mimi, lm, frames) for frames in inputs]
+        # On copies, as a pipeline takes over the streaming state of its modules.
+        fresh = Pipeline(copy.deepcopy(mimi), copy.deepcopy(lm), 2)
+
+        # Rows 0 and 1 stepped together, row 1 left out of the exec mask at PAUSED_STEPS.
+        pipeline = Pipeline(mimi, lm, 2)
+        outputs = [[], []]
+        next_frame = [0, 0]
+        paused_ok = True
+        for step in range(NUM_FRAMES + len(PAUSED_STEPS)):
+            rows = [0] if step in PAUSED_STEPS else [0, 1]
+            rows = [row for row in rows if next_frame[row] < NUM_FRAMES]
+            before = pipeline.row_state(1)
+            for row, output in pipeline.step({row: inputs[row][next_frame[row]] for row in rows}).items():
+                outputs[row].append(output)
+            for row in rows:
+                next_frame[row] += 1
+            if 1 not in rows:
+                diff = differing_keys(before, pipeline.row_state(1))
+                if diff:
+                    print(f"✗ Paused row: state of row 1 changed at step {step}: {diff}")
+                    paused_ok = False
+        if paused_ok:
+            print(f"✓ Paused row: state of row 1 bit-identical over the {len(PAUSED_STEPS)} steps without it")
+        ok &= paused_ok
+        ok &= compare_outputs("Row 0 stepped with row 1", outputs[0], alone[0])
+        ok &= compare_outputs(f"Row 1 stepped with row 0, paused {len(PAUSED_STEPS)} times", outputs[1], alone[1])
+
+        # A new session takes row 1: resetting it must not touch row 0, and make row 1 fresh.
+        # The convs only apply a reset at the next step of the row, so row 1 is compared to a
+        # fresh row stepped alongside, once it went through the decoder.
+        row_0 = pipeline.row_state(0)
+        pipeline.reset(torch.tensor([False, True]))
+        diff = differing_keys(row_0, pipeline.row_state(0))
+        outputs = []
+        for frame in inputs[2]:
+            output = pipeline.step({1: frame})
+            if not outputs:
+                fresh.step({1: frame})
+                fresh_diff = differing_keys(fresh.row_state(1), pipeline.row_state(1))
+            if 1 in output:
+                outputs.append(output[1])
+        if diff or fresh_diff:
+            print(f"✗ Reset: row 0 changed in {diff}, reset row 1 differs from a fresh row in {fresh_diff}")
+            ok = False
+        else:
+            print("✓ Reset of row 1: row 0 bit-identical, row 1 identical to a fresh row")
+        ok &= compare_outputs("New session on the reset row 1", outputs, alone[2])
+
+    print("\n" + "=" * 60)
+    print("✓ ROW ISOLATION TEST PASSED" if ok else "✗ ROW ISOLATION TEST FAILED")
+    print("=" * 60)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Check the multi-process mode of the bridge: worker health and rolling restarts.
+
+Runs `exotel_bridge.py` with BRIDGE_WORKERS=2 on a free local port, and follows the
+workers in BRIDGE_METRICS_FILE. The supervisor must replace a worker that is killed
+and one that is stopped (SIGSTOP, so it stops reporting), and on SIGHUP replace all
+the workers with the port accepting WebSocket connections throughout, each new worker
+listening before the old one stops accepting, and the calls taken by the old workers
+while draining counted in the totals. SIGTERM must stop everything.
+"""
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+try:
+    import websockets
+except ImportError:
+    print("ERROR: Missing dependencies. Install: pip install -r requirements.txt")
+    sys.exit(1)
+
+BRIDGE = Path(__file__).resolve().parent.parent / "exotel_bridge.py"
+HEALTH_TIMEOUT = 2.0
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Supervisor:
+    """exotel_bridge.py in multi-process mode, with its metrics and log."""
+
+    def __init__(self, workdir: str):
+        self.port = free_port()
+        self.metrics_file = os.path.join(workdir, "metrics.json")
+        self.log_file = os.path.join(workdir, "bridge.log")
+        self.proc = None
+
+    def start(self):
+        env = dict(
+            os.environ,
+            BRIDGE_WORKERS="2",
+            BRIDGE_HOST="127.0.0.1",
+            BRIDGE_PORT=str(self.port),
+            BRIDGE_WORKER_REPORT_SECS="0.2",
+            BRIDGE_WORKER_HEALTH_TIMEOUT=str(HEALTH_TIMEOUT),
+            BRIDGE_WORKER_DRAIN_SECS="5",
+            BRIDGE_METRICS_SECS="0.3",
+            BRIDGE_METRICS_FILE=self.metrics_file,
+            BRIDGE_LOG_LEVEL="INFO",
+            ENGINE_URLS=f"ws://127.0.0.1:{free_port()}/api/chat",  # No engine: the probes only open the bridge socket
+        )
+        with open(self.log_file, "w") as log:
+            self.proc = subprocess.Popen([sys.executable, str(BRIDGE)], env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    def metrics(self) -> dict:
+        try:
+            with open(self.metrics_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def pids(self) -> dict:
+        """worker id -> pid of the workers alive and reporting."""
+        return {
+            w['worker']: w['pid'] for w in self.metrics().get('workers', [])
+            if w['alive'] and w['report_age_s'] < 1.0
+        }
+
+    def log_lines(self) -> list:
+        with open(self.log_file) as f:
+            return f.read().splitlines()
+
+
+async def wait_for(condition, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = condition()
+        if result:
+            return result
+        await asyncio.sleep(0.1)
+    return None
+
+
+async def probe(port: int) -> bool:
+    """Open a WebSocket to the bridge and close it."""
+    try:
+        async with websockets.connect(f"ws://127.0.0.1:{port}/", open_timeout=5):
+            return True
+    except Exception:
+        return False
+
+
+async def probe_loop(port: int, results: list, stop: asyncio.Event):
+    while not stop.is_set():
+        results.append(await probe(port))
+        await asyncio.sleep(0.01)
+
+
+def replaced(sup: Supervisor, before: dict, worker_ids):
+    """New pids of worker_ids once they are all replaced and reporting."""
+    pids = sup.pids()
+    if len(pids) == 2 and all(pids[w] != before[w] for w in worker_ids):
+        return pids
+    return None
+
+
+async def run(sup: Supervisor) -> bool:
+    pids = await wait_for(lambda: len(sup.pids()) == 2 and sup.pids(), 20.0)
+    if not pids or not await probe(sup.port):
+        print(f"✗ Start: workers {sup.pids()}, probe failed or workers not reporting")
+        return False
+    print(f"✓ Start: 2 workers reporting {pids}, port accepting")
+
+    os.kill(pids[0], signal.SIGKILL)
+    after_kill = await wait_for(lambda: replaced(sup, pids, [0]), 10.0)
+    if not after_kill or after_kill[1] != pids[1]:
+        print(f"✗ Killed worker: workers {sup.pids()}, expected worker 0 replaced and worker 1 kept")
+        return False
+    print(f"✓ Killed worker 0 (pid {pids[0]}): replaced by pid {after_kill[0]}")
+
+    os.kill(after_kill[1], signal.SIGSTOP)
+    start = time.monotonic()
+    after_stop = await wait_for(lambda: replaced(sup, after_kill, [1]), HEALTH_TIMEOUT + 10.0)
+    if not after_stop:
+        os.kill(after_kill[1], signal.SIGCONT)
+        print(f"✗ Stopped worker: workers {sup.pids()}, worker 1 not replaced")
+        return False
+    print(f"✓ Stopped worker 1 (pid {after_kill[1]}): replaced by pid {after_stop[1]} "
+          f"after {time.monotonic() - start:.1f}s (health timeout {HEALTH_TIMEOUT:.0f}s)")
+
+    settled = await wait_for(lambda: sup.metrics().get('retiring') == 0 and sup.metrics(), 10.0)
+    if not settled:
+        print(f"✗ Before the rolling restart: workers still retiring {sup.metrics().get('retiring')}")
+        return False
+    calls_before = settled['calls_total']
+    results, stop = [], asyncio.Event()
+    prober = asyncio.create_task(probe_loop(sup.port, results, stop))
+    await asyncio.sleep(0.5)
+    sup.proc.send_signal(signal.SIGHUP)
+    after_hup = await wait_for(lambda: replaced(sup, after_stop, [0, 1]), 30.0)
+    await asyncio.sleep(0.5)
+    stop.set()
+    await prober
+    if not after_hup:
+        print(f"✗ Rolling restart: workers {sup.pids()}, not all replaced")
+        return False
+    if not all(results):
+        print(f"✗ Rolling restart: {results.count(False)}/{len(results)} connections failed")
+        return False
+    lines = sup.log_lines()
+
+    def line_index(text: str) -> int:
+        return next((i for i, line in enumerate(lines) if text in line), -1)
+
+    for worker_id in (0, 1):
+        listening = line_index(f"WORKER_START: worker={worker_id} pid={after_hup[worker_id]} ")
+        draining = line_index(f"WORKER_DRAIN: worker={worker_id} pid={after_stop[worker_id]} ")
+        if listening < 0 or draining < 0 or listening > draining:
+            print(f"✗ Rolling restart: worker {worker_id}, old pid stopped accepting "
+                  f"before the new one listened (log lines {draining}, {listening})")
+            return False
+    print(f"✓ Rolling restart: workers {after_stop} -> {after_hup}, new ones listening first, "
+          f"{len(results)} connections during the restart all accepted")
+
+    def calls_counted():
+        m = sup.metrics()
+        return m.get('retiring') == 0 and m['calls_total'] - calls_before == len(results)
+
+    if not await wait_for(calls_counted, 15.0):
+        m = sup.metrics()
+        print(f"✗ Rolling restart: {m.get('calls_total', 0) - calls_before} calls counted for "
+              f"{len(results)} connections, {m.get('retiring')} workers retiring")
+        return False
+    print(f"✓ Rolling restart: all the {len(results)} calls counted once the old workers exited")
+
+    sup.proc.send_signal(signal.SIGTERM)
+    try:
+        code = sup.proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        print("✗ Stop: supervisor still running after SIGTERM")
+        return False
+    leftover = [pid for pid in after_hup.values() if os.path.exists(f"/proc/{pid}")]
+    if code != 0 or leftover:
+        print(f"✗ Stop: exit code {code}, workers left {leftover}")
+        return False
+    print("✓ Stop: supervisor and workers exited on SIGTERM")
+    return True
+
+
+def main() -> int:
+    print("=" * 60)
+    print("Bridge Supervisor Test")
+    print("=" * 60)
+    with tempfile.TemporaryDirectory() as workdir:
+        sup = Supervisor(workdir)
+        sup.start()
+        try:
+            ok = asyncio.run(run(sup))
+        finally:
+            if sup.proc.poll() is None:
+                sup.proc.kill()
+                sup.proc.wait()
+        if not ok:
+            print(f"\nBridge log ({sup.log_file}), last lines:")
+            print("\n".join(sup.log_lines()[-30:]))
+    print("\n" + "=" * 60)
+    print("✓ SUPERVISOR TEST PASSED" if ok else "✗ SUPERVISOR TEST FAILED")
+    print("=" * 60)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Check the capacity-aware routing of the bridge across several engines.
+
+Starts local stand-in engines: each one answers /api/chat with the 0x00 handshake
+and holds the session, and reports its batch size and active sessions on
+/api/status, like moshi.server. One of them has no /api/status and is balanced on
+the sessions of the bridge against BRIDGE_ENGINE_CAPACITY. The `EngineBalancer` of
+the bridge must route each session to the engine with the most free slots, fail
+fast when they are all full, wait for a free slot when a queue time is set, and
+skip an engine that went down.
+"""
+import asyncio
+import json
+import os
+import sys
+from http import HTTPStatus
+from pathlib import Path
+
+try:
+    import websockets
+    os.environ.setdefault("BRIDGE_LOG_LEVEL", "WARNING")
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    import exotel_bridge
+    from exotel_bridge import EngineBalancer, open_engine_session
+except ImportError:
+    print("ERROR: Missing dependencies. Install: pip install -r requirements.txt")
+    sys.exit(1)
+
+POLL_SECS = 0.1
+
+
+class StandInEngine:
+    """Engine with batch_size slots, without the model."""
+
+    def __init__(self, batch_size: int, has_status: bool = True):
+        self.batch_size = batch_size
+        self.has_status = has_status
+        self.sessions = set()
+        self.server = None
+        self.url = None
+
+    async def start(self):
+        self.server = await websockets.serve(self.chat, "127.0.0.1", 0, process_request=self.process_request)
+        port = self.server.sockets[0].getsockname()[1]
+        self.url = f"ws://127.0.0.1:{port}/api/chat"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def process_request(self, path, request_headers):
+        if not path.startswith("/api/status"):
+            return None
+        if not self.has_status:
+            return HTTPStatus.NOT_FOUND, [], b"Not Found"
+        status = {
+            "batch_size": self.batch_size,
+            "free_slots": max(0, self.batch_size - len(self.sessions)),
+            "active_sessions": min(self.batch_size, len(self.sessions)),
+            "waiting_sessions": max(0, len(self.sessions) - self.batch_size),
+        }
+        return HTTPStatus.OK, [("Content-Type", "application/json")], json.dumps(status).encode()
+
+    async def chat(self, ws, path=None):
+        self.sessions.add(ws)
+        try:
+            await ws.send(b"\x00")
+            await ws.wait_closed()
+        finally:
+            self.sessions.discard(ws)
+
+
+async def open_session(balancer: EngineBalancer, timeout: float = 0.0):
+    backend = await balancer.acquire(timeout=timeout)
+    if backend is None:
+        return None
+    ws = await open_engine_session(backend.ws_url, timeout=5.0)
+    return ws, backend
+
+
+async def close_session(balancer: EngineBalancer, session):
+    ws, backend = session
+    await ws.close()
+    balancer.release(backend)
+
+
+async def run() -> bool:
+    exotel_bridge.BRIDGE_ENGINE_STATUS_SECS = POLL_SECS
+    exotel_bridge.BRIDGE_ENGINE_CAPACITY = 1
+    small, large, legacy = StandInEngine(2), StandInEngine(4), StandInEngine(8, has_status=False)
+    engines = [small, large, legacy]
+    for engine in engines:
+        await engine.start()
+    names = {small.url: "small", large.url: "large", legacy.url: "no-status"}
+    balancer = EngineBalancer([engine.url for engine in engines])
+    balancer.start()
+    await asyncio.sleep(3 * POLL_SECS)
+    ok = True
+    sessions = []
+    try:
+        # 2 + 4 slots reported, 1 assumed for the engine without /api/status
+        for _ in range(7):
+            session = await open_session(balancer)
+            if session is None:
+                print(f"✗ Routing: no engine for session {len(sessions)} ({balancer.describe()})")
+                return False
+            sessions.append(session)
+        await asyncio.sleep(3 * POLL_SECS)
+        counts = {name: sum(names[b.url] == name for _, b in sessions) for name in names.values()}
+        if counts != {"small": 2, "large": 4, "no-status": 1}:
+            print(f"✗ Routing: sessions per engine {counts}")
+            ok = False
+        elif [len(e.sessions) for e in engines] != [2, 4, 1]:
+            print(f"✗ Routing: engines report {[len(e.sessions) for e in engines]} sessions")
+            ok = False
+        else:
+            print(f"✓ Least loaded routing: {counts}")
+
+        if await balancer.acquire(timeout=0) is not None:
+            print("✗ Fail fast: got an engine while they are all full")
+            ok = False
+        else:
+            print("✓ Fail fast when all the engines are full")
+
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.3, lambda: asyncio.ensure_future(close_session(balancer, sessions.pop(0))))
+        start = loop.time()
+        queued = await open_session(balancer, timeout=2.0)
+        waited = loop.time() - start
+        if queued is None or names[queued[1].url] != "large" or not 0.25 < waited < 1.5:
+            print(f"✗ Queue wait: got {queued and names[queued[1].url]} after {waited:.2f}s")
+            ok = False
+        else:
+            print(f"✓ Queued session routed to the freed slot after {waited:.2f}s")
+            sessions.append(queued)
+
+        # Take the large engine down, its sessions go with it
+        for ws, backend in [s for s in sessions if s[1].url == large.url]:
+            await close_session(balancer, (ws, backend))
+            sessions.remove((ws, backend))
+        await large.stop()
+        await asyncio.sleep(5 * POLL_SECS)
+        backend = balancer.pick()
+        if backend is not None:
+            print(f"✗ Engine down: routed to {names[backend.url]} ({balancer.describe()})")
+            ok = False
+        session = sessions.pop(0)
+        await close_session(balancer, session)
+        await asyncio.sleep(3 * POLL_SECS)
+        backend = balancer.pick()
+        if backend is None or backend.url != session[1].url:
+            print(f"✗ Engine down: expected {names[session[1].url]}, got {backend and names[backend.url]}")
+            ok = False
+        elif ok:
+            print(f"✓ Engine down skipped, routed to {names[backend.url]}")
+    finally:
+        for ws, backend in sessions:
+            await close_session(balancer, (ws, backend))
+        await balancer.stop()
+        for engine in (small, legacy):
+            await engine.stop()
+    return ok
+
+
+def main() -> int:
+    print("=" * 60)
+    print("Engine Load Balancing Test")
+    print("=" * 60)
+    ok = asyncio.run(run())
+    print("\n" + "=" * 60)
+    if not ok:
+        print("✗ LOAD BALANCING TEST FAILED")
+        print("=" * 60)
+        return 1
+    print("✓ LOAD BALANCING TEST PASSED")
+    print("=" * 60)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Check that skipping the depformer on fully forced steps doesn't change generation.
+
+Runs the system prompts phases on a small randomly initialized LM with and without
+`LMGen.skip_forced_steps`, asserts the streaming states are identical, then
+generates from the same seed and asserts the tokens match one for one.
+"""
+import copy
+import sys
+import time
+
+try:
+    import torch
+    from moshi.models import loaders, LMModel, LMGen
+except ImportError:
+    print("ERROR: Missing dependencies. Install: pip install moshi/.")
+    sys.exit(1)
+
+PROMPT_STEPS = 24
+LIVE_STEPS = 24
+
+
+def small_lm() -> LMModel:
+    lm_kwargs = dict(loaders._lm_kwargs, dim=64, text_card=100, num_heads=4, num_layers=2, context=64,
+                     depformer_dim=32, depformer_dim_feedforward=64, depformer_num_heads=2,
+                     depformer_num_layers=2)
+    lm = LMModel(device="cpu", dtype=torch.float32, **lm_kwargs)
+    lm.eval()
+    return lm
+
+
+def run(lm: LMModel, skip_forced_steps: bool, use_sampling: bool):
+    lm_gen = LMGen(lm, device="cpu", use_sampling=use_sampling, skip_forced_steps=skip_forced_steps)
+    lm_gen.streaming_forever(1)
+    rng = torch.Generator().manual_seed(1)
+    card = lm.card
+    num_tokens = lm.num_codebooks - 9  # audio codebooks per stream
+
+    # System prompts like phases: all the streams are given.
+    start = time.perf_counter()
+    for step in range(PROMPT_STEPS):
+        lm_gen.step(
+            moshi_tokens=torch.randint(card, (1, num_tokens, 1), generator=rng),
+            text_token=torch.randint(lm.text_card, (1,), generator=rng) if step % 2 else lm_gen.zero_text_code,
+            input_tokens=torch.randint(card, (1, num_tokens, 1), generator=rng),
+        )
+    prompt_time = time.perf_counter() - start
+    state = lm_gen.get_streaming_state_rows(torch.ones(1, dtype=torch.bool))
+
+    # Live phase: only the user stream is given.
+    torch.manual_seed(1234)
+    tokens = []
+    for _ in range(LIVE_STEPS):
+        out = lm_gen.step(torch.randint(card, (1, num_tokens, 1), generator=rng))
+        if out is not None:
+            tokens.append(out)
+    return state, torch.cat(tokens, dim=-1), prompt_time
+
+
+def main() -> int:
+    print("=" * 60)
+    print("Forced Step Fast Path Equivalence Test")
+    print("=" * 60)
+    torch.manual_seed(0)
+    lm = small_lm()
+    with torch.no_grad():
+        for use_sampling in [False, True]:
+            ref_state, ref_tokens, ref_time = run(copy.deepcopy(lm), False, use_sampling)
+            state, tokens, fast_time = run(copy.deepcopy(lm), True, use_sampling)
+            mode = "sampling" if use_sampling else "greedy"
+            for key, value in ref_state.items():
+                if key.endswith("forced_steps"):
+                    continue
+                if not torch.equal(value, state[key]):
+                    print(f"✗ [{mode}] streaming state {key} differs after the prompts")
+                    return 1
+            print(f"✓ [{mode}] streaming state identical after {PROMPT_STEPS} forced steps")
+            if not torch.equal(tokens, ref_tokens):
+                print(f"✗ [{mode}] generated tokens differ")
+                return 1
+            print(f"✓ [{mode}] {tokens.shape[-1]} generated frames identical")
+            print(f"  prompt steps: {1000 * ref_time / PROMPT_STEPS:.2f} ms -> "
+                  f"{1000 * fast_time / PROMPT_STEPS:.2f} ms per step")
+
+    print("\n" + "=" * 60)
+    print("✓ EQUIVALENCE TEST PASSED")
+    print("=" * 60)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Check the inbound jitter buffer of the bridge, between Exotel and the engine.
+
+Drives `InboundJitterBuffer` with a simulated 20 ms clock and Exotel media events
+carrying a timestamp, a chunk number or nothing, arriving with jitter, out of
+order, with lost frames and after a network stall. The engine input must be exactly
+one 320-byte frame per tick, the audio in stream order, lost frames replaced by
+silence of the same duration, and the drift and gap statistics must match what was
+simulated.
+"""
+import os
+import sys
+from pathlib import Path
+
+try:
+    import numpy as np
+    os.environ.setdefault("BRIDGE_LOG_LEVEL", "WARNING")
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from exotel_bridge import InboundJitterBuffer, media_position
+except ImportError:
+    print("ERROR: Missing dependencies. Install: pip install -r requirements.txt")
+    sys.exit(1)
+
+FRAME_BYTES = 320
+TICK_MS = 20
+
+
+def audio(seconds: float) -> bytes:
+    """Non-silent ramp, so the order of the samples can be checked."""
+    return (1000 + np.arange(int(seconds * 8000)) % 1000).astype(np.int16).tobytes()
+
+
+def media_event(index: int, chunk_ms: int, fields: str) -> dict:
+    media = {"payload": "..."}
+    if fields == "timestamp":
+        media["timestamp"] = str(index * chunk_ms)
+    elif fields == "chunk":
+        media["chunk"] = index + 1
+    return {"event": "media", "sequence_number": str(index + 2) if fields == "sequence" else None, "media": media}
+
+
+def simulate(buffer: InboundJitterBuffer, events: list, duration_ms: int) -> list:
+    """events: (arrival_ms, pcm, event). Pops a frame every tick, returns the frames."""
+    events = sorted(events, key=lambda e: e[0])
+    frames = []
+    for now in range(0, duration_ms, TICK_MS):
+        while events and events[0][0] <= now:
+            arrival, pcm, event = events.pop(0)
+            buffer.push(pcm, media_position(event), arrival / 1000)
+        frame = buffer.pop_frame()
+        if frame is not None:
+            frames.append(frame)
+    return frames
+
+
+def split(pcm: bytes, chunk_ms: int, fields: str) -> list:
+    size = 16 * chunk_ms
+    return [(i * chunk_ms, pcm[i * size:(i + 1) * size], media_event(i, chunk_ms, fields))
+            for i in range(len(pcm) // size)]
+
+
+def speech(frames: list) -> bytes:
+    return b"".join(f for f in frames if any(f))
+
+
+def check_reorder() -> bool:
+    ok = True
+    rng = np.random.default_rng(0)
+    for fields, chunk_ms in [("timestamp", 20), ("chunk", 100), ("sequence", 20), (None, 20)]:
+        buffer = InboundJitterBuffer(latency_ms=60)
+        pcm = audio(5.0)
+        events = split(pcm, chunk_ms, fields)
+        jitter = 0 if fields is None else 40  # Without a position, the arrival order is the stream order
+        events = [(t + int(rng.uniform(0, jitter)), p, e) for t, p, e in events]
+        frames = simulate(buffer, events, 5500)
+        sizes = {len(f) for f in frames}
+        c = buffer.counters
+        if sizes != {FRAME_BYTES} or speech(frames) != pcm or c['inbound_lost_frames'] or c['inbound_late_frames']:
+            print(f"✗ {fields or 'no position'}: sizes={sizes} in_order={speech(frames) == pcm} "
+                  f"lost={c['inbound_lost_frames']} late={c['inbound_late_frames']}")
+            ok = False
+        else:
+            print(f"✓ {fields or 'no position'} ({chunk_ms} ms chunks): {len(frames)} frames in order, "
+                  f"reordered={c['inbound_reordered_frames']} jitter={buffer.jitter_ms():.0f}ms")
+    return ok
+
+
+def check_loss() -> bool:
+    buffer = InboundJitterBuffer(latency_ms=60)
+    pcm = audio(2.0)
+    events = split(pcm, 20, "timestamp")
+    lost = {30, 31, 60}
+    frames = simulate(buffer, [e for i, e in enumerate(events) if i not in lost], 2500)
+    expected = b"".join(bytes(FRAME_BYTES) if i in lost else e[1] for i, e in enumerate(events))
+    played = b"".join(frames).lstrip(b"\x00")[:len(expected) - 2 * FRAME_BYTES]
+    if buffer.counters['inbound_lost_frames'] != len(lost) or not expected.lstrip(b"\x00").startswith(played):
+        print(f"✗ Loss: lost={buffer.counters['inbound_lost_frames']}, expected {len(lost)}")
+        return False
+    print(f"✓ {len(lost)} lost frames replaced by silence, the stream timing is kept")
+    return True
+
+
+def check_stall() -> bool:
+    buffer = InboundJitterBuffer(latency_ms=60)
+    pcm = audio(3.0)
+    # Network stall of 300 ms at 1 s: the frames are delayed, then arrive in a burst
+    events = [(t + 300 if 1000 <= t < 1300 else t, p, e) for t, p, e in split(pcm, 20, "timestamp")]
+    events = [(max(t, 1300) if t >= 1000 else t, p, e) for t, p, e in events]
+    frames = simulate(buffer, events, 3000)
+    c = buffer.counters
+    if speech(frames) != pcm[:len(speech(frames))] or c['inbound_underrun_frames'] == 0 \
+            or not 250 <= buffer.jitter_ms() <= 320:
+        print(f"✗ Stall: underrun={c['inbound_underrun_frames']} jitter={buffer.jitter_ms():.0f}ms")
+        return False
+    print(f"✓ 300 ms stall: {c['inbound_underrun_frames']} silence frames, no audio lost, "
+          f"max drift {buffer.max_drift_ms:.0f}ms")
+    return True
+
+
+def check_overrun_and_close() -> bool:
+    buffer = InboundJitterBuffer(latency_ms=60, max_ms=500)
+    pcm = audio(2.0)
+    for t, p, e in split(pcm, 20, "timestamp"):
+        buffer.push(p, media_position(e), 0.0)
+    depth = buffer.depth_ms()
+    if depth > 500 or buffer.counters['inbound_dropped_frames'] == 0:
+        print(f"✗ Overrun: depth {buffer.depth_ms()}ms dropped={buffer.counters['inbound_dropped_frames']}")
+        return False
+    buffer.close(bytes(8000))  # 500 ms tail
+    frames = []
+    while not buffer.finished():
+        frames.append(buffer.pop_frame())
+    if len(frames) != (depth + 500) // TICK_MS:
+        print(f"✗ Close: {len(frames)} frames until finished")
+        return False
+    print(f"✓ Burst of 2 s kept under 500 ms ({buffer.counters['inbound_dropped_frames']} frames dropped), "
+          f"{depth} ms and the tail played, then finished")
+    return True
+
+
+def main() -> int:
+    print("=" * 60)
+    print("Inbound Jitter Buffer Test")
+    print("=" * 60)
+    ok = check_reorder()
+    ok &= check_loss()
+    ok &= check_stall()
+    ok &= check_overrun_and_close()
+    print("\n" + "=" * 60)
+    if not ok:
+        print("✗ INBOUND JITTER BUFFER TEST FAILED")
+        print("=" * 60)
+        return 1
+    print("✓ INBOUND JITTER BUFFER TEST PASSED")
+    print("=" * 60)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Check the latency measurements of the bridge.
+
+`LatencyHistogram` percentiles must stay within a bucket of the exact percentiles and
+histograms must add up; the arrival times carried by `InboundJitterBuffer` and
+`PlayoutBuffer` must date each 20 ms frame from the chunk its audio came in; and
+`ResponseLatencyTracker` must measure the time from the last caller speech frame to
+the first agent speech frame, without counting agent speech over the caller.
+"""
+import os
+import sys
+from pathlib import Path
+
+try:
+    import numpy as np
+    os.environ.setdefault("BRIDGE_LOG_LEVEL", "WARNING")
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from exotel_bridge import (
+        LATENCY_BUCKETS_MS, InboundJitterBuffer, LatencyHistogram, PlayoutBuffer, ResponseLatencyTracker,
+        latency_metrics,
+    )
+except ImportError:
+    print("ERROR: Missing dependencies. Install: pip install -r requirements.txt")
+    sys.exit(1)
+
+FRAME_BYTES = 320
+TICK_MS = 20
+
+
+def speech(ms: int) -> bytes:
+    return (3000 * np.sin(np.arange(8 * ms) / 5)).astype(np.int16).tobytes()
+
+
+def bucket_width(value: float) -> float:
+    i = np.searchsorted(LATENCY_BUCKETS_MS, value)
+    lo = LATENCY_BUCKETS_MS[i - 1] if i > 0 else 0
+    hi = LATENCY_BUCKETS_MS[min(i, len(LATENCY_BUCKETS_MS) - 1)]
+    return hi - lo
+
+
+def check_histogram() -> bool:
+    rng = np.random.default_rng(0)
+    samples = rng.lognormal(np.log(150), 0.6, 5000)
+    halves = LatencyHistogram(), LatencyHistogram()
+    for i, ms in enumerate(samples):
+        halves[i % 2].add(ms)
+    h = LatencyHistogram.from_dict(halves[0].to_dict())
+    h.merge(halves[1])
+    if h.count != len(samples) or abs(h.total_ms - samples.sum()) > 1e-6 or h.max_ms != samples.max():
+        print(f"✗ Merge: count={h.count} max={h.max_ms:.1f}")
+        return False
+    for p in (50, 90, 99):
+        exact = np.percentile(samples, p)
+        if abs(h.percentile(p) - exact) > bucket_width(exact):
+            print(f"✗ p{p}: {h.percentile(p):.1f}ms, exact {exact:.1f}ms")
+            return False
+    summary = latency_metrics({'response': h})['response']
+    if summary['count'] != len(samples) or len(summary['counts']) != len(LATENCY_BUCKETS_MS) + 1:
+        print(f"✗ Metrics: {summary}")
+        return False
+    print(f"✓ Histogram: p50/p90/p99 {summary['p50_ms']}/{summary['p90_ms']}/{summary['p99_ms']}ms "
+          f"(exact {np.percentile(samples, 50):.1f}/{np.percentile(samples, 90):.1f}/"
+          f"{np.percentile(samples, 99):.1f}ms), merged halves add up")
+    if LatencyHistogram().percentile(50) != 0.0:
+        print("✗ Empty histogram")
+        return False
+    return True
+
+
+def check_inbound_arrivals() -> bool:
+    buffer = InboundJitterBuffer(latency_ms=60)
+    # 100 ms chunks arriving every 100 ms, played on the 20 ms clock
+    for i in range(5):
+        buffer.push(speech(100), ("timestamp", 100 * i), i * 0.1)
+    arrivals = []
+    while buffer.depth_ms() > 0:
+        buffer.pop_frame()
+        arrivals.append(buffer.frame_arrival)
+    expected = [(i // 5) * 0.1 for i in range(25)]
+    if arrivals != expected:
+        print(f"✗ Inbound: frame arrivals {arrivals[:8]}...")
+        return False
+    buffer.pop_frame()
+    if buffer.frame_arrival is not None:
+        print("✗ Inbound: silence frame has an arrival time")
+        return False
+    print("✓ Inbound frames dated from the Exotel chunk they arrived in, silence not dated")
+    return True
+
+
+def check_playout_arrivals() -> bool:
+    playout = PlayoutBuffer(target_ms=40, max_ms=400)
+    # Uneven writes: 80 ms at t=1, 30 ms at t=2, 50 ms at t=3
+    for ms, arrival in [(80, 1.0), (30, 2.0), (50, 3.0)]:
+        playout.write(speech(ms), arrival)
+    arrivals = []
+    while playout.depth_frames():
+        playout.pop_frame()
+        arrivals.append(playout.frame_arrival)
+    # Each frame is dated from the write its first byte came in
+    expected = [1.0, 1.0, 1.0, 1.0, 2.0, 2.0, 3.0, 3.0]
+    if arrivals != expected:
+        print(f"✗ Playout: frame arrivals {arrivals}")
+        return False
+
+    playout = PlayoutBuffer(target_ms=40, max_ms=100)
+    playout.write(speech(100), 1.0)
+    playout.pop_frame()
+    playout.write(speech(200), 2.0)  # Trimmed back to the target, the oldest audio goes
+    playout.pop_frame()
+    if playout.frame_arrival != 2.0:
+        print(f"✗ Playout: after a trim, frame dated {playout.frame_arrival}")
+        return False
+    print("✓ Playout frames dated from the engine write they came in, after trims too")
+    return True
+
+
+def run_call(tracker: ResponseLatencyTracker, caller: list, agent: list, duration_ms: int) -> list:
+    """caller, agent: (start_ms, end_ms) of speech. Agent frames are sent at the tick time."""
+    latencies = []
+    for now in range(0, duration_ms, TICK_MS):
+        caller_speaks = any(a <= now < b for a, b in caller)
+        tracker.caller_frame(speech(TICK_MS) if caller_speaks else bytes(FRAME_BYTES), now / 1000)
+        agent_speaks = any(a <= now < b for a, b in agent)
+        ms = tracker.agent_frame(speech(TICK_MS) if agent_speaks else bytes(FRAME_BYTES), now / 1000)
+        if ms is not None:
+            latencies.append(round(ms))
+    return latencies
+
+
+def check_response() -> bool:
+    # Two turns answered after 600 ms and 400 ms of silence, the last caller speech frame starts
+    # 20 ms before the end of the speech
+    latencies = run_call(ResponseLatencyTracker(), caller=[(0, 1500), (3000, 4000)],
+                         agent=[(2100, 2800), (4400, 5000)], duration_ms=6000)
+    if latencies != [620, 420]:
+        print(f"✗ Response: latencies {latencies}, expected [620, 420]")
+        return False
+    # Agent backchannel while the caller talks, then the answer: only the answer counts
+    latencies = run_call(ResponseLatencyTracker(), caller=[(0, 2000)],
+                         agent=[(1000, 1100), (2500, 3000)], duration_ms=4000)
+    if latencies != [520]:
+        print(f"✗ Overlap: latencies {latencies}, expected [520]")
+        return False
+    # Agent speaking on its own, without caller speech: no response
+    latencies = run_call(ResponseLatencyTracker(), caller=[], agent=[(0, 1000)], duration_ms=2000)
+    if latencies:
+        print(f"✗ No caller speech: latencies {latencies}")
+        return False
+    print("✓ Response latency from the end of the caller speech, backchannels and agent-only speech not counted")
+    return True
+
+
+def main() -> int:
+    print("=" * 60)
+    print("Latency Metrics Test")
+    print("=" * 60)
+    ok = check_histogram()
+    ok &= check_inbound_arrivals()
+    ok &= check_playout_arrivals()
+    ok &= check_response()
+    print("\n" + "=" * 60)
+    if not ok:
+        print("✗ LATENCY METRICS TEST FAILED")
+        print("=" * 60)
+        return 1
+    print("✓ LATENCY METRICS TEST PASSED")
+    print("=" * 60)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
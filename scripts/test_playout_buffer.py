@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Check the outbound playout jitter buffer of the bridge.
+
+Drives `PlayoutBuffer` with a simulated 20 ms clock and engine audio arriving in
+80 ms bursts of uneven sizes (odd byte counts included) with random jitter, then
+with a stalled engine, a burst of late audio and a long call. Every frame played
+must be exactly 320 bytes, the audio must come out in order, underruns must be
+filled with silence and raise the target depth, overruns must be trimmed back to
+the target, and the target must come back down after a quiet period.
+"""
+import os
+import sys
+from pathlib import Path
+
+try:
+    import numpy as np
+    os.environ.setdefault("BRIDGE_LOG_LEVEL", "WARNING")
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from exotel_bridge import PlayoutBuffer
+except ImportError:
+    print("ERROR: Missing dependencies. Install: pip install -r requirements.txt")
+    sys.exit(1)
+
+FRAME_BYTES = 320
+TICK_MS = 20
+BURST_MS = 80  # One engine step
+
+
+def audio(seconds: float, level: int = 5000) -> bytes:
+    """Non-silent ramp, so the order of the samples can be checked."""
+    n = int(seconds * 8000)
+    return (level + np.arange(n) % 1000).astype(np.int16).tobytes()
+
+
+def simulate(playout: PlayoutBuffer, pcm: bytes, arrivals_ms: list, duration_ms: int) -> list:
+    """Write pcm in len(arrivals_ms) uneven bursts at the given times, pop a frame every tick."""
+    rng = np.random.default_rng(1)
+    cuts = np.round(np.linspace(0, len(pcm), len(arrivals_ms) + 1)).astype(int)
+    cuts[1:-1] += rng.integers(-3, 4, size=len(cuts) - 2)  # Odd sized bursts
+    bursts = sorted(zip(arrivals_ms, [pcm[a:b] for a, b in zip(cuts[:-1], cuts[1:])]))
+    frames = []
+    for now in range(0, duration_ms, TICK_MS):
+        while bursts and bursts[0][0] <= now:
+            playout.write(bursts.pop(0)[1])
+        frames.append(playout.pop_frame())
+    return frames
+
+
+def played_audio(frames: list) -> bytes:
+    return b"".join(f for f in frames if f is not None and any(f))
+
+
+def check_steady() -> bool:
+    playout = PlayoutBuffer(target_ms=120)
+    seconds = 10.0
+    pcm = audio(seconds)
+    rng = np.random.default_rng(0)
+    steps = int(seconds * 1000 / BURST_MS)
+    arrivals = [int(i * BURST_MS + rng.uniform(0, 30)) for i in range(steps)]
+    frames = simulate(playout, pcm, arrivals, int(seconds * 1000) + 500)
+    sizes = {len(f) for f in frames if f is not None}
+    out = played_audio(frames)
+    if sizes != {FRAME_BYTES}:
+        print(f"✗ Steady: frame sizes {sizes}")
+        return False
+    if not pcm.startswith(out) or len(pcm) - len(out) >= FRAME_BYTES:
+        print(f"✗ Steady: played {len(out)}b of {len(pcm)}b, out of order or lost")
+        return False
+    if playout.counters['playout_underruns'] != 1:  # Only the end of the audio
+        print(f"✗ Steady: {playout.counters['playout_underruns']} underruns with 30 ms jitter")
+        return False
+    print(f"✓ Steady 80 ms bursts with 30 ms jitter: {len(out) // FRAME_BYTES} frames of 320b in order, no underrun")
+    return True
+
+
+def check_underrun() -> bool:
+    playout = PlayoutBuffer(target_ms=80)
+    pcm = audio(2.0)
+    arrivals = [i * BURST_MS for i in range(10)] + [1200 + i * BURST_MS for i in range(15)]
+    frames = simulate(playout, pcm, arrivals, 2500)
+    silent = sum(1 for f in frames[:60] if f is not None and not any(f))
+    if playout.counters['playout_underruns'] < 1 or silent == 0 or playout.target_ms() <= 80:
+        print(f"✗ Underrun: underruns={playout.counters['playout_underruns']} silent={silent} "
+              f"target={playout.target_ms()}ms")
+        return False
+    if not pcm.startswith(played_audio(frames)):
+        print("✗ Underrun: audio out of order")
+        return False
+    print(f"✓ Engine stall: {playout.counters['playout_underruns']} underruns, {silent} silence frames, "
+          f"target raised to {playout.target_ms()}ms")
+    return True
+
+
+def check_overrun() -> bool:
+    playout = PlayoutBuffer(target_ms=120, max_ms=400)
+    playout.write(audio(0.2))
+    playout.pop_frame()
+    playout.write(audio(1.0))
+    if playout.depth_ms() != playout.target_ms() or playout.counters['playout_trimmed_frames'] == 0:
+        print(f"✗ Overrun: depth {playout.depth_ms()}ms, trimmed {playout.counters['playout_trimmed_frames']}")
+        return False
+    print(f"✓ Overrun: trimmed {playout.counters['playout_trimmed_frames']} frames back to {playout.depth_ms()}ms")
+
+    playout = PlayoutBuffer(target_ms=120, max_ms=400)
+    playout.write(audio(0.1) + bytes(FRAME_BYTES * 10) + audio(0.1))
+    for _ in range(15):
+        playout.pop_frame()
+    compressed = playout.counters['playout_compressed_frames']
+    if compressed == 0 or playout.counters['playout_trimmed_frames'] != 0:
+        print(f"✗ Catch-up: compressed {compressed} silent frames")
+        return False
+    print(f"✓ Catch-up: skipped {compressed} silent frames above twice the target")
+    return True
+
+
+def check_adaptation() -> bool:
+    playout = PlayoutBuffer(target_ms=200, min_ms=80, quiet_secs=2.0)
+    seconds = 10.0
+    pcm = audio(seconds)
+    arrivals = [i * BURST_MS for i in range(int(seconds * 1000 / BURST_MS))]
+    simulate(playout, pcm, arrivals, int(seconds * 1000))
+    if playout.target_ms() >= 200:
+        print(f"✗ Adaptation: target stayed at {playout.target_ms()}ms")
+        return False
+    print(f"✓ Target lowered from 200ms to {playout.target_ms()}ms after quiet periods")
+    return True
+
+
+def main() -> int:
+    print("=" * 60)
+    print("Playout Jitter Buffer Test")
+    print("=" * 60)
+    ok = check_steady()
+    ok &= check_underrun()
+    ok &= check_overrun()
+    ok &= check_adaptation()
+    print("\n" + "=" * 60)
+    if not ok:
+        print("✗ PLAYOUT TEST FAILED")
+        print("=" * 60)
+        return 1
+    print("✓ PLAYOUT TEST PASSED")
+    print("=" * 60)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
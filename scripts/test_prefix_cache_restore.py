@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Check that a system prompts snapshot restored into another slot behaves as a replayed prefill.
+
+Runs the system prompts (silence, a text prompt longer than the attention context,
+silence) of a persona on slot 0 of a small randomly initialized LM with a batch of 3,
+and stores the state of that slot in a `PrefixCache`, as the server does. Slot 2, left
+with the stale state of another session, gets the snapshot restored with
+`set_streaming_state_rows`, and slot 1 replays the same system prompts. The streaming
+state of the restored and replayed slots must be identical, and stay identical with
+the same greedy tokens over the live steps that follow, all the slots stepped together.
+"""
+import sys
+
+try:
+    import torch
+    from moshi.models import loaders, LMModel, LMGen
+    from moshi.utils.prefix_cache import PrefixCache
+except ImportError:
+    print("ERROR: Missing dependencies. Install: pip install moshi/.")
+    sys.exit(1)
+
+CONTEXT = 64
+TEXT_PROMPT_TOKENS = 70  # With the silences, longer than the context: the KV caches wrap around.
+LIVE_STEPS = 24
+BATCH_SIZE = 3
+REPLAYED, RESTORED = 1, 2
+
+
+def small_lm() -> LMModel:
+    lm_kwargs = dict(loaders._lm_kwargs, dim=64, text_card=100, num_heads=4, num_layers=2, context=CONTEXT,
+                     depformer_dim=32, depformer_dim_feedforward=64, depformer_num_heads=2,
+                     depformer_num_layers=2)
+    lm = LMModel(device="cpu", dtype=torch.float32, **lm_kwargs)
+    lm.eval()
+    return lm
+
+
+def slot_mask(slot: int) -> torch.Tensor:
+    mask = torch.zeros(BATCH_SIZE, dtype=torch.bool)
+    mask[slot] = True
+    return mask
+
+
+def prefill(lm_gen: LMGen, slot: int):
+    """Run the system prompts on `slot` only, as the server does for a joining session."""
+    mask = slot_mask(slot)
+    lm_gen.set_exec_mask(mask)
+    lm_gen.reset_streaming(mask)
+    for _ in lm_gen.iter_system_prompts(None):
+        pass
+
+
+def slot_state(lm_gen: LMGen, slot: int) -> dict:
+    state = lm_gen.get_streaming_state_rows(slot_mask(slot))
+    # Which slots are stepped is set by the caller at each step, it is not part of the session.
+    return {key: value for key, value in state.items() if not key.endswith("exec_mask")}
+
+
+def compare_states(expected: dict, state: dict) -> list:
+    """Keys of the states that differ."""
+    if expected.keys() != state.keys():
+        return sorted(expected.keys() ^ state.keys())
+    return [key for key, value in expected.items() if not torch.equal(value, state[key])]
+
+
+def main() -> int:
+    print("=" * 60)
+    print("Prefix Cache Restore Test")
+    print("=" * 60)
+    torch.manual_seed(0)
+    lm = small_lm()
+    rng = torch.Generator().manual_seed(1)
+    num_tokens = lm.num_codebooks - 9  # audio codebooks per stream
+    persona = torch.randint(lm.text_card, (TEXT_PROMPT_TOKENS,), generator=rng).tolist()
+    live_tokens = torch.randint(lm.card, (1, num_tokens, LIVE_STEPS), generator=rng)
+    with torch.no_grad():
+        lm_gen = LMGen(lm, device="cpu", use_sampling=False)
+        lm_gen.streaming_forever(BATCH_SIZE)
+
+        # Another session went through slot 2 first, so that its ring and offsets are stale.
+        lm_gen.text_prompt_tokens = torch.randint(lm.text_card, (20,), generator=rng).tolist()
+        prefill(lm_gen, RESTORED)
+
+        lm_gen.text_prompt_tokens = persona
+        prefill(lm_gen, 0)
+        cache = PrefixCache(1 << 30)
+        if not cache.put("persona", lm_gen.get_streaming_state_rows(slot_mask(0))):
+            print("✗ Snapshot not stored in the prefix cache")
+            return 1
+        snapshot = cache.get("persona")
+        if any(value.device.type != "cpu" for value in snapshot.values()):
+            print("✗ Snapshot not kept in host memory")
+            return 1
+        print(f"✓ Snapshot of slot 0 stored in host memory ({cache.nbytes} bytes)")
+
+        mask = slot_mask(RESTORED)
+        lm_gen.reset_streaming(mask)
+        lm_gen.set_streaming_state_rows(snapshot, mask)
+        prefill(lm_gen, REPLAYED)
+        # Slot 1 was prefilled while the other slots were idle, as it happens when serving.
+        diff = compare_states(slot_state(lm_gen, REPLAYED), slot_state(lm_gen, RESTORED))
+        if diff:
+            print(f"✗ After the system prompts: restored slot differs from the replayed one in {diff}")
+            return 1
+        if compare_states(slot_state(lm_gen, 0), slot_state(lm_gen, RESTORED)):
+            print("✗ After the system prompts: restored slot differs from the slot of the snapshot")
+            return 1
+        print(f"✓ Restored slot {RESTORED}: streaming state identical to slot {REPLAYED}, "
+              f"replayed over {lm_gen._streaming_state.offsets[REPLAYED].item()} steps")
+
+        lm_gen.set_exec_mask(torch.ones(BATCH_SIZE, dtype=torch.bool))
+        tokens = []
+        for step in range(LIVE_STEPS):
+            out = lm_gen.step(live_tokens[:, :, step: step + 1].expand(BATCH_SIZE, -1, -1))
+            if out is not None:
+                tokens.append(out)
+        tokens = torch.cat(tokens, dim=-1)
+        if not torch.equal(tokens[RESTORED], tokens[REPLAYED]):
+            print("✗ Live steps: restored slot generated other tokens than the replayed one")
+            return 1
+        diff = compare_states(slot_state(lm_gen, REPLAYED), slot_state(lm_gen, RESTORED))
+        if diff:
+            print(f"✗ Live steps: restored slot differs from the replayed one in {diff}")
+            return 1
+        print(f"✓ Live steps: {tokens.shape[-1]} generated frames and streaming state identical")
+
+    print("\n" + "=" * 60)
+    print("✓ PREFIX CACHE RESTORE TEST PASSED")
+    print("=" * 60)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Check that the shadow Mimi codec (`other_mimi`) has no effect on generation.
+
+Runs the offline pipeline on small randomly initialized models, with a separate
+second codec, with a codec sharing the weights of the main one, and with no
+second codec, and asserts the generated tokens and PCM are identical.
+"""
+import copy
+import sys
+
+try:
+    import numpy as np
+    import torch
+    from moshi.models import loaders, LMModel, LMGen, MimiModel
+    from moshi.modules import SEANetEncoder, SEANetDecoder, transformer
+    from moshi.offline import decode_tokens_to_pcm, warmup
+    from moshi.quantization import SplitResidualVectorQuantizer
+except ImportError:
+    print("ERROR: Missing dependencies. Install: pip install moshi/.")
+    sys.exit(1)
+
+NUM_FRAMES = 16
+
+
+def small_mimi() -> MimiModel:
+    seanet_kwargs = dict(loaders._seanet_kwargs, dimension=32, n_filters=4)
+    quantizer_kwargs = dict(loaders._quantizer_kwargs, dimension=16, input_dimension=32, output_dimension=32)
+    transformer_kwargs = dict(loaders._transformer_kwargs, d_model=32, num_heads=2, num_layers=2,
+                              dim_feedforward=64, input_dimension=32, output_dimensions=[32])
+    encoder = SEANetEncoder(**seanet_kwargs)
+    mimi = MimiModel(
+        encoder,
+        SEANetDecoder(**seanet_kwargs),
+        SplitResidualVectorQuantizer(**quantizer_kwargs),
+        channels=1,
+        sample_rate=loaders.SAMPLE_RATE,
+        frame_rate=loaders.FRAME_RATE,
+        encoder_frame_rate=loaders.SAMPLE_RATE / encoder.hop_length,
+        causal=True,
+        resample_method="conv",
+        encoder_transformer=transformer.ProjectedTransformer(**transformer_kwargs),
+        decoder_transformer=transformer.ProjectedTransformer(**transformer_kwargs),
+    )
+    mimi.eval()
+    mimi.set_num_codebooks(8)
+    return mimi
+
+
+def small_lm() -> LMModel:
+    lm_kwargs = dict(loaders._lm_kwargs, dim=64, text_card=100, num_heads=4, num_layers=2, context=64,
+                     depformer_dim=32, depformer_dim_feedforward=64, depformer_num_heads=2,
+                     depformer_num_layers=2)
+    lm = LMModel(device="cpu", dtype=torch.float32, **lm_kwargs)
+    lm.eval()
+    return lm
+
+
+def generate(mimi: MimiModel, other_mimi, lm: LMModel) -> tuple[torch.Tensor, np.ndarray]:
+    frame_size = int(mimi.sample_rate / mimi.frame_rate)
+    lm_gen = LMGen(lm, device="cpu", audio_silence_frame_cnt=3,
+                   sample_rate=mimi.sample_rate, frame_rate=mimi.frame_rate)
+    rng = torch.Generator().manual_seed(1)
+    lm_gen.voice_prompt_audio = (0.1 * torch.randn(1, 4 * frame_size, generator=rng)).numpy()
+    lm_gen.text_prompt_tokens = [5, 7, 9]
+    mimi.streaming_forever(1)
+    if other_mimi is not None:
+        other_mimi.streaming_forever(1)
+    lm_gen.streaming_forever(1)
+    warmup(mimi, other_mimi, lm_gen, "cpu", frame_size)
+
+    mimi.reset_streaming()
+    if other_mimi is not None:
+        other_mimi.reset_streaming()
+    lm_gen.reset_streaming()
+    torch.manual_seed(1234)
+    lm_gen.step_system_prompts(mimi)
+    mimi.reset_streaming()
+
+    all_tokens, all_pcm = [], []
+    for _ in range(NUM_FRAMES):
+        chunk = 0.1 * torch.randn(1, 1, frame_size, generator=rng)
+        codes = mimi.encode(chunk)
+        if other_mimi is not None:
+            _ = other_mimi.encode(chunk)
+        tokens = lm_gen.step(codes)
+        if tokens is None:
+            continue
+        all_tokens.append(tokens)
+        all_pcm.append(decode_tokens_to_pcm(mimi, other_mimi, lm_gen, tokens))
+    return torch.cat(all_tokens, dim=-1), np.concatenate(all_pcm)
+
+
+def main() -> int:
+    print("=" * 60)
+    print("Shadow Mimi Parity Test")
+    print("=" * 60)
+    torch.manual_seed(0)
+    mimi = small_mimi()
+    lm = small_lm()
+
+    results = {}
+    with torch.no_grad():
+        for mode in ["separate", "shared", "none"]:
+            main_mimi = copy.deepcopy(mimi)
+            if mode == "separate":
+                other_mimi = copy.deepcopy(mimi)
+            elif mode == "shared":
+                other_mimi = loaders.share_mimi(main_mimi)
+                shared = all(a is b for a, b in zip(main_mimi.parameters(), other_mimi.parameters()))
+                if not shared:
+                    print("✗ share_mimi copied the weights")
+                    return 1
+                print("✓ share_mimi reuses the weights of the main codec")
+            else:
+                other_mimi = None
+            results[mode] = generate(main_mimi, other_mimi, copy.deepcopy(lm))
+            print(f"  {mode}: {results[mode][0].shape[-1]} frames generated")
+
+    ref_tokens, ref_pcm = results["separate"]
+    for mode in ["shared", "none"]:
+        tokens, pcm = results[mode]
+        if not torch.equal(tokens, ref_tokens) or not np.array_equal(pcm, ref_pcm):
+            print(f"✗ Output with other_mimi={mode} differs from the separate codec")
+            return 1
+        print(f"✓ other_mimi={mode}: tokens and PCM identical")
+
+    print("\n" + "=" * 60)
+    print("✓ PARITY TEST PASSED")
+    print("=" * 60)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
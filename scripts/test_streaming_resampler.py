@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Check the audio continuity of the bridge streaming resampler.
+
+Feeds a sweep through `StreamingResampler` in 20 ms chunks and in random sized chunks
+(odd byte counts included), in both directions, and compares the output with
+scipy.signal.resample_poly run on the whole signal at once. The chunked output must
+match it to the last bit (up to rounding), with the right number of samples after
+each chunk. The same is reported for the former per-chunk `PythonResampler`.
+"""
+import sys
+from pathlib import Path
+
+try:
+    import numpy as np
+    from scipy import signal
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from exotel_bridge import PythonResampler, StreamingResampler
+except ImportError:
+    print("ERROR: Missing dependencies. Install: pip install -r requirements.txt")
+    sys.exit(1)
+
+DURATION = 2.0
+MAX_ERROR = 1  # int16 LSB, from the rounding
+
+
+def sweep(sample_rate: int) -> np.ndarray:
+    """Half scale sweep up to 0.8 of the lowest Nyquist frequency of the test."""
+    t = np.arange(int(DURATION * sample_rate)) / sample_rate
+    f_end = 0.8 * 4000
+    phase = 2 * np.pi * (100 * t + (f_end - 100) * t ** 2 / (2 * DURATION))
+    return (0.5 * 32767 * np.sin(phase)).astype(np.int16)
+
+
+def reference(pcm: np.ndarray, resampler: StreamingResampler) -> tuple[np.ndarray, int]:
+    """Whole signal resample_poly, and the delay of the causal streaming filter in output samples.
+    The streaming output starts with the leading half of the filter response, which
+    resample_poly drops, so only the output after the delay is compared."""
+    out = signal.resample_poly(pcm.astype(np.float64), resampler.up, resampler.down)
+    return out, 10 * max(resampler.up, resampler.down) // resampler.down
+
+
+def run_chunks(resampler, pcm: np.ndarray, sizes) -> tuple[np.ndarray, bool]:
+    """Returns the output, and whether the output length was right after each chunk."""
+    data = pcm.tobytes()
+    out = []
+    total_in = total_out = 0
+    exact = True
+    for size in sizes:
+        chunk = data[total_in: total_in + size]
+        if not chunk:
+            break
+        total_in += len(chunk)
+        out_bytes = resampler.resample(chunk)
+        total_out += len(out_bytes) // 2
+        out.append(out_bytes)
+        expected = -(-(total_in // 2) * resampler.up // resampler.down)
+        exact &= total_out == expected
+    return np.frombuffer(b"".join(out), dtype=np.int16), exact
+
+
+def check(in_sr: int, out_sr: int) -> bool:
+    pcm = sweep(in_sr)
+    chunk_bytes = int(in_sr * 0.02) * 2
+    rng = np.random.default_rng(0)
+    random_sizes = rng.integers(1, 3 * chunk_bytes, size=len(pcm))
+    ok = True
+    for name, sizes in [("20 ms chunks", [chunk_bytes] * len(pcm)), ("random chunks", random_sizes)]:
+        resampler = StreamingResampler(in_sr, out_sr)
+        out, exact = run_chunks(resampler, pcm, sizes)
+        ref, delay = reference(pcm, resampler)
+        error = np.abs(out[delay:] - ref[:len(out) - delay]).max()
+        if not exact:
+            print(f"✗ {in_sr}->{out_sr} {name}: wrong number of output samples")
+            ok = False
+        elif error > MAX_ERROR:
+            print(f"✗ {in_sr}->{out_sr} {name}: max error {error:.1f} vs whole signal resampling")
+            ok = False
+        else:
+            print(f"✓ {in_sr}->{out_sr} {name}: {len(out)} samples, max error {error:.2f}")
+
+    old, _ = run_chunks(PythonResampler(in_sr, out_sr), pcm, [chunk_bytes] * len(pcm))
+    old_ref = signal.resample_poly(pcm.astype(np.float64), out_sr // np.gcd(in_sr, out_sr),
+                                   in_sr // np.gcd(in_sr, out_sr))[:len(old)]
+    print(f"  former per-chunk resampler: max error {np.abs(old - old_ref).max():.1f} at the chunk boundaries")
+    return ok
+
+
+def main() -> int:
+    print("=" * 60)
+    print("Streaming Resampler Continuity Test")
+    print("=" * 60)
+    ok = check(8000, 24000)
+    ok &= check(24000, 8000)
+    print("\n" + "=" * 60)
+    if not ok:
+        print("✗ CONTINUITY TEST FAILED")
+        print("=" * 60)
+        return 1
+    print("✓ CONTINUITY TEST PASSED")
+    print("=" * 60)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())